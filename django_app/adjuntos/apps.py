@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AdjuntosConfig(AppConfig):
     name = 'adjuntos'
 
+    def ready(self):
+        # Registra las señales que avisan de novedades al consolidador.
+        import adjuntos.novedades  # noqa
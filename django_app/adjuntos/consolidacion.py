@@ -1,10 +1,11 @@
+from collections import Counter, defaultdict
 from django.conf import settings
 import structlog
 from adjuntos.models import Attachment, Identificacion
 from elecciones.models import Carga, MesaCategoria
 from fiscales.models import Fiscal
 from django.db import transaction
-from django.db.models import Count, Q
+from django.db.models import Count, F, Q
 from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
@@ -18,24 +19,39 @@ from sentry_sdk import capture_message
 logger = structlog.get_logger(__name__)
 
 
+STATUS_POR_TIPO_DE_CARGA = {
+    Carga.TIPOS.total: {
+        'consolidada_dc': MesaCategoria.STATUS.total_consolidada_dc,
+        'consolidada_csv': MesaCategoria.STATUS.total_consolidada_csv,
+        'en_conflicto': MesaCategoria.STATUS.total_en_conflicto,
+        'sin_consolidar': MesaCategoria.STATUS.total_sin_consolidar,
+    },
+    Carga.TIPOS.parcial: {
+        'consolidada_dc': MesaCategoria.STATUS.parcial_consolidada_dc,
+        'consolidada_csv': MesaCategoria.STATUS.parcial_consolidada_csv,
+        'en_conflicto': MesaCategoria.STATUS.parcial_en_conflicto,
+        'sin_consolidar': MesaCategoria.STATUS.parcial_sin_consolidar,
+    }
+}
+
+# Sólo se sigue con las cargas totales si no hay parciales o si están consolidadas.
+STATUS_QUE_PERMITEN_ANALIZAR_CARGA_TOTAL = [
+    MesaCategoria.STATUS.sin_cargar,
+    MesaCategoria.STATUS.parcial_consolidada_dc,
+    MesaCategoria.STATUS.parcial_consolidada_csv
+]
+
+STATUS_QUE_REQUIEREN_COMPUTAR_EFECTO_TROLLING = [
+    MesaCategoria.STATUS.parcial_consolidada_dc,
+    MesaCategoria.STATUS.total_consolidada_dc
+]
+
+
 def consolidar_cargas_por_tipo(cargas, tipo):
     """
     El parámetro cargas tiene solamente cargas del tipo parámetro.
     """
-    statuses = {
-        Carga.TIPOS.total: {
-            'consolidada_dc': MesaCategoria.STATUS.total_consolidada_dc,
-            'consolidada_csv': MesaCategoria.STATUS.total_consolidada_csv,
-            'en_conflicto': MesaCategoria.STATUS.total_en_conflicto,
-            'sin_consolidar': MesaCategoria.STATUS.total_sin_consolidar,
-        },
-        Carga.TIPOS.parcial: {
-            'consolidada_dc': MesaCategoria.STATUS.parcial_consolidada_dc,
-            'consolidada_csv': MesaCategoria.STATUS.parcial_consolidada_csv,
-            'en_conflicto': MesaCategoria.STATUS.parcial_en_conflicto,
-            'sin_consolidar': MesaCategoria.STATUS.parcial_sin_consolidar,
-        }
-    }
+    statuses = STATUS_POR_TIPO_DE_CARGA
 
     cargas_agrupadas_por_firma = cargas.values('firma').annotate(count=Count('firma')).order_by('-count')
 
@@ -97,12 +113,6 @@ def consolidar_cargas_sin_antitrolling(mesa_categoria):
     El efecto antitrolling se trabaja por separado para hacerlo
     por fuera de la transacción y evitar deadlocks.
     """
-    statuses_que_permiten_analizar_carga_total = [
-        MesaCategoria.STATUS.sin_cargar,
-        MesaCategoria.STATUS.parcial_consolidada_dc,
-        MesaCategoria.STATUS.parcial_consolidada_csv
-    ]
-
     # Por lo pronto el status es sin_cargar.
     status_resultante = MesaCategoria.STATUS.sin_cargar
     carga_testigo_resultante = None
@@ -128,8 +138,8 @@ def consolidar_cargas_sin_antitrolling(mesa_categoria):
 
     # A continuación voy probando los distintos status.
 
-    # Primero les actualizo la firma.
-    for carga in cargas:
+    # Primero les actualizo la firma, por si alguna no la tiene calculada desde que se grabó.
+    for carga in cargas.exclude(tipo=Carga.TIPOS.problema):
         carga.actualizar_firma()
 
     # Analizo las parciales.
@@ -139,7 +149,7 @@ def consolidar_cargas_sin_antitrolling(mesa_categoria):
             cargas_parciales, Carga.TIPOS.parcial
         )
 
-    if status_resultante in statuses_que_permiten_analizar_carga_total:
+    if status_resultante in STATUS_QUE_PERMITEN_ANALIZAR_CARGA_TOTAL:
         # Analizo las totales solo si no hay ninguna parcial, o si están consolidadas las parciales.
         # En otro caso no tiene sentido porque puedo encontrar cargas totales "residuales", pero
         # todavía no se resolvió la parcial.
@@ -157,17 +167,118 @@ def consolidar_cargas(mesa_categoria):
     """
     Consolida todas las cargas de la MesaCategoria parámetro y computa el efecto antitrolling.
     """
-    statuses_que_requieren_computar_efecto_trolling = [
-        MesaCategoria.STATUS.parcial_consolidada_dc,
-        MesaCategoria.STATUS.total_consolidada_dc
-    ]
     status_resultante = consolidar_cargas_sin_antitrolling(mesa_categoria)
 
     # Esto lo hacemos fuera de la transición para evitar deadlock (ver #337).
-    if status_resultante in statuses_que_requieren_computar_efecto_trolling:
+    if status_resultante in STATUS_QUE_REQUIEREN_COMPUTAR_EFECTO_TROLLING:
         efecto_scoring_troll_confirmacion_carga(mesa_categoria)
 
 
+def consolidar_cargas_por_tipo_en_memoria(cargas, tipo):
+    """
+    Equivalente a consolidar_cargas_por_tipo sobre una lista de cargas ya leídas de la base
+    (ordenadas por id, como las devolvería ``first()``), sin hacer queries.
+    """
+    statuses = STATUS_POR_TIPO_DE_CARGA[tipo]
+
+    # Counter respeta el orden de aparición, así que ante empate gana la firma de la carga más vieja.
+    cantidad_por_firma = Counter(carga.firma for carga in cargas)
+    firma, cantidad = max(cantidad_por_firma.items(), key=lambda firma_cantidad: firma_cantidad[1])
+    cargas_csv = [carga for carga in cargas if carga.origen == Carga.SOURCES.csv]
+
+    if cantidad >= settings.MIN_COINCIDENCIAS_CARGAS:
+        # Encontré doble carga coincidente.
+        return statuses['consolidada_dc'], next(carga for carga in cargas if carga.firma == firma)
+
+    if cargas_csv:
+        # Haya una o más firmas, si alguna viene de CSV es la testigo.
+        return statuses['consolidada_csv'], cargas_csv[0]
+
+    if len(cantidad_por_firma) > 1:
+        # No hay doble coincidencia ni carga de CSV, pero hay más de una firma. Caso de conflicto.
+        return statuses['en_conflicto'], None
+
+    # Hay sólo una firma y no viene de CSV.
+    return statuses['sin_consolidar'], cargas[0]
+
+
+@transaction.atomic
+def consolidar_cargas_en_lote_sin_antitrolling(mesa_categorias):
+    """
+    Equivalente a consolidar_cargas_sin_antitrolling para un lote de MesaCategoria.
+
+    Lee todas las cargas válidas del lote y sus votos reportados en un par de queries, calcula
+    firmas, status y testigos en memoria y los guarda con bulk_update.
+    Devuelve un diccionario id de MesaCategoria -> status resultante.
+    """
+    cargas_por_mesa_categoria = defaultdict(list)
+    for carga in Carga.objects.filter(
+        mesa_categoria__in=mesa_categorias, invalidada=False
+    ).only('id', 'tipo', 'origen', 'firma', 'mesa_categoria_id').order_by('id'):
+        cargas_por_mesa_categoria[carga.mesa_categoria_id].append(carga)
+
+    # Las que tienen problemas se resuelven antes, sin necesidad de firmas.
+    cargas_con_problemas = {}
+    for mesa_categoria_id, cargas in cargas_por_mesa_categoria.items():
+        cargas_que_reportan_problemas = [carga for carga in cargas if carga.tipo == Carga.TIPOS.problema]
+        if len(cargas_que_reportan_problemas) >= settings.MIN_COINCIDENCIAS_CARGAS_PROBLEMA:
+            cargas_con_problemas[mesa_categoria_id] = cargas_que_reportan_problemas[0]
+
+    # Las firmas se calculan al grabar los votos; esto sólo afecta a cargas viejas que no la tengan.
+    Carga.actualizar_firmas_en_lote([
+        carga
+        for mesa_categoria_id, cargas in cargas_por_mesa_categoria.items()
+        if mesa_categoria_id not in cargas_con_problemas
+        for carga in cargas
+        if carga.tipo != Carga.TIPOS.problema
+    ])
+
+    nuevos_status = []
+    for mesa_categoria in mesa_categorias:
+        cargas = cargas_por_mesa_categoria.get(mesa_categoria.id, [])
+        status_resultante = MesaCategoria.STATUS.sin_cargar
+        carga_testigo_resultante = None
+
+        if mesa_categoria.id in cargas_con_problemas:
+            # Confirmo el problema porque varios reportaron problemas.
+            Problema.confirmar_problema(carga=cargas_con_problemas[mesa_categoria.id])
+            status_resultante = MesaCategoria.STATUS.con_problemas
+
+        elif cargas:
+            cargas_parciales = [carga for carga in cargas if carga.tipo == Carga.TIPOS.parcial]
+            if cargas_parciales:
+                status_resultante, carga_testigo_resultante = consolidar_cargas_por_tipo_en_memoria(
+                    cargas_parciales, Carga.TIPOS.parcial
+                )
+
+            cargas_totales = [carga for carga in cargas if carga.tipo == Carga.TIPOS.total]
+            if status_resultante in STATUS_QUE_PERMITEN_ANALIZAR_CARGA_TOTAL and cargas_totales:
+                status_resultante, carga_testigo_resultante = consolidar_cargas_por_tipo_en_memoria(
+                    cargas_totales, Carga.TIPOS.total
+                )
+
+        nuevos_status.append((
+            mesa_categoria, status_resultante, carga_testigo_resultante.id if carga_testigo_resultante else None
+        ))
+
+    MesaCategoria.actualizar_status_en_lote(nuevos_status)
+    return {mesa_categoria.id: status for mesa_categoria, status, _ in nuevos_status}
+
+
+def consolidar_cargas_en_lote(mesa_categorias):
+    """
+    Consolida todas las cargas de las MesaCategoria del lote y computa el efecto antitrolling.
+    Da los mismos resultados que invocar consolidar_cargas para cada una.
+    """
+    mesa_categorias = list(mesa_categorias)
+    status_resultantes = consolidar_cargas_en_lote_sin_antitrolling(mesa_categorias)
+
+    # Esto lo hacemos fuera de la transición para evitar deadlock (ver #337).
+    for mesa_categoria in mesa_categorias:
+        if status_resultantes[mesa_categoria.id] in STATUS_QUE_REQUIEREN_COMPUTAR_EFECTO_TROLLING:
+            efecto_scoring_troll_confirmacion_carga(mesa_categoria)
+
+
 @transaction.atomic
 def consolidar_identificaciones(attachment):
     """
@@ -260,7 +371,22 @@ def consolidar_identificaciones(attachment):
         mesa_anterior.invalidar_asignacion_attachment()
 
 
-def consumir_novedades_identificacion(cant_por_iteracion=None):
+def filtrar_particion(queryset, campo, particion):
+    """
+    Restringe el queryset a las filas de la partición (indice, cantidad_de_particiones)
+    según el resto de dividir `campo` por la cantidad de particiones.
+
+    Así varios consolidadores en paralelo toman conjuntos disjuntos de novedades:
+    todas las cargas de una misma mesa-categoría (o identificaciones de un mismo attachment)
+    caen en la misma partición y nunca compiten entre sí.
+    """
+    if not particion:
+        return queryset
+    indice, cantidad_de_particiones = particion
+    return queryset.annotate(particion=F(campo) % cantidad_de_particiones).filter(particion=indice)
+
+
+def consumir_novedades_identificacion(cant_por_iteracion=None, particion=None):
     ahora = timezone.now()
     desde = ahora - timedelta(minutes=settings.TIMEOUT_CONSOLIDACION)
     with transaction.atomic():
@@ -271,6 +397,7 @@ def consumir_novedades_identificacion(cant_por_iteracion=None):
             Q(tomada_por_consolidador__isnull=True) | Q(tomada_por_consolidador__lt=desde),
             procesada=False
         )
+        a_procesar = filtrar_particion(a_procesar, 'attachment_id', particion)
         if cant_por_iteracion:
             a_procesar = a_procesar[0:cant_por_iteracion]
         # OJO - acá precomputar los ids_a_procesar es importante
@@ -335,7 +462,17 @@ def consumir_novedades_identificacion(cant_por_iteracion=None):
     return procesadas
 
 
-def consumir_novedades_carga(cant_por_iteracion=None):
+def consumir_novedades_carga(cant_por_iteracion=None, en_lote=None, particion=None):
+    """
+    Consolida las mesa-categorías de las cargas con novedades
+    (sólo las de la partición parámetro, si se indica; ver filtrar_particion).
+
+    Si en_lote es verdadero (por defecto según settings.CONSOLIDACION_EN_LOTE) se consolidan todas
+    juntas con consolidar_cargas_en_lote; si eso falla se reintenta una por una para aislar
+    las que tienen errores.
+    """
+    if en_lote is None:
+        en_lote = settings.CONSOLIDACION_EN_LOTE
     ahora = timezone.now()
     desde = ahora - timedelta(minutes=settings.TIMEOUT_CONSOLIDACION)
     with transaction.atomic():
@@ -346,6 +483,7 @@ def consumir_novedades_carga(cant_por_iteracion=None):
             Q(tomada_por_consolidador__isnull=True) | Q(tomada_por_consolidador__lt=desde),
             procesada=False,
         )
+        a_procesar = filtrar_particion(a_procesar, 'mesa_categoria_id', particion)
         if cant_por_iteracion:
             a_procesar = a_procesar[0:cant_por_iteracion]
         ids_a_procesar = list(a_procesar.values_list('id', flat=True).all())
@@ -357,6 +495,28 @@ def consumir_novedades_carga(cant_por_iteracion=None):
     ).distinct()
     con_error = []
 
+    if en_lote:
+        mesa_categorias_con_novedades = list(mesa_categorias_con_novedades)
+        try:
+            status_resultantes = consolidar_cargas_en_lote_sin_antitrolling(mesa_categorias_con_novedades)
+        except Exception as e:
+            # Como el lote es atómico no quedó nada a medias: sigo de a una para aislar los errores.
+            logger.error(
+                'Carga (lote)',
+                mesa_categorias=len(mesa_categorias_con_novedades),
+                error=str(e)
+            )
+        else:
+            # El efecto antitrolling no se reintenta, así que un error acá no invalida la consolidación.
+            for mesa_categoria in mesa_categorias_con_novedades:
+                if status_resultantes[mesa_categoria.id] not in STATUS_QUE_REQUIEREN_COMPUTAR_EFECTO_TROLLING:
+                    continue
+                try:
+                    efecto_scoring_troll_confirmacion_carga(mesa_categoria)
+                except Exception as e:
+                    logger.error('Carga (antitrolling)', mesa_categoria=mesa_categoria.id, error=str(e))
+            mesa_categorias_con_novedades = []
+
     for mesa_categoria_con_novedades in mesa_categorias_con_novedades:
         try:
             consolidar_cargas(mesa_categoria_con_novedades)
@@ -415,17 +575,21 @@ def liberar_mesacategorias_y_attachments():
     Fiscal.liberar_mesacategorias_y_attachments()
 
 
-def consumir_novedades(cant_por_iteracion=None):
+def consumir_novedades(cant_por_iteracion=None, particion=None):
     """
     Recibe un parámetro que indica cuántos elementos procesar en cada iteración.
     Esto permite que muchas novedades de un tipo (eg, identificación)
     no impidan el procesamiento de las de otro tipo (eg, carga).
     None se interpreta como sin límite.
+
+    Si se indica una partición (indice, cantidad_de_particiones) sólo se procesan las novedades
+    que le corresponden; la liberación de asignaciones vencidas la hace únicamente la partición 0.
     """
-    liberar_mesacategorias_y_attachments()
+    if not particion or particion[0] == 0:
+        liberar_mesacategorias_y_attachments()
     return (
-        consumir_novedades_identificacion(cant_por_iteracion),
-        consumir_novedades_carga(cant_por_iteracion)
+        consumir_novedades_identificacion(cant_por_iteracion, particion=particion),
+        consumir_novedades_carga(cant_por_iteracion, particion=particion)
     )
 
 
@@ -433,7 +597,8 @@ def consumir_novedades(cant_por_iteracion=None):
 def actualizar_orden_de_carga(sender, instance=None, created=False, **kwargs):
     if instance.mesa and instance.identificacion_testigo:
         # Un nuevo attachment para una mesa ya identificada
-        # (es decir, con coeficiente de orden de carga ya definido) la vuelve a actualizar.
+        # (es decir, con coeficiente de orden de carga ya definido) la vuelve a actualizar,
+        # conservando su orden de llegada (ver IdentificacionesEnCircuito).
         a_actualizar = MesaCategoria.objects.filter(mesa=instance.mesa)
         for mc in a_actualizar:
             mc.actualizar_coeficiente_para_orden_de_carga()
@@ -1,16 +1,17 @@
 import pandas as pd
+import numpy as np
+from collections import defaultdict
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 import math
-from elecciones.models import Mesa, Carga, VotoMesaReportado, Opcion, CategoriaOpcion
+from adjuntos.novedades import notificar_novedad
+from elecciones.models import Mesa, MesaCategoria, Carga, VotoMesaReportado, Opcion, CategoriaOpcion
 from django.db import transaction
 from django.db.utils import IntegrityError
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from escrutinio_social import settings
 from fiscales.models import Fiscal
 import structlog
-from threading import Thread
-import time
 import logging
 from constance import config
 
@@ -41,6 +42,12 @@ COLUMNAS_DEFAULT = [
     (COL_CANT_SOBRES, False, True),
 ]
 
+# Columnas que identifican una mesa, en el orden de las claves de `CSVImporter.mesas_matches`.
+COLUMNAS_MESA = ['seccion', 'circuito', 'nro de mesa', 'distrito']
+
+# Cantidad de mesas cuyas cargas se graban juntas.
+TAMANIO_LOTE_CSV = 500
+
 
 # Excepciones custom, por si se quieren manejar
 class CSVImportacionError(Exception):
@@ -71,11 +78,28 @@ class CSVImporter:
     """
     Clase encargada de procesar un archivo CSV y validarlo.
     Recibe por parámetro el file o path al file y el usuario que sube el archivo.
+    Si se recibe `df` (un fragmento ya leído y validado, ver `fragmentos`) no se lee el archivo.
     """
-    def __init__(self, archivo, usuario, debug=False):
+    def __init__(self, archivo, usuario, debug=False, df=None):
         self.debug = debug
         self.logger = logger
         self.archivo = archivo
+        self.df = df
+        if df is None:
+            self.leer_archivo(archivo)
+        self.usuario = usuario
+        self.fiscal = None
+        # (sección, circuito, mesa, distrito) -> id de la mesa.
+        self.mesas_matches = {}
+        self.carga_total = None
+        self.carga_parcial = None
+        self.log_debug(f"Importando archivo '{archivo}'.")
+        self.cant_errores = 0
+        self.cant_mesas_importadas = 0
+        self.cant_mesas_parcialmente_importadas = 0
+        self.errores = []
+
+    def leer_archivo(self, archivo):
         converters = {
             'Distrito': self.canonizar,
             'Sección': self.canonizar,
@@ -96,18 +120,6 @@ class CSVImporter:
             index_col=False,  # La primera columna no es el índice.
             sep=separador,
         )
-        self.usuario = usuario
-        self.fiscal = None
-        self.mesas = []
-        self.mesas_matches = {}
-        self.carga_total = None
-        self.carga_parcial = None
-        self.log_debug(f"Importando archivo '{archivo}'.")
-        self.cant_errores = 0
-        self.cant_mesas_importadas = 0
-        self.cant_mesas_parcialmente_importadas = 0
-        self.errores = []
-        self.procesamiento_terminado = False
 
     def leer_fragmento_de_in_memory_uploaded_file(self, archivo):
         for chunk in archivo.chunks():
@@ -157,7 +169,6 @@ class CSVImporter:
     def procesar_post_validar(self):
         if self.cant_errores > 0:
             # Si hay errores en la validación no seguimos.
-            self.procesamiento_terminado = True  # Para que termine el thread de yield.
             return self.resultados()
 
         try:
@@ -165,38 +176,33 @@ class CSVImporter:
             self.cargar_info()
         except Exception as e:
             self.anadir_error(str(e))
-        self.procesamiento_terminado = True
         return self.resultados()
 
-    def yield_errores(self):
+    def fragmentos(self, mesas_por_fragmento):
         """
-        Entrega los errores gradualmente.
+        Reparte las mesas ya validadas (ver `validar` y `validar_mesas`) de a `mesas_por_fragmento`.
+        Devuelve una lista de pares (filas del archivo de esas mesas, sus `mesas_matches`), para
+        importar cada fragmento por separado con `procesar_fragmento` sin volver a leer el archivo.
         """
-        cant_errores_entregados = 0
-        while not self.procesamiento_terminado:
-            # Espero a que se produzca un nuevo error o que se termine.
-            while (
-                not self.procesamiento_terminado and
-                cant_errores_entregados == self.cant_errores
-            ):
-                # Dormimos unos segundos para no hacer busy-waiting y dar tiempo a que
-                # termine o se produzcan errores.
-                time.sleep(5)
-
-            if not self.procesamiento_terminado:
-                yield self.cant_mesas_importadas, self.cant_mesas_parcialmente_importadas, self.errores[cant_errores_entregados]
-                cant_errores_entregados += 1
-        yield self.resultados(cant_errores_entregados)
-
-    def procesar_parcialmente(self):
-        try:
-            self.validar()
-        except Exception as e:
-            self.anadir_error(str(e))
-            return self.resultados()
-        t = Thread(target=self.procesar_post_validar, daemon=False)
-        t.start()
-        return self.yield_errores()
+        filas_por_mesa = self.df.groupby(COLUMNAS_MESA).indices
+        claves = sorted(self.mesas_matches)
+        fragmentos = []
+        for inicio in range(0, len(claves), mesas_por_fragmento):
+            claves_del_fragmento = claves[inicio:inicio + mesas_por_fragmento]
+            filas = np.sort(np.concatenate([filas_por_mesa[clave] for clave in claves_del_fragmento]))
+            fragmentos.append((
+                self.df.iloc[filas].reset_index(drop=True),
+                {clave: self.mesas_matches[clave] for clave in claves_del_fragmento}
+            ))
+        return fragmentos
+
+    def procesar_fragmento(self, mesas_matches):
+        """
+        Importa un fragmento armado por `fragmentos` (recibido como `df` al construir el importador).
+        """
+        self.validar_usuario()
+        self.mesas_matches = mesas_matches
+        self.cargar_info()
 
     def anadir_error(self, error):
         self.cant_errores += 1
@@ -255,16 +261,24 @@ class CSVImporter:
     def validar_mesas(self):
         """
         Valida que el número de mesa debe estar dentro del circuito y seccción indicados.
-        Dichas validaciones se realizar revisando la info en la bd
+        Todas las mesas del archivo se buscan en la bd con una sola query.
         """
         # Obtener todos los combos diferentes de: número de mesa, circuito, sección, distrito para validar
-        grupos_mesas = self.df.groupby(['seccion', 'circuito', 'nro de mesa', 'distrito'])
-        mesa_circuito_seccion_distrito = list(mesa for mesa, grupo in grupos_mesas)
-        for seccion, circuito, nro_de_mesa, distrito in mesa_circuito_seccion_distrito:
-            try:
-                match_mesa = Mesa.obtener_mesa_en_circuito_seccion_distrito(
-                    nro_de_mesa, circuito, seccion, distrito)
-            except Mesa.DoesNotExist:
+        claves = sorted(self.df.groupby(COLUMNAS_MESA).groups)
+        mesas_en_bd = {
+            (seccion, circuito, numero, distrito): id_mesa
+            for id_mesa, seccion, circuito, numero, distrito in Mesa.objects.filter(
+                numero__in={numero for _, _, numero, _ in claves},
+                circuito__numero__in={circuito for _, circuito, _, _ in claves},
+                circuito__seccion__numero__in={seccion for seccion, _, _, _ in claves},
+                circuito__seccion__distrito__numero__in={distrito for _, _, _, distrito in claves},
+            ).values_list(
+                'id', 'circuito__seccion__numero', 'circuito__numero', 'numero', 'circuito__seccion__distrito__numero'
+            )
+        }
+        for clave in claves:
+            if clave not in mesas_en_bd:
+                seccion, circuito, nro_de_mesa, distrito = clave
                 self.anadir_error(
                     f'No existe mesa {nro_de_mesa} en circuito {circuito}, sección {seccion} y '
                     f'distrito {distrito}.'
@@ -272,8 +286,7 @@ class CSVImporter:
                 self.log_debug(f'No existe mesa {nro_de_mesa} en circuito {circuito}, sección {seccion} y '
                                f'distrito {distrito}.')
                 continue
-            self.mesas_matches[nro_de_mesa] = match_mesa
-            self.mesas.append(match_mesa)
+            self.mesas_matches[clave] = mesas_en_bd[clave]
 
     def canonizar(self, valor):
         """
@@ -289,41 +302,48 @@ class CSVImporter:
         return valor
 
     def cargar_mesa(self, mesa, filas_de_la_mesa, columnas_categorias):
+        """
+        Arma en memoria las cargas de todas las categorías activas de la mesa.
+        Devuelve una tupla (mesa_ok, alguna_cat_ok, cargas), o None si la mesa no existe.
+        """
         self.log_debug(f"- Procesando mesa '{mesa}'.")
         try:
             # Obtengo la mesa correspondiente.
-            mesa_bd = self.mesas_matches[mesa[2]]
+            id_mesa = self.mesas_matches[mesa]
         except KeyError:
             self.log_debug(f"-- Mesa {mesa} no tiene match.")
             # Si la mesa no existe no la importamos.
             # No acumulamos el error porque ya se hizo en la validación.
-            return
+            return None
 
         mesa_ok = True
         alguna_cat_ok = False
-        for mesa_categoria in mesa_bd.mesacategoria_set.filter(categoria__activa=True):
-            try:
-                self.cargar_mesa_categoria(mesa, filas_de_la_mesa, mesa_categoria, columnas_categorias)
-                alguna_cat_ok = True
-                self.log_debug(f"-- {mesa_categoria.categoria} importada.")
-            except ErroresAcumulados:
-                # Es sólo para evitar el commit.
+        cargas = []
+        for mesa_categoria in self.mesa_categorias[id_mesa]:
+            cant_errores_al_empezar = self.cant_errores
+            cargas_de_la_categoria = self.cargar_mesa_categoria(
+                mesa, filas_de_la_mesa, mesa_categoria, columnas_categorias
+            )
+            if self.cant_errores > cant_errores_al_empezar:
+                # Las cargas de la categoría no se graban.
                 mesa_ok = False
                 self.log_debug(f"-- {mesa_categoria.categoria} no importada.")
+            else:
+                alguna_cat_ok = True
+                cargas.extend(cargas_de_la_categoria)
+                self.log_debug(f"-- {mesa_categoria.categoria} importada.")
 
-        if mesa_ok:
-            self.cant_mesas_importadas += 1
-        elif alguna_cat_ok:
-            self.cant_mesas_parcialmente_importadas += 1
+        return mesa_ok, alguna_cat_ok, cargas
 
-    @transaction.atomic
     def cargar_mesa_categoria(self, mesa, filas_de_la_mesa, mesa_categoria, columnas_categorias):
-        cant_errores_al_empezar = self.cant_errores
-
+        """
+        Arma en memoria las cargas parcial y total de una mesa y categoría y las valida.
+        Devuelve la lista de cargas (:py:class:`CargaCSV`) a grabar.
+        """
         carga_parcial, carga_total = self.carga_basica_mesa_categoria(mesa,
                 filas_de_la_mesa, mesa_categoria, columnas_categorias)
 
-        if carga_parcial and config.CARGAR_OPCIONES_NO_PRIO_CSV:
+        if carga_parcial and self.cargar_opciones_no_prioritarias:
             carga_total = self.copiar_carga_parcial_en_total(carga_parcial, carga_total)
 
         # A todas las cargas le tengo que agregar el total de electores y de sobres.
@@ -342,39 +362,53 @@ class CSVImporter:
             # prioritarias en la carga parcial.
             self.validar_carga_parcial(mesa, carga_parcial, mesa_categoria.categoria)
 
-        self.borrar_carga_anterior(carga_parcial)
-        self.borrar_carga_anterior(carga_total)
+        return [carga for carga in (carga_parcial, carga_total) if carga]
 
-        if self.cant_errores > cant_errores_al_empezar:
-            # Para que no se haga el commit.
-            raise ErroresAcumulados()
-
-    def borrar_carga_anterior(self, carga):
+    def guardar_lote(self, mesas_procesadas):
         """
-        Si ya existía una carga de CSV para la misma mesa categoría, del mismo usuario,
-        la borramos.
+        Graba las cargas de un lote de mesas (ver :meth:`cargar_mesa`) con unos pocos bulk_create,
+        borra las cargas de CSV que reemplazan y actualiza los contadores de mesas importadas.
         """
-        if not carga:
-            return
+        cargas = [carga for _, _, cargas_de_la_mesa in mesas_procesadas for carga in cargas_de_la_mesa]
+        if cargas:
+            try:
+                with transaction.atomic():
+                    # Las firmas se calculan acá, en la misma transacción en que se graban los votos,
+                    # para que la consolidación no tenga que hacerlo.
+                    Carga.guardar_en_lote([(carga.carga, carga.reportados) for carga in cargas])
+                    self.borrar_cargas_anteriores([carga.carga for carga in cargas])
+                    notificar_novedad()
+            except IntegrityError as e:
+                self.anadir_error(f'Error al guardar los resultados. Detalle: {e}')
+                return
 
-        try:
-            carga_previa = Carga.objects.get(
-                id__lt=carga.id,  # Tiene que tener un id menor.
-                tipo=carga.tipo,
-                origen=Carga.SOURCES.csv,
-                mesa_categoria=carga.mesa_categoria,
-                fiscal=carga.fiscal,
-            )
-        except Carga.DoesNotExist:
-            # No hay carga previa.
-            return
+        for mesa_ok, alguna_cat_ok, _ in mesas_procesadas:
+            if mesa_ok:
+                self.cant_mesas_importadas += 1
+            elif alguna_cat_ok:
+                self.cant_mesas_parcialmente_importadas += 1
 
-        self.log_debug(f"----+ Borrando carga previa ({carga_previa.id}) de tipo {carga_previa.tipo}.")
-        carga_previa.delete()
+    def borrar_cargas_anteriores(self, cargas):
+        """
+        Si ya existían cargas de CSV para las mismas mesa categorías y tipos, del mismo usuario,
+        las borramos.
+        """
+        for tipo in (Carga.TIPOS.parcial, Carga.TIPOS.total):
+            cargas_del_tipo = [carga for carga in cargas if carga.tipo == tipo]
+            if not cargas_del_tipo:
+                continue
+            cargas_previas = Carga.objects.filter(
+                tipo=tipo,
+                origen=Carga.SOURCES.csv,
+                mesa_categoria_id__in=[carga.mesa_categoria_id for carga in cargas_del_tipo],
+                fiscal=self.fiscal,
+            ).exclude(id__in=[carga.id for carga in cargas_del_tipo])
+            self.log_debug(f"----+ Borrando cargas previas de tipo {tipo}.")
+            cargas_previas.delete()
 
     def carga_basica_mesa_categoria(self, mesa, filas_de_la_mesa, mesa_categoria, columnas_categorias):
         """
-        Realiza la carga correspondiente a una mesa y una categoría (sólo leer el archivo y generar
+        Arma la carga correspondiente a una mesa y una categoría (sólo leer el archivo y generar
         los votos, no los análisis de completitud, etc).
         Devuelve la carga parcial y la total generadas.
         """
@@ -393,7 +427,7 @@ class CSVImporter:
         matcheos = [columna for columna in columnas_categorias if columna.lower()
                     in categoria_general.nombre.lower()]
 
-        if len(matcheos) == 0:
+        if len(matcheos) == 0 or matcheos[0] not in self.votos_por_columna:
             self.anadir_error(
                 f'Faltan datos en el archivo de la siguiente '
                 f'categoría: {categoria_general.nombre}.'
@@ -401,24 +435,11 @@ class CSVImporter:
             return None, None
 
         columna_de_la_categoria = matcheos[0]
+        votos, ausentes, invalidos = self.votos_por_columna[columna_de_la_categoria]
 
-        # Se encontró la categoría de la mesa en el archivo.
-        votos_a_cargar = []
-        # Los votos son por partido así que debemos iterar por todas las filas.
-        for indice, fila in filas_de_la_mesa.iterrows():
-            if indice == 0:
-                # Me fijo si existe la columna de la categoría.
-                try:
-                    # Trato de acceder a la columna.
-                    prueba = fila[columna_de_la_categoria]
-                except KeyError:
-                    self.anadir_error(
-                        f'Faltan datos en el archivo de la siguiente '
-                        f'categoría: {categoria_general.nombre}.'
-                    )
-                    return None, None
-
-            codigo_lista_en_csv = fila['nro de lista']
+        # Los votos son por partido así que debemos recorrer todas las filas de la mesa.
+        for fila in filas_de_la_mesa:
+            codigo_lista_en_csv = self.listas[fila]
             self.celda_analizada = CeldaCSVImporter(
                 seccion, circuito, mesa, distrito, codigo_lista_en_csv, columna_de_la_categoria)
 
@@ -426,66 +447,47 @@ class CSVImporter:
             # número de lista que está en cero cuando se trata de metadata.
             if codigo_lista_en_csv == '0':
                 # Nos quedamos con la metadata.
-                self.cantidad_electores_mesa = fila[COL_CANT_ELECTORES]
-                self.cantidad_sobres_mesa = fila[COL_CANT_SOBRES]
-
-            else:
-                self.cargar_mesa_categoria_y_lista(
-                    fila, codigo_lista_en_csv, columna_de_la_categoria, mesa_categoria, categoria_bd, votos_a_cargar)
-
-        VotoMesaReportado.objects.bulk_create(votos_a_cargar)
+                self.cantidad_electores_mesa = self.electores[fila]
+                self.cantidad_sobres_mesa = self.sobres[fila]
 
-        return self.carga_parcial, self.carga_total
-
-    def cargar_mesa_categoria_y_lista(self, fila, codigo_lista_en_csv, columna_de_la_categoria, mesa_categoria, categoria_bd, votos_a_cargar):
-        """
-        Analiza los votos de una mesa dada, una categoría dada y una fila dada.
-        """
-        cantidad_votos = fila[columna_de_la_categoria]
-
-        try:
-            if self.dato_ausente(cantidad_votos):
+            elif ausentes[fila]:
                 # La celda está vacía.
-                return
+                continue
 
-            cantidad_votos = int(cantidad_votos)
-            if cantidad_votos < 0:
+            elif invalidos[fila]:
                 self.anadir_error(
                     f'Los resultados deben ser números enteros positivos. Revise la siguiente celda '
                     f'a {self.celda_analizada}.')
-                return
-        except ValueError:
-            self.anadir_error(
-                f'Los resultados deben ser números enteros positivos. Revise la siguiente celda '
-                f'a {self.celda_analizada}.')
-            return
 
+            else:
+                self.cargar_mesa_categoria_y_lista(codigo_lista_en_csv, int(votos[fila]), mesa_categoria, categoria_bd)
+
+        return self.carga_parcial, self.carga_total
+
+    def cargar_mesa_categoria_y_lista(self, codigo_lista_en_csv, cantidad_votos, mesa_categoria, categoria_bd):
+        """
+        Agrega los votos de una lista a las cargas de la mesa y categoría.
+        """
         # Buscamos este nro de lista dentro de las opciones asociadas a
         # esta categoría.
 
         # Me aseguro de que sea string.
         codigo_lista_en_csv = f'{codigo_lista_en_csv}'
-        match_codigo_lista = [una_opcion for una_opcion in categoria_bd.opciones.all()
-                              if una_opcion.codigo and una_opcion.codigo.strip().lower()
-                              == codigo_lista_en_csv.strip().lower()]
-        opcion_bd = match_codigo_lista[0] if len(match_codigo_lista) > 0 else None
+        opcion = self.opciones_por_codigo[categoria_bd.id].get(codigo_lista_en_csv.strip().lower())
 
-        if not opcion_bd and cantidad_votos > 0:
+        if not opcion and cantidad_votos > 0:
             self.anadir_error(f'El número de lista {codigo_lista_en_csv} no fue '
                               f'encontrado asociado a la categoría '
                               f'{categoria_bd.nombre}, revise que sea '
                               f'el correcto ({self.celda_analizada}).')
             return
-        elif not opcion_bd and cantidad_votos == 0:
+        elif not opcion and cantidad_votos == 0:
             # Me están reportando cero votos para una opción no asociada a la categoría.
             # La ignoro.
             return
 
-        opcion_categoria = opcion_bd.categoriaopcion_set.filter(
-            categoria=categoria_bd
-        ).first()
-        self.cargar_votos(cantidad_votos, opcion_categoria, mesa_categoria,
-                          opcion_bd, votos_a_cargar)
+        id_opcion, prioritaria = opcion
+        self.cargar_votos(cantidad_votos, prioritaria, mesa_categoria, id_opcion)
 
     def copiar_carga_parcial_en_total(self, carga_parcial, carga_total):
         """
@@ -495,12 +497,8 @@ class CSVImporter:
         if not carga_total:
             return
 
-        votos_a_cargar = []
-        for voto_mesa_reportado_parcial in carga_parcial.reportados.all():
-            votos_a_cargar.append(VotoMesaReportado(votos=voto_mesa_reportado_parcial.votos,
-                                             opcion=voto_mesa_reportado_parcial.opcion, carga=carga_total))
-
-        VotoMesaReportado.objects.bulk_create(votos_a_cargar)
+        for voto_mesa_reportado_parcial in carga_parcial.reportados:
+            carga_total.agregar_voto(voto_mesa_reportado_parcial.opcion_id, voto_mesa_reportado_parcial.votos)
         return carga_total
 
     def agregar_electores_y_sobres(self, mesa, carga):
@@ -514,14 +512,12 @@ class CSVImporter:
         if self.dato_ausente(self.cantidad_sobres_mesa):
             return
 
-        opcion_sobres = Opcion.sobres()
+        if self.id_opcion_sobres is None:
+            self.id_opcion_sobres = Opcion.sobres().id
 
         cantidad_votos = int(self.cantidad_sobres_mesa)
-        VotoMesaReportado.objects.create(carga=carga,
-                                         votos=cantidad_votos,
-                                         opcion=opcion_sobres
-                                         )
-        self.log_debug(f"---- Agregando {cantidad_votos} votos a {opcion_sobres} en carga {carga.tipo}.")
+        carga.agregar_voto(self.id_opcion_sobres, cantidad_votos)
+        self.log_debug(f"---- Agregando {cantidad_votos} votos a sobres en carga {carga.tipo}.")
 
     def dato_ausente(self, dato):
         """
@@ -529,72 +525,113 @@ class CSVImporter:
         """
         return not dato or math.isnan(float(dato))
 
+    def parsear_votos(self, columna):
+        """
+        Convierte de una vez toda una columna de votos del archivo.
+        Devuelve tres arrays alineados con las filas: los votos, si la celda está vacía
+        y si tiene algo que no es un entero no negativo.
+        """
+        numeros = pd.to_numeric(self.df[columna], errors='coerce')
+        ausentes = self.df[columna].isna().to_numpy()
+        invalidos = ~ausentes & (numeros.isna() | (numeros < 0) | (numeros % 1 != 0)).to_numpy()
+        votos = numeros.where(~invalidos & ~ausentes, 0).to_numpy().astype(np.int64)
+        return votos, ausentes, invalidos
+
+    def preparar_datos(self, columnas_categorias):
+        """
+        Deja listo todo lo que se necesita para armar las cargas sin más queries por mesa:
+        las columnas del archivo como arrays, las mesa categorías de las mesas del archivo y
+        las opciones de sus categorías.
+        """
+        self.listas = self.df['nro de lista'].to_numpy()
+        self.electores = self.df[COL_CANT_ELECTORES].to_numpy()
+        self.sobres = self.df[COL_CANT_SOBRES].to_numpy()
+        self.votos_por_columna = {
+            columna: self.parsear_votos(columna) for columna in columnas_categorias if columna in self.df.columns
+        }
+        self.cargar_opciones_no_prioritarias = config.CARGAR_OPCIONES_NO_PRIO_CSV
+        self.id_opcion_sobres = None
+
+        self.mesa_categorias = defaultdict(list)
+        for mesa_categoria in MesaCategoria.objects.filter(
+            mesa_id__in=self.mesas_matches.values(), categoria__activa=True
+        ).select_related('categoria__categoria_general'):
+            self.mesa_categorias[mesa_categoria.mesa_id].append(mesa_categoria)
+
+        # Por cada categoría: código de lista normalizado -> (id de opción, si es prioritaria),
+        # y las opciones que tienen que estar en las cargas parciales y totales.
+        self.opciones_por_codigo = defaultdict(dict)
+        self.opciones_requeridas = defaultdict(set)
+        for id_categoria, id_opcion, codigo, prioritaria, tipo in CategoriaOpcion.objects.filter(
+            categoria_id__in={
+                mesa_categoria.categoria_id
+                for mesas_categorias in self.mesa_categorias.values() for mesa_categoria in mesas_categorias
+            }
+        ).values_list('categoria_id', 'opcion_id', 'opcion__codigo', 'prioritaria', 'opcion__tipo'):
+            if codigo:
+                self.opciones_por_codigo[id_categoria].setdefault(codigo.strip().lower(), (id_opcion, prioritaria))
+            if tipo != Opcion.TIPOS.metadata_optativa:
+                self.opciones_requeridas[(id_categoria, False)].add(id_opcion)
+                if prioritaria:
+                    self.opciones_requeridas[(id_categoria, True)].add(id_opcion)
+
     def cargar_info(self):
         """
         Carga la info del archivo CSV en la base de datos.
         Si hay errores, los reporta a través de excepciones cuando impiden continuar.
         Si no impiden continuar los acumula para reportarlos como strings todos juntos.
+
+        Las cargas se arman en memoria y se graban de a lotes de TAMANIO_LOTE_CSV mesas.
         """
         self.celda_analizada = None
         # La carga es por mesa y categoría, entonces nos conviene ir analizando grupos de mesas.
-        grupos_mesas = self.df.groupby(['seccion', 'circuito', 'nro de mesa', 'distrito'])
+        grupos_mesas = self.df.groupby(COLUMNAS_MESA).indices
         columnas_categorias = [i[0] for i in COLUMNAS_DEFAULT if i[1]]
+        self.preparar_datos(columnas_categorias)
 
-        for mesa, filas_de_la_mesa in grupos_mesas:
+        lote = []
+        for mesa in sorted(grupos_mesas):
             try:
-                self.cargar_mesa(mesa, filas_de_la_mesa, columnas_categorias)
-            except IntegrityError as e:
-                if 'votomesareportado_votos_check' in str(e):
-                    self.anadir_error(
-                        f'Los resultados deben ser números positivos. Revise la celda correspondiente '
-                        f'a {self.celda_analizada}.'
-                    )
-                elif 'duplicate key' in str(e):
-                    self.anadir_error(
-                        f'Hay partidos/listas repetidas. Revise la celda correspondiente '
-                        f'a {self.celda_analizada}. Detalle: {e}'
-                    )
-                else:
-                    self.anadir_error(
-                        f'Error al guardar los resultados. Revise la celda correspondiente '
-                        f'a {self.celda_analizada}. Detalle: {e}'
-                    )
+                mesa_procesada = self.cargar_mesa(mesa, grupos_mesas[mesa], columnas_categorias)
             except ValueError as e:
                 self.anadir_error(
                     f'Revise que los datos de resultados sean numéricos. Revise la celda correspondiente '
                     f'a {self.celda_analizada}: {e}')
-            except Exception as e:
-                raise e
+                continue
+
+            if mesa_procesada:
+                lote.append(mesa_procesada)
+            if len(lote) >= TAMANIO_LOTE_CSV:
+                self.guardar_lote(lote)
+                lote = []
+        self.guardar_lote(lote)
 
-    def cargar_votos(self, cantidad_votos, opcion_categoria, mesa_categoria, opcion_bd, votos_a_cargar):
-        if opcion_categoria.prioritaria:
+    def cargar_votos(self, cantidad_votos, prioritaria, mesa_categoria, id_opcion):
+        if prioritaria:
             if not self.carga_parcial:
-                self.carga_parcial = Carga.objects.create(
-                    tipo=Carga.TIPOS.parcial,
-                    origen=Carga.SOURCES.csv,
-                    mesa_categoria=mesa_categoria,
-                    fiscal=self.fiscal
-                )
+                self.carga_parcial = CargaCSV(Carga.TIPOS.parcial, mesa_categoria, self.fiscal)
                 self.log_debug("--- Creando carga parcial.")
             carga = self.carga_parcial
         else:
             # Por una inconsistencia (ver #352) sólo se cargan no
             # prioritarias de acuerdo al flag configurable.
-            if not config.CARGAR_OPCIONES_NO_PRIO_CSV:
+            if not self.cargar_opciones_no_prioritarias:
                 return
 
             if not self.carga_total:
-                self.carga_total = Carga.objects.create(
-                    tipo=Carga.TIPOS.total,
-                    origen=Carga.SOURCES.csv,
-                    mesa_categoria=mesa_categoria,
-                    fiscal=self.fiscal
-                )
+                self.carga_total = CargaCSV(Carga.TIPOS.total, mesa_categoria, self.fiscal)
                 self.log_debug("--- Creando carga total.")
             carga = self.carga_total
 
-        self.log_debug(f"---- Agregando {cantidad_votos} votos a {opcion_bd} en carga {carga.tipo}.")
-        votos_a_cargar.append(VotoMesaReportado(carga=carga, votos=cantidad_votos, opcion=opcion_bd))
+        if id_opcion in carga.opciones:
+            self.anadir_error(
+                f'Hay partidos/listas repetidas. Revise la celda correspondiente '
+                f'a {self.celda_analizada}.'
+            )
+            return
+
+        self.log_debug(f"---- Agregando {cantidad_votos} votos a la opción {id_opcion} en carga {carga.tipo}.")
+        carga.agregar_voto(id_opcion, cantidad_votos)
 
     def validar_usuario(self):
         try:
@@ -616,11 +653,7 @@ class CSVImporter:
         (correspondiente a los partidos prioritarios).
         :param categoria: Objeto de tipo Categoria que queremos verificar que esté completo.
         """
-        opciones_de_la_categoria = categoria.opciones_actuales(
-            solo_prioritarias=es_parcial, excluir_optativas=True
-        ).values_list('id', flat=True)
-        opciones_votadas = carga.listado_de_opciones()
-        opciones_faltantes = set(opciones_de_la_categoria) - set(opciones_votadas)
+        opciones_faltantes = self.opciones_requeridas[(categoria.id, es_parcial)] - carga.opciones
 
         if len(opciones_faltantes) > 0:
             nombres_opciones_faltantes = list(Opcion.objects.filter(
@@ -638,6 +671,30 @@ class CSVImporter:
         self.validar_carga(mesa, carga_total, categoria, False)
 
 
+class CargaCSV:
+    """
+    Carga todavía no grabada junto con sus votos, para grabar todo un lote de mesas
+    con :py:meth:`Carga.guardar_en_lote`.
+    """
+    def __init__(self, tipo, mesa_categoria, fiscal):
+        self.carga = Carga(
+            tipo=tipo,
+            origen=Carga.SOURCES.csv,
+            mesa_categoria=mesa_categoria,
+            fiscal=fiscal
+        )
+        self.reportados = []
+        self.opciones = set()
+
+    @property
+    def tipo(self):
+        return self.carga.tipo
+
+    def agregar_voto(self, id_opcion, votos):
+        self.reportados.append(VotoMesaReportado(opcion_id=id_opcion, votos=votos))
+        self.opciones.add(id_opcion)
+
+
 class CeldaCSVImporter:
     def __init__(self, seccion, circuito, mesa, distrito, codigo_lista, columna):
         self.mesa = mesa
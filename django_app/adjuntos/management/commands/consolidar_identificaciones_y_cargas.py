@@ -1,24 +1,124 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import connections
 
+import multiprocessing
+import queue
 import time
 import structlog
 
 from adjuntos.consolidacion import consumir_novedades
+from adjuntos.novedades import esperar_novedad
 from scheduling.scheduler import scheduler
 
 
 logger = structlog.get_logger('consolidador')
 
 
-def consolidador(cant_por_iteracion=500, ejecutado_desde=''):
+def consolidador(cant_por_iteracion=500, ejecutado_desde='', particion=None):
     msg = f'Consolidación desde {ejecutado_desde}' if ejecutado_desde != '' else 'Consolidación'
-    n_identificaciones, n_cargas = consumir_novedades(cant_por_iteracion)
+    n_identificaciones, n_cargas = consumir_novedades(cant_por_iteracion, particion=particion)
     logger.debug(
         msg,
         identificaciones=n_identificaciones,
-        cargas=n_cargas
+        cargas=n_cargas,
+        particion=particion
     )
+    return n_identificaciones, n_cargas
+
+
+def trabajador(indice, cantidad_de_trabajadores, cant_por_iteracion, estadisticas):
+    """
+    Loop de un proceso consolidador que sólo toma las novedades de su partición.
+    Si en una vuelta no encontró nada para hacer espera una novedad (a lo sumo PAUSA_CONSOLIDACION);
+    si no, sigue de inmediato.
+    """
+    particion = (indice, cantidad_de_trabajadores)
+    try:
+        while True:
+            n_identificaciones, n_cargas = consolidador(
+                cant_por_iteracion, ejecutado_desde=f'trabajador {indice}', particion=particion
+            )
+            estadisticas.put((indice, n_identificaciones, n_cargas))
+            if not n_identificaciones and not n_cargas:
+                esperar_novedad(settings.PAUSA_CONSOLIDACION)
+    except KeyboardInterrupt:
+        pass
+
+
+class Supervisor:
+    """
+    Lanza `cantidad_de_trabajadores` procesos consolidadores, cada uno con su partición
+    de las novedades, los relanza si terminan por un error y reporta periódicamente cuántas
+    identificaciones y cargas procesó cada uno.
+    """
+
+    def __init__(self, cantidad_de_trabajadores, cant_por_iteracion, intervalo_de_reporte=60):
+        self.cantidad_de_trabajadores = cantidad_de_trabajadores
+        self.cant_por_iteracion = cant_por_iteracion
+        self.intervalo_de_reporte = intervalo_de_reporte
+        self.contexto = multiprocessing.get_context('fork')
+        self.estadisticas = self.contexto.Queue()
+        self.procesos = {}
+        self.procesadas = {}
+
+    def lanzar(self, indice):
+        # Los hijos no pueden compartir las conexiones a la base del padre.
+        connections.close_all()
+        proceso = self.contexto.Process(
+            target=trabajador,
+            args=(indice, self.cantidad_de_trabajadores, self.cant_por_iteracion, self.estadisticas),
+            name=f'consolidador-{indice}',
+            daemon=True,
+        )
+        proceso.start()
+        self.procesos[indice] = proceso
+        logger.info('Consolidador lanzado', trabajador=indice, pid=proceso.pid)
+
+    def relanzar_caidos(self):
+        for indice, proceso in self.procesos.items():
+            if not proceso.is_alive():
+                logger.error('Consolidador caído', trabajador=indice, pid=proceso.pid, exitcode=proceso.exitcode)
+                self.lanzar(indice)
+
+    def recolectar_estadisticas(self, timeout):
+        try:
+            indice, n_identificaciones, n_cargas = self.estadisticas.get(timeout=timeout)
+        except queue.Empty:
+            return
+        identificaciones, cargas = self.procesadas[indice]
+        self.procesadas[indice] = (identificaciones + n_identificaciones, cargas + n_cargas)
+
+    def reportar(self, segundos):
+        for indice, (identificaciones, cargas) in sorted(self.procesadas.items()):
+            logger.info(
+                'Throughput consolidador',
+                trabajador=indice,
+                identificaciones=identificaciones,
+                cargas=cargas,
+                por_segundo=round((identificaciones + cargas) / segundos, 2)
+            )
+        self.procesadas = {indice: (0, 0) for indice in self.procesos}
+
+    def ejecutar(self):
+        for indice in range(self.cantidad_de_trabajadores):
+            self.lanzar(indice)
+        self.procesadas = {indice: (0, 0) for indice in self.procesos}
+
+        ultimo_reporte = time.monotonic()
+        try:
+            while True:
+                self.recolectar_estadisticas(timeout=1)
+                self.relanzar_caidos()
+                transcurrido = time.monotonic() - ultimo_reporte
+                if transcurrido >= self.intervalo_de_reporte:
+                    self.reportar(transcurrido)
+                    ultimo_reporte = time.monotonic()
+        except KeyboardInterrupt:
+            for proceso in self.procesos.values():
+                proceso.terminate()
+            for proceso in self.procesos.values():
+                proceso.join()
 
 
 class Command(BaseCommand):
@@ -29,13 +129,27 @@ class Command(BaseCommand):
             type=int, default=500,
             help="Cantidad de elementos a procesar por corrida (None es sin límite, default %(default)s)."
         )
+        parser.add_argument("--workers",
+            type=int, default=1,
+            help="Cantidad de procesos consolidadores en paralelo (default %(default)s)."
+        )
+        parser.add_argument("--intervalo_reporte",
+            type=int, default=60,
+            help="Cada cuántos segundos se reporta el throughput de cada proceso (default %(default)s)."
+        )
 
     def handle(self, *args, **options):
         cant_por_iteracion = options['cant']
+        if options['workers'] > 1:
+            Supervisor(options['workers'], cant_por_iteracion, options['intervalo_reporte']).ejecutar()
+            return
+
         finalizar = False
         while not finalizar:
             try:
-                consolidador(cant_por_iteracion)
-                time.sleep(settings.PAUSA_CONSOLIDACION)
+                n_identificaciones, n_cargas = consolidador(cant_por_iteracion)
+                if not n_identificaciones and not n_cargas:
+                    # No hay trabajo pendiente: espero a que llegue una novedad.
+                    esperar_novedad(settings.PAUSA_CONSOLIDACION)
             except KeyboardInterrupt:
                 finalizar = True
@@ -0,0 +1,22 @@
+from adjuntos.miniaturas import generar_miniaturas
+from adjuntos.models import Attachment
+from elecciones.management.commands.basic_command import BaseCommand
+from elecciones.models import CategoriaGeneral
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las miniaturas de las fotos que todavía no las tengan "
+        "(por ejemplo, las subidas antes de que se generaran en segundo plano)."
+    )
+
+    def add_arguments(self, parser):
+        pass
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+        fotos = [(Attachment, 'foto'), (Attachment, 'foto_edited'), (CategoriaGeneral, 'foto_ejemplo')]
+        for modelo, campo in fotos:
+            con_foto = modelo.objects.exclude(**{campo: ''}).exclude(**{campo: None})
+            generadas = generar_miniaturas(con_foto, campo)
+            self.success(f'{generadas} miniaturas de {modelo.__name__}.{campo} generadas.', level=1)
@@ -5,6 +5,7 @@ from constance import config
 from django.conf import settings
 from django.db import IntegrityError
 
+from adjuntos.miniaturas import encolar_miniaturas
 from adjuntos.models import Email, Attachment
 from django.core.files.base import ContentFile
 from elecciones.management.commands.basic_command import BaseCommand
@@ -71,8 +72,9 @@ class Command(BaseCommand):
 
             try:
                 content = ContentFile(attachment[1])
-                instance.foto.save(attachment[0], content, save=False)
+                instance.guardar_foto(attachment[0], content)
                 instance.save()
+                encolar_miniaturas(instance)
                 self.success(f'{instance} -- importado')
             except IntegrityError:
                 self.warning(f'{attachment[0]} ya está en el sistema')
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adjuntos', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='csvtareadeimportacion',
+            name='mesas_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='csvtareadeimportacion',
+            name='mesas_procesadas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,90 @@
+"""
+Generación de las miniaturas de las fotos.
+
+Las pantallas de identificación y de carga muestran las fotos achicadas. Generar la miniatura
+recién cuando alguien abre el acta implica bajar la foto del storage, achicarla y volver a
+subirla dentro de ese request, así que el primero en recibir cada acta esperaba ese tiempo.
+
+Por eso las miniaturas de VERSATILEIMAGEFIELD_RENDITION_KEY_SETS['fotos'] se generan apenas
+se sube la foto, en un pool de threads del proceso, y versatileimagefield no las genera
+en el momento (``create_images_on_demand`` está desactivado en settings). Mientras no estén
+generadas, las pantallas muestran la foto original (ver url_miniatura).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import structlog
+from django.conf import settings
+from django.db import connection, transaction
+from versatileimagefield.image_warmer import VersatileImageFieldWarmer
+from versatileimagefield.settings import cache, VERSATILEIMAGEFIELD_CACHE_LENGTH
+
+logger = structlog.get_logger(__name__)
+
+MINIATURAS = 'fotos'
+
+_ejecutor = None
+_lock = threading.Lock()
+
+
+def ejecutor():
+    global _ejecutor
+    with _lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(max_workers=settings.MINIATURAS_THREADS, thread_name_prefix='miniaturas')
+    return _ejecutor
+
+
+def generar_miniaturas(instancia_o_queryset, campo='foto'):
+    """
+    Genera, en el momento, las miniaturas de la imagen `campo` de una instancia o de todas
+    las de un queryset. Devuelve la cantidad generada.
+    """
+    generadas, fallidas = VersatileImageFieldWarmer(
+        instance_or_queryset=instancia_o_queryset, rendition_key_set=MINIATURAS, image_attr=campo
+    ).warm()
+    if fallidas:
+        logger.error('miniaturas no generadas', campo=campo, fallidas=fallidas)
+    return generadas
+
+
+def generar_en_segundo_plano(instancia, campo):
+    try:
+        generar_miniaturas(instancia, campo)
+        logger.info('miniaturas generadas', modelo=instancia._meta.label, id=instancia.id, campo=campo)
+    except Exception:
+        logger.exception('error generando miniaturas', modelo=instancia._meta.label, id=instancia.id, campo=campo)
+    finally:
+        # La conexión es propia del thread (por ejemplo, la del cache de versatileimagefield).
+        connection.close()
+
+
+def encolar_miniaturas(instancia, campo='foto'):
+    """
+    Encola la generación de las miniaturas de la imagen `campo` de `instancia` para cuando se
+    confirme la transacción en curso: si no se llega a grabar no hay nada que generar.
+    """
+    if not getattr(instancia, campo):
+        return
+    transaction.on_commit(lambda: ejecutor().submit(generar_en_segundo_plano, instancia, campo))
+
+
+def url_miniatura(imagen, tamanio):
+    """
+    URL de la miniatura `tamanio` (por ejemplo '960x') de `imagen`, o la de la imagen original
+    si la miniatura todavía no está en el storage (el pool de threads no llegó a generarla,
+    falló o se reinició el proceso antes).
+
+    Como versatileimagefield al generarlas en el momento, recuerda en su cache las que ya existen
+    para no consultar el storage en cada request.
+    """
+    if not imagen:
+        return ''
+    miniatura = imagen.thumbnail[tamanio]
+    url = miniatura.url
+    if cache.get(url):
+        return url
+    if imagen.storage.exists(miniatura.name):
+        cache.set(url, 1, VERSATILEIMAGEFIELD_CACHE_LENGTH)
+        return url
+    return imagen.url
@@ -5,9 +5,10 @@ from urllib.parse import quote_plus
 from django.conf import settings
 from constance import config
 from django.db.models import Count, Value, F
-from django.db.models.functions import Coalesce
+from django.db.models.functions import Coalesce, Concat
 from django.db.models import Q
-from django.db import models
+from django.db import IntegrityError, models
+from django.utils import timezone
 from model_utils import Choices
 from model_utils.fields import StatusField
 from model_utils.models import TimeStampedModel
@@ -31,10 +32,18 @@ def hash_file(file, block_size=65536):
         >>> hash_file(open('messi.jpg', 'rb'))
         '90554e1d519e0fc665fab042d7499a1bc9c191f2a13b0b2c369753dcb23b181866cb116007fc37a445421270e04912a46dbfb6a325cf27a2603eed45fc1d41b1'
 
+    """
+    return hash_chunks(iter(partial(file.read, block_size), b''))
+
+
+def hash_chunks(chunks):
+    """
+    Como :func:`hash_file`, pero recorriendo los chunks de un archivo subido
+    (``UploadedFile.chunks()``), que pueden estar en memoria o en un archivo temporal.
     """
     hasher = hashlib.blake2b()
-    for buf in iter(partial(file.read, block_size), b''):
-        hasher.update(buf)
+    for chunk in chunks:
+        hasher.update(chunk)
     return hasher.hexdigest()
 
 
@@ -240,6 +249,18 @@ class Attachment(TimeStampedModel):
             seccion=self.subido_por.seccion
         )
 
+    def guardar_foto(self, nombre, archivo):
+        """
+        Equivalente a ``self.foto.save(nombre, archivo, save=False)``, pero calcula el hash
+        recorriendo una vez los chunks del archivo subido y, si la foto ya es conocida, levanta
+        IntegrityError antes de escribirla en el storage (en lugar de escribirla, volver a
+        leerla del storage para calcular el hash y recién ahí fallar en el `save`).
+        """
+        self.foto_digest = hash_chunks(archivo.chunks())
+        if Attachment.objects.filter(foto_digest=self.foto_digest).exists():
+            raise IntegrityError(f'La foto {nombre} ya existe (digest {self.foto_digest}).')
+        self.foto.save(nombre, archivo, save=False)
+
     def save(self, *args, **kwargs):
         """
         Actualiza el hash de la imágen original asociada antes de guardar.
@@ -404,6 +425,10 @@ class CSVTareaDeImportacion(TimeStampedModel):
     mesas_total_ok = models.PositiveIntegerField(default=0)
     mesas_parc_ok = models.PositiveIntegerField(default=0)
 
+    # Avance del procesamiento: mesas del archivo y cuántas ya se procesaron.
+    mesas_total = models.PositiveIntegerField(default=0)
+    mesas_procesadas = models.PositiveIntegerField(default=0)
+
     class Meta:
         verbose_name = 'Tarea de importación de CSV'
         verbose_name_plural = 'Tareas de importación de CSVs'
@@ -418,6 +443,34 @@ class CSVTareaDeImportacion(TimeStampedModel):
         self.status = CSVTareaDeImportacion.STATUS.procesado
         self.save(update_fields=['mesas_total_ok', 'mesas_parc_ok', 'status'])
 
+    def iniciar_procesamiento(self, cant_mesas):
+        self.mesas_total = cant_mesas
+        self.mesas_procesadas = 0
+        self.save(update_fields=['mesas_total', 'mesas_procesadas'])
+
+    def sumar_progreso(self, cant_mesas_procesadas, cant_mesas_ok, cant_mesas_parcialmente_ok, errores=None):
+        """
+        Suma el avance de un fragmento del archivo. Los fragmentos se procesan en paralelo
+        en distintos procesos, así que se actualiza con F() en lugar de pisar los valores.
+        """
+        campos = dict(
+            mesas_procesadas=F('mesas_procesadas') + cant_mesas_procesadas,
+            mesas_total_ok=F('mesas_total_ok') + cant_mesas_ok,
+            mesas_parc_ok=F('mesas_parc_ok') + cant_mesas_parcialmente_ok,
+            modified=timezone.now(),
+        )
+        if errores:
+            campos['errores'] = Concat(Coalesce('errores', Value('')), Value(errores))
+        CSVTareaDeImportacion.objects.filter(id=self.id).update(**campos)
+
+    @property
+    def porcentaje_procesado(self):
+        if self.status == CSVTareaDeImportacion.STATUS.procesado:
+            return 100
+        if not self.mesas_total:
+            return 0
+        return min(100, round(100 * self.mesas_procesadas / self.mesas_total))
+
     def save_errores(self, cant_mesas_ok=None, cant_mesas_parcialmente_ok=None):
         update_fields = ['errores']
 
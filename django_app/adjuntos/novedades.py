@@ -0,0 +1,150 @@
+"""
+Aviso de novedades para el consolidador.
+
+Cada vez que se crea o se invalida una Carga o una Identificacion se notifica por un canal,
+y el consolidador (y el scheduler) en lugar de dormir un intervalo fijo entre rondas
+esperan una notificación con ese intervalo como timeout.
+
+El canal se elige con settings.CANAL_NOVEDADES:
+    - 'postgres': LISTEN/NOTIFY de PostgreSQL; sirve entre procesos.
+    - 'local': un evento en memoria; sólo sirve dentro de un mismo proceso (tests).
+    - None: no hay avisos, se espera siempre el intervalo completo.
+"""
+import select
+import threading
+import time
+
+import structlog
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from adjuntos.models import Identificacion
+from elecciones.models import Carga
+
+logger = structlog.get_logger(__name__)
+
+CANAL_POSTGRES = 'novedades_consolidacion'
+
+
+class CanalLocal:
+    """
+    Canal en memoria del proceso, para tests o para correr todo en un mismo proceso.
+    """
+
+    def __init__(self):
+        self.evento = threading.Event()
+
+    def notificar(self):
+        self.evento.set()
+
+    def esperar(self, timeout):
+        hubo_novedad = self.evento.wait(timeout)
+        self.evento.clear()
+        return hubo_novedad
+
+
+class CanalPostgres:
+    """
+    Canal sobre LISTEN/NOTIFY de PostgreSQL.
+    """
+
+    def __init__(self):
+        self.conexion_escuchando = None
+
+    def notificar(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CANAL_POSTGRES, ''])
+
+    def escuchar(self):
+        """
+        Se suscribe al canal con la conexión de Django del proceso.
+        Si la conexión se renovó desde la última vez hay que volver a suscribirse.
+        """
+        connection.ensure_connection()
+        if self.conexion_escuchando is not connection.connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CANAL_POSTGRES}')
+            self.conexion_escuchando = connection.connection
+        return self.conexion_escuchando
+
+    def esperar(self, timeout):
+        conexion = self.escuchar()
+        # Las notificaciones que llegaron mientras se usaba la conexión para otra cosa
+        # ya están encoladas, así que no se pierden.
+        conexion.poll()
+        if not conexion.notifies:
+            legibles, _, _ = select.select([conexion], [], [], timeout)
+            if legibles:
+                conexion.poll()
+        hubo_novedad = bool(conexion.notifies)
+        conexion.notifies.clear()
+        return hubo_novedad
+
+
+CANALES = {
+    'postgres': CanalPostgres,
+    'local': CanalLocal,
+}
+
+_canal = None
+
+
+def canal_de_novedades():
+    global _canal
+    if not settings.CANAL_NOVEDADES:
+        return None
+    if not isinstance(_canal, CANALES[settings.CANAL_NOVEDADES]):
+        _canal = CANALES[settings.CANAL_NOVEDADES]()
+    return _canal
+
+
+def notificar_novedad():
+    """
+    Avisa que hay novedad cuando se confirme la transacción en curso (o en el momento, si no hay
+    una): antes el consolidador no vería la carga, y si el aviso fallara dentro de la transacción
+    la dejaría abortada.
+    """
+    if canal_de_novedades() is None:
+        return
+    transaction.on_commit(enviar_novedad)
+
+
+def enviar_novedad():
+    canal = canal_de_novedades()
+    if canal is None:
+        return
+    try:
+        canal.notificar()
+    except Exception as e:
+        # Que no haya aviso no es grave: el consolidador igual pasa cada PAUSA_CONSOLIDACION.
+        logger.error('Notificación de novedad', error=str(e))
+
+
+def esperar_novedad(timeout):
+    """
+    Bloquea hasta que haya una novedad o pasen `timeout` segundos.
+    Devuelve True si hubo novedad.
+    """
+    canal = canal_de_novedades()
+    if canal is None:
+        time.sleep(timeout)
+        return False
+    try:
+        return canal.esperar(timeout)
+    except Exception as e:
+        logger.error('Espera de novedad', error=str(e))
+        time.sleep(timeout)
+        return False
+
+
+@receiver(post_save, sender=Carga)
+@receiver(post_save, sender=Identificacion)
+def avisar_novedad(sender, instance=None, created=False, update_fields=None, **kwargs):
+    """
+    Hay novedad cuando se crea una carga o identificación pendiente de procesar,
+    o cuando se la vuelve a marcar como no procesada (por ejemplo al invalidarla).
+    """
+    if not instance.procesada and (created or 'procesada' in (update_fields or ())):
+        notificar_novedad()
@@ -0,0 +1,11 @@
+from django import template
+
+from adjuntos.miniaturas import url_miniatura
+
+
+register = template.Library()
+
+
+@register.filter
+def miniatura(imagen, tamanio):
+    return url_miniatura(imagen, tamanio)
@@ -1,5 +1,7 @@
 import os
+from unittest import mock
 
+import pandas as pd
 import pytest
 from django.conf import settings
 from elecciones.tests.conftest import fiscal_client, setup_groups # noqa
@@ -9,7 +11,7 @@ from django.contrib.auth.models import Group
 from django.core.files.uploadedfile import SimpleUploadedFile
 from adjuntos.csv_import import (ColumnasInvalidasError, CSVImporter, DatosInvalidosError,
                                  PermisosInvalidosError)
-from elecciones.models import Carga, VotoMesaReportado, CategoriaOpcion, Opcion
+from elecciones.models import Carga, VotoMesaReportado, CategoriaOpcion, Opcion, ResultadoAgregado
 from elecciones.tests.factories import (
     DistritoFactory,
     SeccionFactory,
@@ -22,6 +24,7 @@ from elecciones.tests.factories import (
     MesaCategoriaFactory,
     FiscalFactory,
     UserFactory)
+from adjuntos.consolidacion import consumir_novedades_carga
 from adjuntos.models import CSVTareaDeImportacion
 from elecciones.management.commands.importar_csv import Command as ImportarCSV
 from constance.test import override_config
@@ -212,6 +215,21 @@ def test_procesar_csv_informacion_valida_genera_resultados(db, usr_unidad_basica
     assert votos_carga_parcial.count() == (len(CATEGORIAS) - 1) * 6
 
 
+@override_config(CARGAR_OPCIONES_NO_PRIO_CSV=True)
+def test_procesar_csv_graba_de_a_lotes(db, usr_unidad_basica, carga_inicial, monkeypatch):
+    monkeypatch.setattr('adjuntos.csv_import.TAMANIO_LOTE_CSV', 1)
+    cant_mesas_ok, cant_mesas_parcialmente_ok, errores = CSVImporter(
+        PATH_ARCHIVOS_TEST + 'info_resultados_ok.csv', usr_unidad_basica).procesar()
+    assert cant_mesas_ok == 1
+    assert errores is None
+
+    # Las cargas se graban con bulk_create pero igual quedan firmadas para la consolidación.
+    cargas = Carga.objects.all()
+    assert cargas.count() == len(CATEGORIAS) + 1
+    for carga in cargas:
+        assert carga.firma == Carga.calcular_firma(carga.opcion_votos())
+
+
 @override_config(CARGAR_OPCIONES_NO_PRIO_CSV=False)
 def test_procesar_csv_informacion_valida_genera_resultados_salvo_totales(db, usr_unidad_basica, carga_inicial):
     cant_mesas_ok, cant_mesas_parcialmente_ok, errores = CSVImporter(
@@ -343,6 +361,36 @@ def test_procesar_csv_carga_reemplaza_anterior(db, usr_unidad_basica, carga_inic
     assert cargas_repetidas.count() == 0
 
 
+@override_config(CARGAR_OPCIONES_NO_PRIO_CSV=True)
+def test_procesar_csv_carga_reemplaza_anterior_sin_duplicar_resultados(db, usr_unidad_basica, carga_inicial):
+    def resultados_agregados():
+        return {
+            (
+                resultado.categoria_id, resultado.tipo_de_agregacion, resultado.opciones_a_considerar,
+                resultado.nivel_de_agregacion, resultado.id_unidad
+            ): (
+                resultado.mesas_escrutadas,
+                resultado.electores_en_mesas_escrutadas,
+                {opcion_id: votos for opcion_id, votos in resultado.votos.values_list('opcion_id', 'votos') if votos},
+            )
+            for resultado in ResultadoAgregado.objects.all()
+            if resultado.mesas_escrutadas
+        }
+
+    CSVImporter(PATH_ARCHIVOS_TEST + 'info_resultados_ok.csv', usr_unidad_basica).procesar()
+    consumir_novedades_carga()
+    primera_importacion = resultados_agregados()
+    assert primera_importacion
+
+    # Reimportar borra las cargas testigo anteriores: sus votos no deben quedar en los agregados.
+    CSVImporter(PATH_ARCHIVOS_TEST + 'info_resultados_ok.csv', usr_unidad_basica).procesar()
+    consumir_novedades_carga()
+    assert resultados_agregados() == primera_importacion
+
+    ResultadoAgregado.regenerar()
+    assert resultados_agregados() == primera_importacion
+
+
 @override_config(CARGAR_OPCIONES_NO_PRIO_CSV=True)
 def test_procesar_csv_acepta_metadata_opcional(db, usr_unidad_basica, carga_inicial):
     cant_mesas_ok, cant_mesas_parcialmente_ok, errores = CSVImporter(
@@ -475,3 +523,27 @@ def test_web_upload_con_errores(fiscal_client, carga_inicial):
     cargas_totales = Carga.objects.filter(tipo=Carga.TIPOS.total)
 
     assert cargas_totales.count() == 1
+
+
+@override_config(CARGAR_OPCIONES_NO_PRIO_CSV=True)
+def test_importar_tarea_por_fragmentos_suma_avance(db, usr_unidad_basica, carga_inicial):
+    tarea = CSVTareaDeImportacion.objects.create(
+        csv_file=PATH_ARCHIVOS_TEST + 'info_resultados_ok.csv',
+        fiscal=usr_unidad_basica.fiscal,
+        status=CSVTareaDeImportacion.STATUS.en_progreso,
+    )
+    assert tarea.porcentaje_procesado == 0
+
+    importar_csv = ImportarCSV()
+    importar_csv.mesas_por_fragmento = 1
+    with mock.patch('adjuntos.csv_import.pd.read_csv', wraps=pd.read_csv) as read_csv:
+        importar_csv.worker_import_file(tarea)
+    # Los fragmentos reciben sus filas, el archivo se lee una sola vez.
+    assert read_csv.call_count == 1
+
+    tarea.refresh_from_db()
+    assert tarea.status == CSVTareaDeImportacion.STATUS.procesado
+    assert tarea.mesas_total == tarea.mesas_procesadas == 1
+    assert tarea.porcentaje_procesado == 100
+    assert tarea.mesas_total_ok == 1
+    assert tarea.errores is None
@@ -1,5 +1,6 @@
 import pytest
 from unittest import mock
+from django.core.files.base import ContentFile
 from django.db import IntegrityError
 from datetime import timedelta
 from django.utils import timezone
@@ -25,6 +26,18 @@ def test_attachment_unico(db):
         AttachmentFactory(foto=a.foto)
 
 
+def test_guardar_foto_rechaza_repetida_sin_escribirla(db):
+    a = AttachmentFactory()
+    with a.foto.open('rb'):
+        contenido = a.foto.read()
+    nuevo = Attachment()
+    with mock.patch.object(Attachment._meta.get_field('foto').storage, 'save') as save:
+        with pytest.raises(IntegrityError):
+            nuevo.guardar_foto('repetida.jpg', ContentFile(contenido))
+    assert nuevo.foto_digest == a.foto_digest
+    save.assert_not_called()
+
+
 def test_priorizadas_respeta_orden(db, settings):
     a1 = IdentificacionFactory(status='identificada').attachment
     a2 = IdentificacionFactory(status='spam').attachment
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.db import transaction
+
+from elecciones.models import Carga
+from elecciones.tests.factories import CargaFactory, IdentificacionFactory
+from adjuntos.consolidacion import consumir_novedades_carga
+from adjuntos.novedades import esperar_novedad, notificar_novedad, CanalPostgres
+
+
+def test_novedades_de_cargas(transactional_db, settings):
+    settings.CANAL_NOVEDADES = 'local'
+    esperar_novedad(0)
+
+    carga = CargaFactory(tipo='total', firma='1-10')
+    assert esperar_novedad(0)
+    assert not esperar_novedad(0)
+
+    # Que el consolidador la procese no es una novedad.
+    consumir_novedades_carga()
+    assert not esperar_novedad(0)
+
+    # Que se invalide sí.
+    carga.refresh_from_db()
+    carga.invalidar()
+    assert esperar_novedad(0)
+
+
+def test_novedades_de_identificaciones(transactional_db, settings):
+    settings.CANAL_NOVEDADES = 'local'
+    esperar_novedad(0)
+
+    identificacion = IdentificacionFactory()
+    assert esperar_novedad(0)
+
+    identificacion.invalidar()
+    assert esperar_novedad(0)
+
+
+def test_sin_canal_de_novedades(db, settings):
+    settings.CANAL_NOVEDADES = None
+    CargaFactory()
+    assert not esperar_novedad(0)
+
+
+def test_novedad_se_avisa_al_confirmar_la_transaccion(transactional_db, settings):
+    settings.CANAL_NOVEDADES = 'postgres'
+    with mock.patch.object(CanalPostgres, 'notificar', side_effect=Exception('sin canal')) as notificar:
+        with transaction.atomic():
+            carga = CargaFactory(tipo='total', firma='1-10')
+            notificar_novedad()
+            notificar.assert_not_called()
+            # Que el aviso vaya a fallar no aborta la transacción.
+            carga.refresh_from_db()
+        assert notificar.call_count == 2
+    assert Carga.objects.filter(id=carga.id).exists()
@@ -1,9 +1,11 @@
 from pathlib import Path
+from unittest import mock
 
 from elecciones.tests.factories import ( AttachmentFactory, MesaFactory, )
 from django.urls import reverse
 from elecciones.tests.conftest import fiscal_client, setup_groups # noqa
 from http import HTTPStatus
+from adjuntos.miniaturas import generar_en_segundo_plano, generar_miniaturas
 from adjuntos.models import Attachment, Identificacion
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -13,6 +15,12 @@ def test_identificacion_create_view_get(fiscal_client, admin_user):
     # Se la asigno al fiscal
     admin_user.fiscal.asignar_attachment(a)
 
+    # Mientras no se genera la miniatura se muestra la foto original.
+    response = fiscal_client.get(reverse('asignar-mesa', args=[a.id]))
+    assert response.status_code == HTTPStatus.OK
+    assert a.foto.url in response.content.decode('utf8')
+
+    generar_miniaturas(a)
     response = fiscal_client.get(reverse('asignar-mesa', args=[a.id]))
     foto_url = a.foto.thumbnail['960x'].url
     assert response.status_code == HTTPStatus.OK
@@ -48,6 +56,7 @@ def test_identificacion_create_view_get__desde_unidad_basica(fiscal_client, admi
     a = AttachmentFactory()
     admin_user.fiscal.asignar_attachment(a)
     a.asignar_a_fiscal()
+    generar_miniaturas(a)
     response = fiscal_client.get(reverse('asignar-mesa-ub', args=[a.id]))
     assert response.status_code == HTTPStatus.OK
 
@@ -172,6 +181,33 @@ def test_preidentificacion_create_view_post(fiscal_client):
     assert pre_identificacion.distrito == mesa_1.circuito.seccion.distrito
 
 
+def test_subir_adjunto_encola_miniaturas(fiscal_client, django_capture_on_commit_callbacks):
+    content = open('adjuntos/tests/acta.jpg', 'rb')
+    file = SimpleUploadedFile('acta.jpg', content.read(), content_type="image/jpeg")
+    mesa_1 = MesaFactory()
+    data = {
+        'file_field': (file,),
+        'circuito': mesa_1.circuito.id,
+        'seccion': mesa_1.circuito.seccion.id,
+        'distrito': mesa_1.circuito.seccion.distrito.id,
+    }
+    with mock.patch('adjuntos.miniaturas.ejecutor') as ejecutor:
+        with django_capture_on_commit_callbacks(execute=True):
+            response = fiscal_client.post(reverse('agregar-adjuntos'), data)
+    assert response.status_code == HTTPStatus.OK
+
+    attachment = Attachment.objects.get()
+    ejecutor.return_value.submit.assert_called_once_with(generar_en_segundo_plano, attachment, 'foto')
+
+
+def test_generar_miniaturas(db):
+    a = AttachmentFactory()
+    assert generar_miniaturas(a) == 3
+    storage = a.foto.storage
+    assert storage.exists(a.foto.thumbnail['960x'].name)
+    assert storage.exists(a.foto.thumbnail['120x'].name)
+
+
 def test_preidentificacion_create_view_pdf(fiscal_client):
     """prueba que si se sube un pdf, se descompone en una imagen por pagina"""
     content = Path('adjuntos/tests/acta2pages.pdf')
@@ -1,4 +1,6 @@
 import io
+import tempfile
+from contextlib import ExitStack
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db import IntegrityError
@@ -8,10 +10,12 @@ from django.utils.decorators import method_decorator
 from django.views.generic.edit import FormView
 from django.core.files.uploadedfile import SimpleUploadedFile
 
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path
+from PIL import Image
 import structlog
 
 from adjuntos.forms import AgregarAttachmentsForm
+from adjuntos.miniaturas import encolar_miniaturas
 from adjuntos.models import Attachment
 
 logger = structlog.get_logger(__name__)
@@ -26,6 +30,29 @@ def image_to_uploadedfile(pil_image, name):
     )
 
 
+def paginas_de_pdf(archivo):
+    """
+    Genera las páginas del pdf como instancias de PIL.Image. Se rasterizan todas con una sola
+    ejecución de pdftoppm a un directorio temporal y se abren de a una, para no tener todas las
+    páginas en memoria a la vez.
+    Si el archivo subido ya está en disco se lo usa directamente; si no, se lo escribe una única
+    vez en un archivo temporal.
+    """
+    with ExitStack() as stack:
+        if hasattr(archivo, 'temporary_file_path'):
+            ruta = archivo.temporary_file_path()
+        else:
+            temporal = stack.enter_context(tempfile.NamedTemporaryFile(suffix='.pdf'))
+            for chunk in archivo.chunks():
+                temporal.write(chunk)
+            temporal.flush()
+            ruta = temporal.name
+        directorio = stack.enter_context(tempfile.TemporaryDirectory())
+        for pagina in convert_from_path(ruta, output_folder=directorio, paths_only=True):
+            with Image.open(pagina) as imagen:
+                yield imagen
+
+
 class AgregarAdjuntos(FormView):
     """
     Permite subir una o más imágenes, generando instancias de ``Attachment``
@@ -78,10 +105,10 @@ class AgregarAdjuntos(FormView):
 
     def procesar_adjunto(self, file_from_form, subido_por, pre_identificacion=None):
         if file_from_form.content_type == "application/pdf":
-            images = [
+            images = (
                 image_to_uploadedfile(image, f"{file_from_form.name}-page-{idx}.jpg")
-                for idx, image in enumerate(convert_from_bytes(file_from_form.read()))
-            ]
+                for idx, image in enumerate(paginas_de_pdf(file_from_form))
+            )
         else:
             # ya es una imagen,
             images = [file_from_form]
@@ -101,11 +128,12 @@ class AgregarAdjuntos(FormView):
     ):
         try:
             instance = Attachment(mimetype=adjunto.content_type, parent=parent)
-            instance.foto.save(adjunto.name, adjunto, save=False)
+            instance.guardar_foto(adjunto.name, adjunto)
             instance.subido_por = subido_por
             if pre_identificacion is not None:
                 instance.pre_identificacion = pre_identificacion
             instance.save()
+            encolar_miniaturas(instance)
             return instance
         except IntegrityError:
             self.agregar_resultado_carga(
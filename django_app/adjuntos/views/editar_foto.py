@@ -9,6 +9,7 @@ from django.core.serializers import serialize
 
 import structlog
 
+from adjuntos.miniaturas import encolar_miniaturas
 from adjuntos.models import Attachment
 from problemas.models import Problema
 
@@ -33,5 +34,6 @@ def editar_foto(request, attachment_id):
         )
         logger.info('foto editada', id=attachment.id)
         attachment.save(update_fields=['foto_edited'])
+        encolar_miniaturas(attachment, 'foto_edited')
         return JsonResponse({'message': 'Imagen guardada'})
     return JsonResponse({'message': 'No se pudo guardar la imagen'})
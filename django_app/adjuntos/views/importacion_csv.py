@@ -94,6 +94,9 @@ def status_importacion_csv(request, csv_id):
     context['fiscal'] = tarea.fiscal
     context['mesas_total_ok'] = tarea.mesas_total_ok
     context['mesas_parc_ok'] = tarea.mesas_parc_ok
+    context['mesas_total'] = tarea.mesas_total
+    context['mesas_procesadas'] = tarea.mesas_procesadas
+    context['porcentaje_procesado'] = tarea.porcentaje_procesado
 
     resultados_carga = []
 
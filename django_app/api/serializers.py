@@ -14,7 +14,7 @@ class ActaSerializer(serializers.Serializer):
 
         attachment = Attachment()
         attachment.subido_por = subido_por
-        attachment.foto.save(foto.name, foto, save=False)
+        attachment.guardar_foto(foto.name, foto)
         attachment.save()
 
         return attachment
@@ -34,7 +34,7 @@ class VotosListSerializer(serializers.ListSerializer):
             opciones[votos['categoria']].append(votos['opcion'])
 
         for categoria, opciones in opciones.items():
-            prioritarias = categoria.opciones_actuales(solo_prioritarias=True, excluir_optativas=True)
+            prioritarias = categoria.opciones_actuales_cacheadas(solo_prioritarias=True, excluir_optativas=True)
             faltantes = [opc for opc in prioritarias if opc not in opciones]
             if faltantes:
                 raise serializers.ValidationError(
@@ -53,6 +53,23 @@ class VotoSerializer(serializers.Serializer):
         list_serializer_class = VotosListSerializer
 
 
+class VotoEnLoteSerializer(serializers.Serializer):
+    categoria = serializers.IntegerField()
+    opcion = serializers.IntegerField()
+    votos = serializers.IntegerField(min_value=0)
+
+
+class CargaEnLoteSerializer(serializers.Serializer):
+    """
+    Votos de una mesa para la carga en lote.
+
+    A diferencia de VotoSerializer, las categorías y opciones no se buscan de a una:
+    se validan todas juntas en la vista contra las opciones de cada categoría.
+    """
+    mesa = serializers.IntegerField()
+    votos = VotoEnLoteSerializer(many=True, allow_empty=False)
+
+
 class ListarCategoriasQuerySerializer(serializers.Serializer):
     prioridad = serializers.IntegerField(default=2)
 
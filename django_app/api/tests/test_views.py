@@ -385,3 +385,51 @@ def test_listar_opciones_error(valor, admin_client):
 
     response = admin_client.get(url, data={'solo_prioritarias': valor}, format='json')
     assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_cargar_votos_en_lote(admin_client):
+    url = reverse('cargar-votos-en-lote')
+
+    categoria = factories.CategoriaFactory()
+    opcion_1 = factories.OpcionFactory()
+    opcion_2 = factories.OpcionFactory()
+    otra_opcion = factories.OpcionFactory()
+    factories.CategoriaOpcionFactory(categoria=categoria, opcion=opcion_1, prioritaria=True, orden=1)
+    factories.CategoriaOpcionFactory(categoria=categoria, opcion=opcion_2, prioritaria=True, orden=2)
+
+    mesas = [factories.MesaFactory(categorias=[categoria]) for _ in range(4)]
+    sin_categoria = factories.MesaFactory()
+
+    def votos(mesa, *opciones_votos):
+        return {
+            'mesa': mesa.id,
+            'votos': [
+                {'categoria': categoria.id, 'opcion': opcion.id, 'votos': cantidad}
+                for opcion, cantidad in opciones_votos
+            ]
+        }
+
+    data = [
+        votos(mesas[0], (opcion_1, 100), (opcion_2, 50)),
+        votos(mesas[1], (opcion_1, 80), (opcion_2, 70)),
+        # Falta una prioritaria.
+        votos(mesas[2], (opcion_1, 80)),
+        # Opción que no es de la categoría.
+        votos(mesas[3], (opcion_1, 80), (opcion_2, 70), (otra_opcion, 1)),
+        votos(sin_categoria, (opcion_1, 80), (opcion_2, 70)),
+    ]
+
+    response = admin_client.post(url, data, format='json')
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [resultado['status'] for resultado in response.data] == [
+        status.HTTP_201_CREATED, status.HTTP_201_CREATED,
+        status.HTTP_400_BAD_REQUEST, status.HTTP_400_BAD_REQUEST, status.HTTP_404_NOT_FOUND,
+    ]
+    assert Carga.objects.count() == 2
+
+    carga = Carga.objects.get(id=response.data[0]['cargas'][0])
+    assert carga.mesa_categoria.mesa == mesas[0]
+    assert carga.tipo == Carga.TIPOS.parcial
+    assert carga.firma == f'{opcion_1.id}-100|{opcion_2.id}-50'
+    assert sorted(carga.opcion_votos()) == sorted([(opcion_1.id, 100), (opcion_2.id, 50)])
@@ -25,6 +25,7 @@ schema_view = get_schema_view(swagger_info, public=True, permission_classes=(per
 
 urlpatterns = [
     path('actas/', views.subir_acta, name='actas'),
+    path('actas/votos/', views.cargar_votos_en_lote, name='cargar-votos-en-lote'),
     path('actas/<foto_digest>/', views.identificar_acta, name='identificar-acta'),
     path('actas/<int:id_mesa>/votos/', views.cargar_votos, name='cargar-votos'),
     path('categorias/', views.listar_categorias, name='categorias'),
@@ -14,13 +14,15 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from .serializers import (
-    VotoSerializer, ActaSerializer, MesaSerializer, CategoriaSerializer, OpcionSerializer,
+    VotoSerializer, CargaEnLoteSerializer, ActaSerializer, MesaSerializer, CategoriaSerializer, OpcionSerializer,
     ListarCategoriasQuerySerializer, ListarOpcionesQuerySerializer
 )
 
-from adjuntos.models import Identificacion, Attachment, hash_file
+from adjuntos.miniaturas import encolar_miniaturas
+from adjuntos.models import Identificacion, Attachment, hash_chunks
+from adjuntos.novedades import notificar_novedad
 from elecciones.models import (
-    Distrito, Seccion, Circuito, Mesa, MesaCategoria, CategoriaOpcion, Categoria, Carga, VotoMesaReportado
+    Distrito, Seccion, Circuito, Mesa, MesaCategoria, CategoriaOpcion, Categoria, Carga, VotoMesaReportado, Opcion
 )
 
 
@@ -68,12 +70,12 @@ def subir_acta(request):
         try:
             with transaction.atomic():
                 attachment = serializer.save(subido_por=request.user.fiscal)
+                encolar_miniaturas(attachment)
         except IntegrityError:
             # la imagen ya existe.
             # se obtiene la instancia conocida con el mismo hash
             foto = serializer.validated_data['foto']
-            foto.seek(0)
-            attachment = Attachment.objects.filter(foto_digest=hash_file(foto)).first()
+            attachment = Attachment.objects.filter(foto_digest=hash_chunks(foto.chunks())).first()
 
             return Response(data=ActaSerializer(attachment).data, status=status.HTTP_409_CONFLICT)
 
@@ -171,22 +173,23 @@ def cargar_votos(request, id_mesa):
         with transaction.atomic():
             for categoria, opcion_votos in data.items():
                 mesa_categoria = get_object_or_404(MesaCategoria, mesa=mesa, categoria=categoria)
-                carga = Carga.objects.create(
+                carga = Carga(
                     # Sabemos que el bot va a mandar sólo cargas parciales.
                     tipo=Carga.TIPOS.parcial, origen=Carga.SOURCES.telegram,
                     mesa_categoria=mesa_categoria, fiscal=request.user.fiscal
                 )
 
+                reportados = []
                 for opcion, votos in opcion_votos:
                     categoria_opcion = get_object_or_404(
                         CategoriaOpcion, categoria=categoria, opcion=opcion
                     )
 
-                    VotoMesaReportado.objects.create(
-                        carga=carga,
+                    reportados.append(VotoMesaReportado(
                         opcion=categoria_opcion.opcion,
                         votos=votos
-                    )
+                    ))
+                carga.guardar_con_votos(reportados)
 
         # TODO: se deberían devolver los recursos creados
         return Response({"mensaje": "Se cargaron los votos con éxito."}, status=201)
@@ -194,6 +197,123 @@ def cargar_votos(request, id_mesa):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def opciones_de_categorias(ids_categorias):
+    """
+    Devuelve dos diccionarios id de categoría -> set de ids de opciones: todas las opciones
+    de la categoría y las prioritarias que se deben cargar (ver Categoria.opciones_actuales).
+    """
+    opciones = defaultdict(set)
+    prioritarias = defaultdict(set)
+    for categoria_id, opcion_id, prioritaria, tipo in CategoriaOpcion.objects.filter(
+        categoria_id__in=ids_categorias
+    ).values_list('categoria_id', 'opcion_id', 'prioritaria', 'opcion__tipo'):
+        opciones[categoria_id].add(opcion_id)
+        if prioritaria and tipo != Opcion.TIPOS.metadata_optativa:
+            prioritarias[categoria_id].add(opcion_id)
+    return opciones, prioritarias
+
+
+def validar_carga_en_lote(item, mesa_categorias, opciones, prioritarias):
+    """
+    Valida los votos de una mesa de la carga en lote.
+    Devuelve (status, errores, votos por categoría).
+    """
+    votos_por_categoria = defaultdict(dict)
+    errores = []
+    for voto in item['votos']:
+        categoria_id, opcion_id = voto['categoria'], voto['opcion']
+        if (item['mesa'], categoria_id) not in mesa_categorias:
+            return status.HTTP_404_NOT_FOUND, [
+                f'No existe la categoría {categoria_id} para la mesa {item["mesa"]}.'
+            ], None
+        if opcion_id not in opciones[categoria_id]:
+            errores.append(f'La opción {opcion_id} no corresponde a la categoría {categoria_id}.')
+        elif opcion_id in votos_por_categoria[categoria_id]:
+            errores.append(f'La opción {opcion_id} está repetida en la categoría {categoria_id}.')
+        votos_por_categoria[categoria_id][opcion_id] = voto['votos']
+
+    for categoria_id, votos in votos_por_categoria.items():
+        if not prioritarias[categoria_id].issubset(votos):
+            errores.append('Se deben cargar todas las opciones prioritarias para cada categoría.')
+            break
+
+    if errores:
+        return status.HTTP_400_BAD_REQUEST, errores, None
+    return status.HTTP_201_CREATED, [], votos_por_categoria
+
+
+@swagger_auto_schema(
+    method='post',
+    request_body=CargaEnLoteSerializer(many=True, allow_empty=False),
+    responses={
+        status.HTTP_200_OK: openapi.Response(description='Resultado de la carga de cada mesa, en el mismo orden.', ),
+        status.HTTP_400_BAD_REQUEST: openapi.Response(description='Errores de formato.', ),
+    },
+    tags=['Actas']
+)
+@api_view(
+    ['POST'],
+)
+def cargar_votos_en_lote(request):
+    """
+    Permite cargar votos de muchas mesas en un solo pedido.
+
+    Cada elemento tiene el id de la mesa y su lista de votos, con el mismo formato que
+    en la carga de votos de una mesa. Cada mesa se valida por separado: las que tienen errores
+    no se cargan y las demás sí. Se devuelve un resultado por mesa, en el mismo orden,
+    con el status de esa mesa y los ids de las cargas creadas o los errores.
+    """
+    serializer = CargaEnLoteSerializer(data=request.data, many=True, allow_empty=False)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    items = serializer.validated_data
+    ids_categorias = {voto['categoria'] for item in items for voto in item['votos']}
+    mesa_categorias = {
+        (mesa_id, categoria_id): mesa_categoria_id
+        for mesa_categoria_id, mesa_id, categoria_id in MesaCategoria.objects.filter(
+            mesa_id__in={item['mesa'] for item in items}, categoria_id__in=ids_categorias
+        ).values_list('id', 'mesa_id', 'categoria_id')
+    }
+    opciones, prioritarias = opciones_de_categorias(ids_categorias)
+
+    resultados = []
+    cargas_por_resultado = []
+    for item in items:
+        status_item, errores, votos_por_categoria = validar_carga_en_lote(
+            item, mesa_categorias, opciones, prioritarias
+        )
+        resultado = {'mesa': item['mesa'], 'status': status_item}
+        resultados.append(resultado)
+        if errores:
+            resultado['errores'] = errores
+            continue
+
+        cargas = [
+            (
+                Carga(
+                    # Sabemos que el bot va a mandar sólo cargas parciales.
+                    tipo=Carga.TIPOS.parcial, origen=Carga.SOURCES.telegram,
+                    mesa_categoria_id=mesa_categorias[(item['mesa'], categoria_id)], fiscal=request.user.fiscal
+                ),
+                [VotoMesaReportado(opcion_id=opcion_id, votos=cantidad) for opcion_id, cantidad in votos.items()]
+            )
+            for categoria_id, votos in votos_por_categoria.items()
+        ]
+        cargas_por_resultado.append((resultado, cargas))
+
+    cargas_con_votos = [carga_con_votos for _, cargas in cargas_por_resultado for carga_con_votos in cargas]
+    if cargas_con_votos:
+        with transaction.atomic():
+            Carga.guardar_en_lote(cargas_con_votos)
+            notificar_novedad()
+
+    for resultado, cargas in cargas_por_resultado:
+        resultado['cargas'] = [carga.id for carga, _ in cargas]
+
+    return Response(resultados)
+
+
 @swagger_auto_schema(
     method='get',
     query_serializer=ListarCategoriasQuerySerializer,
@@ -0,0 +1,12 @@
+import pytest
+
+from elecciones.referencias import DatosDeReferencia
+
+
+@pytest.fixture(autouse=True)
+def invalidar_datos_de_referencia():
+    """
+    Los datos de referencia se cachean por proceso, pero cada test arma (y descarta al hacer
+    rollback) sus propias opciones.
+    """
+    DatosDeReferencia.invalidar()
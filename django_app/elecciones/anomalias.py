@@ -0,0 +1,292 @@
+"""
+Detección de mesas sospechosas, para decidir en cuáles pedir recuento definitivo o revisión
+(ver el comando nos_estan_cagando).
+
+En lugar de computar los resultados mesa por mesa con un Sumarizador, se leen en una sola query
+todos los votos testigo de la categoría en el ámbito analizado, se arma una matriz mesas x opciones
+y se reduce a los votos de los dos partidos que se comparan. Todos los análisis (ceros, mesas
+ganadas, tendencias, promedios y desvíos por circuito) son operaciones vectorizadas sobre esa matriz.
+"""
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from django.db.models import Count
+
+from .models import (
+    Circuito,
+    Mesa,
+    MesaCategoria,
+    VotoMesaReportado,
+    VotoMesaTestigo,
+    OPCIONES_A_CONSIDERAR,
+)
+from .proyecciones import Proyecciones
+
+# `grave` distingue las alertas (True) de las advertencias (False).
+# `mesa_id` es None para las alertas que son del circuito.
+Alerta = namedtuple('Alerta', ['grave', 'mesa_id', 'mensaje'])
+
+NUESTROS = 0
+ELLOS = 1
+
+
+def orden_numerico(numero):
+    """
+    Clave de orden para los números de distrito y sección, que son strings.
+    """
+    try:
+        return (0, int(numero))
+    except (TypeError, ValueError):
+        return (1, str(numero))
+
+
+class DetectorDeAnomalias:
+    """
+    Analiza los votos testigo de una categoría en todo el país, un distrito, una sección o un circuito.
+
+    Las alertas se agrupan por circuito, en el mismo orden en que se reportaban recorriendo
+    las mesas de a una: ceros, diferencias con el Correo, umbral de mesas listas, tendencias
+    y diferencias con el promedio.
+    """
+
+    def __init__(
+        self, categoria, partido_nuestro, partido_ellos, tipo_de_agregacion,
+        umbral_analisis_estadisticos=30, umbral_mesas_ganadas=0.4,
+        distrito=None, seccion=None, circuito=None
+    ):
+        self.categoria = categoria
+        self.partidos = [partido_nuestro.id, partido_ellos.id]
+        self.tipo_de_agregacion = tipo_de_agregacion
+        self.umbral_analisis_estadisticos = umbral_analisis_estadisticos
+        self.umbral_mesas_ganadas = umbral_mesas_ganadas
+
+        self.filtro = {}
+        if circuito is not None:
+            self.filtro = {'circuito': circuito}
+        elif seccion is not None:
+            self.filtro = {'circuito__seccion': seccion}
+        elif distrito is not None:
+            self.filtro = {'circuito__seccion__distrito': distrito}
+
+    def lookups(self, prefijo=''):
+        return {f'{prefijo}{campo}': valor for campo, valor in self.filtro.items()}
+
+    def mesas_por_circuito(self):
+        """
+        Cantidad de mesas de la categoría en cada circuito del ámbito analizado.
+        """
+        return dict(
+            Mesa.objects.filter(
+                categorias=self.categoria, **self.lookups()
+            ).values('circuito_id').annotate(
+                cantidad=Count('id', distinct=True)
+            ).values_list('circuito_id', 'cantidad')
+        )
+
+    def circuitos(self, ids_circuitos):
+        """
+        Circuitos ordenados por distrito, sección e id, como se recorrían antes.
+        """
+        circuitos = Circuito.objects.filter(id__in=ids_circuitos).select_related('seccion__distrito')
+        return sorted(circuitos, key=lambda circuito: (
+            orden_numerico(circuito.seccion.distrito.numero),
+            orden_numerico(circuito.seccion.numero),
+            circuito.id
+        ))
+
+    def votos_por_mesa(self):
+        """
+        Devuelve (ids_mesas, ids_circuitos_de_mesa, votos) donde votos es una matriz mesas x 2
+        con los votos nuestros y de ellos en las mesas escrutadas según el tipo de agregación.
+        """
+        status = MesaCategoria.status_por_tipo_de_agregacion[
+            (self.tipo_de_agregacion, OPCIONES_A_CONSIDERAR.prioritarias)
+        ]
+        opciones = np.array(list(
+            self.categoria.opciones_actuales(
+                solo_prioritarias=True, excluir_optativas=True
+            ).values_list('id', 'partido_id')
+        ), dtype=object).reshape(-1, 2)
+        orden = np.argsort(opciones[:, 0].astype(np.int64))
+        ids_opciones = opciones[orden, 0].astype(np.int64)
+        # Matriz opciones x 2 que indica a cuál de los dos partidos pertenece cada opción.
+        pertenencia = np.array(
+            [[partido == self.partidos[NUESTROS], partido == self.partidos[ELLOS]] for partido in opciones[orden, 1]],
+            dtype=np.int64
+        ).reshape(-1, 2)
+
+        votos_testigo = Proyecciones.a_array(
+            VotoMesaTestigo.objects.filter(
+                categoria=self.categoria,
+                status__in=status,
+                opcion_id__in=ids_opciones.tolist(),
+                circuito__isnull=False,
+                **self.lookups()
+            ).values_list('mesa_id', 'circuito_id', 'opcion_id', 'votos'),
+            columnas=4
+        )
+        ids_mesas, filas = np.unique(votos_testigo[:, 0], return_inverse=True)
+        columnas = np.searchsorted(ids_opciones, votos_testigo[:, 2])
+
+        matriz = np.zeros((len(ids_mesas), len(ids_opciones)), dtype=np.int64)
+        np.add.at(matriz, (filas, columnas), votos_testigo[:, 3])
+
+        circuito_de_mesa = np.zeros(len(ids_mesas), dtype=np.int64)
+        circuito_de_mesa[filas] = votos_testigo[:, 1]
+        return ids_mesas, circuito_de_mesa, matriz @ pertenencia
+
+    def votos_de_cargas(self, ids_cargas):
+        """
+        Votos nuestros y de ellos en cada una de las cargas dadas: {id carga: [nuestros, ellos]}.
+        """
+        votos = defaultdict(lambda: [0, 0])
+        for carga_id, partido_id, cantidad in VotoMesaReportado.objects.filter(
+            carga_id__in=ids_cargas, opcion__partido_id__in=self.partidos
+        ).values_list('carga_id', 'opcion__partido_id', 'votos'):
+            votos[carga_id][self.partidos.index(partido_id)] += cantidad or 0
+        return votos
+
+    def alertas_correo(self, alertas):
+        """
+        Mesas en las que ganamos según la carga testigo pero perdemos según la carga oficial del Correo.
+        """
+        mesa_categorias = MesaCategoria.objects.filter(
+            categoria=self.categoria,
+            carga_testigo__isnull=False,
+            parcial_oficial__isnull=False,
+            **self.lookups('mesa__')
+        ).values_list(
+            'mesa_id', 'mesa__circuito_id',
+            'carga_testigo_id', 'carga_testigo__firma', 'parcial_oficial_id', 'parcial_oficial__firma'
+        ).order_by('mesa_id')
+        mesas = [
+            (mesa_id, circuito_id, testigo_id, oficial_id)
+            for mesa_id, circuito_id, testigo_id, firma_testigo, oficial_id, firma_oficial in mesa_categorias
+            if firma_testigo != firma_oficial
+        ]
+        votos = self.votos_de_cargas(
+            [testigo_id for _, _, testigo_id, _ in mesas] + [oficial_id for _, _, _, oficial_id in mesas]
+        )
+        for mesa_id, circuito_id, testigo_id, oficial_id in mesas:
+            nuestros_testigo, ellos_testigo = votos[testigo_id]
+            nuestros_correo, ellos_correo = votos[oficial_id]
+            if not (nuestros_testigo >= ellos_testigo and nuestros_correo < ellos_correo):
+                continue
+            alertas[circuito_id].append(Alerta(
+                True, mesa_id,
+                f"Tiene diferencias respecto la carga oficial.\n"
+                f"\tNosotros decimos:\tFdT = {nuestros_testigo},\tJpC = {ellos_testigo}.\n"
+                f"\tEl Correo dice:\t\tFdT = {nuestros_correo},\tJpC = {ellos_correo}."
+            ))
+            if nuestros_correo == 0:
+                alertas[circuito_id].append(Alerta(True, mesa_id, "La carga oficial reporta 0 votos nuestros"))
+
+    def analizar(self, analizar_ceros=False, comparar_con_correo=False, analizar_tendencias=False,
+                 analizar_promedio=False):
+        """
+        Devuelve la lista de circuitos analizados (ordenada) y un diccionario
+        id de circuito -> lista de Alerta.
+        """
+        mesas_por_circuito = self.mesas_por_circuito()
+        ids_mesas, circuito_de_mesa, votos = self.votos_por_mesa()
+        alertas = defaultdict(list)
+
+        nuestros = votos[:, NUESTROS]
+        ellos = votos[:, ELLOS]
+        ids_circuitos, circuito = np.unique(circuito_de_mesa, return_inverse=True)
+
+        if analizar_ceros:
+            for i in np.flatnonzero((nuestros == 0) | (ellos == 0)):
+                id_circuito = int(circuito_de_mesa[i])
+                if nuestros[i] == 0:
+                    alertas[id_circuito].append(Alerta(True, int(ids_mesas[i]), "Fernandez en cero votos."))
+                if ellos[i] == 0:
+                    alertas[id_circuito].append(Alerta(False, int(ids_mesas[i]), "Macri en cero votos."))
+
+        if comparar_con_correo:
+            self.alertas_correo(alertas)
+
+        # Estadísticas por circuito.
+        cant_mesas_listas = np.bincount(circuito, minlength=len(ids_circuitos))
+        total_mesas = np.array([mesas_por_circuito.get(int(id_circuito), 0) for id_circuito in ids_circuitos])
+        supera_umbral = cant_mesas_listas > self.umbral_analisis_estadisticos / 100.0 * total_mesas
+
+        circuitos = self.circuitos(set(mesas_por_circuito) | set(ids_circuitos.tolist()) | set(alertas))
+        circuito_por_id = {c.id: c for c in circuitos}
+        for i in np.flatnonzero(~supera_umbral):
+            c = circuito_por_id[int(ids_circuitos[i])]
+            alertas[c.id].append(Alerta(
+                False, None,
+                f"No se superó el umbral de mesas listas en circuito {c.numero} ({c.seccion.distrito}) "
+                f"(sólo {cant_mesas_listas[i]} de {total_mesas[i]})."
+            ))
+
+        if analizar_tendencias:
+            ganadas_nuestros = np.bincount(circuito, weights=nuestros > ellos, minlength=len(ids_circuitos))
+            ganadas_ellos = np.bincount(circuito, weights=ellos > nuestros, minlength=len(ids_circuitos))
+            ganadas = ganadas_nuestros + ganadas_ellos
+            dif = np.divide(
+                np.abs(ganadas_ellos - ganadas_nuestros), ganadas,
+                out=np.ones(len(ids_circuitos)), where=ganadas != 0
+            )
+            # Como antes, sólo se reportan los circuitos en los que ganamos la mayoría de las mesas.
+            con_tendencia = supera_umbral & (dif >= self.umbral_mesas_ganadas) & (ganadas_nuestros > ganadas_ellos)
+            for i in np.flatnonzero(con_tendencia[circuito] & (nuestros != ellos)):
+                votos_de_la_mesa = f"(FdT: {nuestros[i]} votos, JpC: {ellos[i]} votos)."
+                if ellos[i] > nuestros[i]:
+                    alertas[int(circuito_de_mesa[i])].append(Alerta(
+                        True, int(ids_mesas[i]),
+                        "En el circuito FdT ganó en la mayoría de las mesas pero en "
+                        f"ésta no {votos_de_la_mesa}"
+                    ))
+                else:
+                    alertas[int(circuito_de_mesa[i])].append(Alerta(
+                        False, int(ids_mesas[i]),
+                        "En el circuito JpC ganó en la mayoría de las mesas pero en "
+                        f"ésta no {votos_de_la_mesa}"
+                    ))
+
+        if analizar_promedio:
+            self.alertas_promedio(
+                alertas, ids_mesas, circuito_de_mesa, circuito, votos, cant_mesas_listas, supera_umbral
+            )
+
+        return circuitos, alertas
+
+    def alertas_promedio(
+        self, alertas, ids_mesas, circuito_de_mesa, circuito, votos, cant_mesas_listas, supera_umbral
+    ):
+        """
+        Mesas a más de un desvío estándar del promedio de su circuito.
+        """
+        cant_mesas = cant_mesas_listas.reshape(-1, 1)
+        promedio = np.stack([
+            np.bincount(circuito, weights=votos[:, columna], minlength=len(cant_mesas))
+            for columna in (NUESTROS, ELLOS)
+        ], axis=1) / cant_mesas
+        dif_a_promedio = np.abs(votos - promedio[circuito])
+        desvio = np.sqrt(np.stack([
+            np.bincount(circuito, weights=dif_a_promedio[:, columna] ** 2, minlength=len(cant_mesas))
+            for columna in (NUESTROS, ELLOS)
+        ], axis=1) / cant_mesas)
+        fuera_de_rango = (dif_a_promedio > desvio[circuito]) & supera_umbral[circuito].reshape(-1, 1)
+
+        for i in np.flatnonzero(fuera_de_rango.any(axis=1)):
+            id_circuito, id_mesa = int(circuito_de_mesa[i]), int(ids_mesas[i])
+            c = circuito[i]
+            if fuera_de_rango[i, NUESTROS]:
+                alertas[id_circuito].append(Alerta(
+                    True, id_mesa,
+                    f"Mucha diferencia de votos con promedio (FdT = {votos[i, NUESTROS]}, "
+                    f"prom FdT = {float(promedio[c, NUESTROS])}, "
+                    f"dif = {float(dif_a_promedio[i, NUESTROS])}, "
+                    f"dif máxima esperada = {float(desvio[c, NUESTROS])}"
+                ))
+            if fuera_de_rango[i, ELLOS]:
+                alertas[id_circuito].append(Alerta(
+                    False, id_mesa,
+                    f"Mucha diferencia de votos con promedio (JpC = {votos[i, ELLOS]}, "
+                    f"prom JpC = {float(promedio[c, ELLOS])}, "
+                    f"dif = {float(dif_a_promedio[i, ELLOS])}, "
+                    f"dif máxima esperada = {float(desvio[c, ELLOS])}"
+                ))
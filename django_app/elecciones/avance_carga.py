@@ -1,4 +1,4 @@
-from django.db.models import Q, Sum, OuterRef, Exists
+from django.db.models import Q, Sum, Count, OuterRef, Exists
 from attrdict import AttrDict
 from .models import (
     Distrito,
@@ -13,7 +13,7 @@ from .models import (
 )
 from .resultados import porcentaje_numerico
 from .sumarizador import Sumarizador
-from adjuntos.models import Identificacion, PreIdentificacion
+from adjuntos.models import Attachment, Identificacion, PreIdentificacion
 
 
 class AvanceDeCarga(Sumarizador):
@@ -75,81 +75,70 @@ class AvanceDeCarga(Sumarizador):
             categoria=self.categoria
         )
 
-        # mesas sin identificar y en identificación: dependen de las identificaciones **válidas**
-        # y de los attachment.
-        # respecto de la condición "mesa__attachments=None" ver comentario abajo, 
-        # en la definición de mesacats_sin_cargar
-        identificaciones_validas_mesacat = Identificacion.objects.filter(mesa=OuterRef('mesa'), invalidada=False)
-        mesacats_con_marca_identificacion = mesacats_de_la_categoria.annotate(
-            tiene_identificaciones=Exists(identificaciones_validas_mesacat))
-        mesacats_sin_identificar = mesacats_con_marca_identificacion.filter(
-            tiene_identificaciones=False)
-        mesacats_sin_identificar_sin_cargas = mesacats_sin_identificar.filter(status=MesaCategoria.STATUS.sin_cargar)
-        mesacats_sin_identificar_con_cargas = mesacats_sin_identificar.exclude(status=MesaCategoria.STATUS.sin_cargar)
-        mesacats_en_identificacion = mesacats_con_marca_identificacion.filter(
-            tiene_identificaciones=True, mesa__attachments=None)
-        mesacats_en_identificacion_sin_cargas = mesacats_en_identificacion.filter(
-            status=MesaCategoria.STATUS.sin_cargar)
-        mesacats_en_identificacion_con_cargas = mesacats_en_identificacion.exclude(
-            status=MesaCategoria.STATUS.sin_cargar)
-        
-
-        # mesas sin identificar y en identificación: dependen de las identificaciones **válidas**
-        # y de los attachment
-        # identificaciones_validas_mesa = Identificacion.objects.filter(mesa=OuterRef('pk'), invalidada=False)
-        # mesas_con_marca_identificacion = self.mesas_a_considerar.annotate(
-        #     tiene_identificaciones=Exists(identificaciones_validas_mesa))
-        # mesas_sin_identificar = mesas_con_marca_identificacion.filter(
-        #     tiene_identificaciones=False)
-        # mesas_en_identificacion = mesas_con_marca_identificacion.filter(
-        #     tiene_identificaciones=True, attachments=None)
-
-        # como "a cargar" se reportan solamente los que tienen attachments
-        # OJO hay que hacer .exclude(mesa__attachments=None), si el query se arma distinto
+        # Todas las cuentas salen de un único query agrupado por status, por si la mesa tiene
+        # identificaciones **válidas** y por si tiene attachments.
+        # OJO se usa Exists para los attachments, si el query se arma con un join
         # se corre el peligro de que una mesa con N attachments con N > 1 (lo que es válido en esta app) cuente N veces.
         # Carlos Lombardi, 9/8/2019
-        mesacats_sin_cargar = mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.sin_cargar) \
-            .exclude(mesa__attachments=None)
-
-        mesacats_carga_parcial_sin_consolidar = \
-            mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.parcial_sin_consolidar) 
+        identificaciones_validas_mesacat = Identificacion.objects.filter(mesa=OuterRef('mesa'), invalidada=False)
+        attachments_mesacat = Attachment.objects.filter(mesa=OuterRef('mesa'))
+        grupos = mesacats_de_la_categoria.annotate(
+            tiene_identificaciones=Exists(identificaciones_validas_mesacat),
+            tiene_attachments=Exists(attachments_mesacat),
+        ).values_list('status', 'tiene_identificaciones', 'tiene_attachments').annotate(
+            cantidad_mesas=Count('id'),
+            cantidad_electores=Sum('mesa__electores'),
+        ).order_by()
+        grupos = [
+            AttrDict(
+                status=status,
+                tiene_identificaciones=tiene_identificaciones,
+                tiene_attachments=tiene_attachments,
+                cantidad_mesas=cantidad_mesas,
+                cantidad_electores=cantidad_electores or 0,
+            )
+            for status, tiene_identificaciones, tiene_attachments, cantidad_mesas, cantidad_electores in grupos
+        ]
 
-        mesacats_carga_parcial_consolidada_csv = \
-            mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.parcial_consolidada_csv)
+        dato_total = DatoTotalAvanceDeCarga().para_mesas(self.mesas_a_considerar)
 
-        mesacats_carga_parcial_consolidada_dc = \
-            mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.parcial_consolidada_dc)
+        def dato_parcial(condicion):
+            grupos_que_cumplen = [grupo for grupo in grupos if condicion(grupo)]
+            return DatoParcialAvanceDeCarga(dato_total).para_valores_fijos(
+                sum(grupo.cantidad_mesas for grupo in grupos_que_cumplen),
+                sum(grupo.cantidad_electores for grupo in grupos_que_cumplen),
+            )
 
-        mesacats_carga_total_sin_consolidar = \
-            mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.total_sin_consolidar)
-                
-        mesacats_carga_total_consolidada_csv = \
-            mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.total_consolidada_csv)
+        def con_status(*status):
+            return lambda grupo: grupo.status in status
 
-        mesacats_carga_total_consolidada_dc = \
-            mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.total_consolidada_dc)
+        sin_cargas = con_status(MesaCategoria.STATUS.sin_cargar)
 
-        mesacats_conflicto_o_problema = \
-            mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.parcial_en_conflicto) | \
-                mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.total_en_conflicto) | \
-                    mesacats_de_la_categoria.filter(status=MesaCategoria.STATUS.con_problemas)
+        def sin_identificar(grupo):
+            return not grupo.tiene_identificaciones
 
-        dato_total = DatoTotalAvanceDeCarga().para_mesas(self.mesas_a_considerar)
+        def en_identificacion(grupo):
+            return grupo.tiene_identificaciones and not grupo.tiene_attachments
 
         return AttrDict({
             "total": dato_total,
-            "sin_identificar_sin_cargas": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_sin_identificar_sin_cargas),
-            "sin_identificar_con_cargas": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_sin_identificar_con_cargas),
-            "en_identificacion_sin_cargas": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_en_identificacion_sin_cargas),
-            "en_identificacion_con_cargas": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_en_identificacion_con_cargas),
-            "sin_cargar": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_sin_cargar),
-            "carga_parcial_sin_consolidar": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_carga_parcial_sin_consolidar),
-            "carga_parcial_consolidada_csv": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_carga_parcial_consolidada_csv),
-            "carga_parcial_consolidada_dc": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_carga_parcial_consolidada_dc),
-            "carga_total_sin_consolidar": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_carga_total_sin_consolidar),
-            "carga_total_consolidada_csv": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_carga_total_consolidada_csv),
-            "carga_total_consolidada_dc": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_carga_total_consolidada_dc),
-            "conflicto_o_problema": DatoParcialAvanceDeCarga(dato_total).para_mesacats(mesacats_conflicto_o_problema),
+            "sin_identificar_sin_cargas": dato_parcial(lambda g: sin_identificar(g) and sin_cargas(g)),
+            "sin_identificar_con_cargas": dato_parcial(lambda g: sin_identificar(g) and not sin_cargas(g)),
+            "en_identificacion_sin_cargas": dato_parcial(lambda g: en_identificacion(g) and sin_cargas(g)),
+            "en_identificacion_con_cargas": dato_parcial(lambda g: en_identificacion(g) and not sin_cargas(g)),
+            # Como "a cargar" se reportan solamente los que tienen attachments.
+            "sin_cargar": dato_parcial(lambda g: sin_cargas(g) and g.tiene_attachments),
+            "carga_parcial_sin_consolidar": dato_parcial(con_status(MesaCategoria.STATUS.parcial_sin_consolidar)),
+            "carga_parcial_consolidada_csv": dato_parcial(con_status(MesaCategoria.STATUS.parcial_consolidada_csv)),
+            "carga_parcial_consolidada_dc": dato_parcial(con_status(MesaCategoria.STATUS.parcial_consolidada_dc)),
+            "carga_total_sin_consolidar": dato_parcial(con_status(MesaCategoria.STATUS.total_sin_consolidar)),
+            "carga_total_consolidada_csv": dato_parcial(con_status(MesaCategoria.STATUS.total_consolidada_csv)),
+            "carga_total_consolidada_dc": dato_parcial(con_status(MesaCategoria.STATUS.total_consolidada_dc)),
+            "conflicto_o_problema": dato_parcial(con_status(
+                MesaCategoria.STATUS.parcial_en_conflicto,
+                MesaCategoria.STATUS.total_en_conflicto,
+                MesaCategoria.STATUS.con_problemas,
+            )),
             "preidentificaciones": cantidad_preidentificaciones
         })
 
@@ -187,8 +176,9 @@ class AvanceDeCarga(Sumarizador):
 
 class DatoAvanceDeCarga():
     def para_mesas(self, mesas):
-        self.la_cantidad_mesas = mesas.count()
-        self.la_cantidad_electores = mesas.aggregate(v=Sum('electores'))['v'] or 0
+        totales = mesas.aggregate(cantidad=Count('id'), electores=Sum('electores'))
+        self.la_cantidad_mesas = totales['cantidad']
+        self.la_cantidad_electores = totales['electores'] or 0
         return self
 
     def para_mesacats(self, mesa_cats):
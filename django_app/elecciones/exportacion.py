@@ -0,0 +1,181 @@
+"""
+Exportación de votos en forma de streaming.
+
+Los votos se leen con un cursor del lado del servidor (``iterator``) y se van escribiendo a
+medida que llegan, así que la memoria usada no depende del tamaño de la exportación.
+
+Hay dos formatos:
+    - CSV, de a una línea, para la descarga de resultados de una categoría.
+    - Parquet, de a lotes, con los votos consolidados de todas las categorías particionados
+      por categoría y distrito, para análisis con pandas, duckdb, etc.
+"""
+import csv
+import os
+import zipfile
+from itertools import groupby, islice
+from operator import itemgetter
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from elecciones.models import (
+    MesaCategoria, VotoMesaTestigo, OPCIONES_A_CONSIDERAR, TIPOS_DE_AGREGACIONES,
+)
+
+COLUMNAS_DE_MESA = ['distrito', 'seccion', 'circuito', 'mesa']
+COLUMNAS_DE_VOTOS = COLUMNAS_DE_MESA + ['opcion', 'votos']
+
+TAMANIO_CHUNK = 5000
+TAMANIO_LOTE_PARQUET = 100000
+
+# Los códigos de opción y las claves geográficas se repiten muchísimo, así que van
+# codificados como diccionario. La categoría y el distrito no están en los archivos:
+# salen de la ruta de la partición (categoria=<slug>/distrito=<numero>/).
+TIPO_DICCIONARIO = pa.dictionary(pa.int32(), pa.string())
+ESQUEMA_PARQUET = pa.schema([
+    ('seccion', TIPO_DICCIONARIO),
+    ('circuito', TIPO_DICCIONARIO),
+    ('mesa', pa.string()),
+    ('status', TIPO_DICCIONARIO),
+    ('opcion', TIPO_DICCIONARIO),
+    ('votos', pa.int32()),
+])
+
+# Nombre que usa la convención de particiones "hive" para los valores nulos.
+PARTICION_NULA = '__HIVE_DEFAULT_PARTITION__'
+
+
+def iterar_votos(votos):
+    """
+    `votos` es el values_list de Sumarizador.votos_csv_export.
+    """
+    return votos.iterator(chunk_size=TAMANIO_CHUNK)
+
+
+def codigos_de_opciones(votos):
+    """
+    Códigos de las opciones presentes en la exportación, para las columnas del formato por mesa.
+    """
+    codigos = votos.order_by().values_list('opcion__codigo', flat=True).distinct()
+    return sorted(codigos, key=lambda codigo: (codigo is None, str(codigo)))
+
+
+def filas_por_opcion(votos):
+    """
+    Una fila por mesa y opción: distrito, sección, circuito, mesa, opción, votos.
+    """
+    yield COLUMNAS_DE_VOTOS
+    yield from iterar_votos(votos)
+
+
+def filas_por_mesa(votos):
+    """
+    Una fila por mesa con una columna por opción, armada en la misma pasada sobre los votos
+    (que vienen ordenados por mesa).
+    """
+    codigos = codigos_de_opciones(votos)
+    yield COLUMNAS_DE_MESA + codigos
+
+    for mesa, votos_de_la_mesa in groupby(iterar_votos(votos), key=lambda voto: voto[:4]):
+        votos_por_codigo = {voto[4]: voto[5] for voto in votos_de_la_mesa}
+        yield list(mesa) + [votos_por_codigo.get(codigo, '') for codigo in codigos]
+
+
+class Eco:
+    """
+    Objeto con la interfaz de un archivo que devuelve lo que se le escribe,
+    para usar csv.writer generando el contenido de a una línea.
+    """
+
+    def write(self, valor):
+        return valor
+
+
+def csv_en_streaming(filas):
+    escritor = csv.writer(Eco())
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
+def votos_consolidados(categorias=None):
+    """
+    Votos testigo de las mesas con carga total o parcial consolidada, ordenados por partición.
+    """
+    status = (
+        MesaCategoria.status_por_tipo_de_agregacion[
+            (TIPOS_DE_AGREGACIONES.solo_consolidados, OPCIONES_A_CONSIDERAR.todas)
+        ] + MesaCategoria.status_por_tipo_de_agregacion[
+            (TIPOS_DE_AGREGACIONES.solo_consolidados, OPCIONES_A_CONSIDERAR.prioritarias)
+        ]
+    )
+    votos = VotoMesaTestigo.objects.filter(status__in=status)
+    if categorias is not None:
+        votos = votos.filter(categoria__in=categorias)
+    return votos.values_list(
+        'categoria__slug',
+        'distrito__numero',
+        'seccion__numero',
+        'circuito__numero',
+        'mesa__numero',
+        'status',
+        'opcion__codigo',
+        'votos',
+    ).order_by('categoria__slug', 'distrito__numero')
+
+
+def lote_arrow(filas):
+    """
+    Convierte una lista de filas de `votos_consolidados` en un RecordBatch con ESQUEMA_PARQUET.
+    """
+    _, _, secciones, circuitos, mesas, status, opciones, votos = zip(*filas)
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(secciones, type=pa.string()).dictionary_encode(),
+            pa.array(circuitos, type=pa.string()).dictionary_encode(),
+            pa.array(mesas, type=pa.string()),
+            pa.array(status, type=pa.string()).dictionary_encode(),
+            pa.array(opciones, type=pa.string()).dictionary_encode(),
+            pa.array(votos, type=pa.int32()),
+        ],
+        schema=ESQUEMA_PARQUET
+    )
+
+
+def exportar_parquet(directorio, categorias=None):
+    """
+    Escribe los votos consolidados en `directorio`, un archivo por categoría y distrito:
+    <directorio>/categoria=<slug>/distrito=<numero>/votos.parquet
+
+    Se recorre una sola vez un cursor del lado del servidor y se escribe de a lotes de
+    TAMANIO_LOTE_PARQUET filas, así que la memoria no depende de la cantidad de votos.
+    Devuelve la lista de archivos escritos.
+    """
+    archivos = []
+    filas = votos_consolidados(categorias).iterator(chunk_size=TAMANIO_LOTE_PARQUET)
+    for (categoria, distrito), filas_de_particion in groupby(filas, key=itemgetter(0, 1)):
+        carpeta = os.path.join(
+            directorio, f'categoria={categoria}', f'distrito={PARTICION_NULA if distrito is None else distrito}'
+        )
+        os.makedirs(carpeta, exist_ok=True)
+        archivo = os.path.join(carpeta, 'votos.parquet')
+        escritor = pq.ParquetWriter(archivo, ESQUEMA_PARQUET)
+        try:
+            lote = list(islice(filas_de_particion, TAMANIO_LOTE_PARQUET))
+            while lote:
+                escritor.write_table(pa.Table.from_batches([lote_arrow(lote)]))
+                lote = list(islice(filas_de_particion, TAMANIO_LOTE_PARQUET))
+        finally:
+            escritor.close()
+        archivos.append(archivo)
+    return archivos
+
+
+def exportar_parquet_zip(archivo, directorio, categorias=None):
+    """
+    Exporta a Parquet en `directorio` y empaqueta las particiones en el zip `archivo`
+    (un path o un objeto archivo), manteniendo la estructura de carpetas.
+    Los archivos Parquet ya están comprimidos, así que se guardan sin volver a comprimir.
+    """
+    with zipfile.ZipFile(archivo, 'w', compression=zipfile.ZIP_STORED) as zip_de_salida:
+        for parquet in exportar_parquet(directorio, categorias):
+            zip_de_salida.write(parquet, os.path.relpath(parquet, directorio))
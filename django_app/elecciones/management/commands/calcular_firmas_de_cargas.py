@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from elecciones.models import Carga
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula la firma de las cargas parciales y totales que no la tienen (cargas grabadas antes "
+        "de que la firma se calculara al guardar los votos)."
+    )
+
+    TAMANIO_LOTE = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--forzar', action='store_true', default=False,
+            help='Recalcula la firma también de las cargas que ya la tienen.'
+        )
+
+    def handle(self, *args, **options):
+        forzar = options['forzar']
+        cargas = Carga.objects.filter(tipo__in=[Carga.TIPOS.parcial, Carga.TIPOS.total])
+        if not forzar:
+            cargas = cargas.filter(firma__isnull=True) | cargas.filter(firma='')
+        ids = list(cargas.order_by('id').values_list('id', flat=True))
+
+        for inicio in range(0, len(ids), self.TAMANIO_LOTE):
+            with transaction.atomic():
+                lote = Carga.objects.filter(id__in=ids[inicio:inicio + self.TAMANIO_LOTE]).only('id', 'firma')
+                Carga.actualizar_firmas_en_lote(list(lote), forzar=True)
+
+        self.stdout.write(self.style.SUCCESS(f'Se calcularon las firmas de {len(ids)} cargas.'))
@@ -4,6 +4,7 @@ from elecciones.models import (
     Distrito, Seccion, Circuito, Categoria, VotoMesaReportado,
     TIPOS_DE_AGREGACIONES, NIVELES_DE_AGREGACION, OPCIONES_A_CONSIDERAR
 )
+from elecciones.exportacion import csv_en_streaming, filas_por_mesa, iterar_votos
 from elecciones.sumarizador import Sumarizador
 from escrutinio_social import settings
 
@@ -30,6 +31,8 @@ class Command(BaseCommand):
 
         parser.add_argument("--file", type=str, default='/tmp/exportacion.csv',
                             help="Archivo de salida (default %(default)s)")
+        parser.add_argument("--por_mesa", action="store_true", default=False,
+                            help="Exportar una fila por mesa con una columna por opción.")
 
         # Opciones a considerar
         parser.add_argument("--tipo_de_agregacion",
@@ -48,6 +51,7 @@ class Command(BaseCommand):
         """
         self.tipo_de_agregacion = kwargs['tipo_de_agregacion']
         self.filename = kwargs['file']
+        self.por_mesa = kwargs['por_mesa']
 
         nombre_categoria = kwargs['categoria']
         self.categoria = Categoria.objects.get(slug=nombre_categoria)
@@ -105,16 +109,19 @@ class Command(BaseCommand):
         return sumarizador.votos_csv_export(self.categoria)
 
     def exportar(self, votos):
-        self.file = open(self.filename, 'w+')
-        self.file.write(self.headers)
-        self.file.write("\n")
-        self.exportar_votos(votos)
-        self.file.close()
+        # Se escribe a medida que se leen los votos (ver elecciones.exportacion).
+        with open(self.filename, 'w+', newline='') as self.file:
+            if self.por_mesa:
+                self.file.writelines(csv_en_streaming(filas_por_mesa(votos)))
+                return
+
+            self.file.write(self.headers)
+            self.file.write("\n")
+            self.exportar_votos(votos)
 
     def exportar_votos(self, votos):
-        for voto in votos:
+        for voto in iterar_votos(votos):
             fila = ", ".join(str(n) for n in voto)
-            # print(fila[0])
             self.file.write(f"{fila}\n")
 
     def status(self, texto):
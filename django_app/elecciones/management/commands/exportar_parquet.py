@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from elecciones.models import Categoria
+from elecciones.exportacion import exportar_parquet
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta los votos consolidados a archivos Parquet particionados por categoría y distrito "
+        "(<destino>/categoria=<slug>/distrito=<numero>/votos.parquet)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--destino", type=str, default='/tmp/exportacion-parquet',
+                            help="Directorio de salida (default %(default)s).")
+        parser.add_argument("--categoria", type=str, dest="categorias", action="append",
+                            help="Slug de una categoría a exportar; se puede repetir (default todas).")
+
+    def handle(self, *args, **options):
+        categorias = None
+        if options['categorias']:
+            categorias = Categoria.objects.filter(slug__in=options['categorias'])
+
+        inicio = time.monotonic()
+        archivos = exportar_parquet(options['destino'], categorias)
+        self.stdout.write(self.style.SUCCESS(
+            f"Se exportaron {len(archivos)} particiones a {options['destino']} "
+            f"en {time.monotonic() - inicio:.1f} segundos."
+        ))
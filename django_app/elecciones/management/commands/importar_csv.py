@@ -2,19 +2,42 @@ from adjuntos.csv_import import CSVImporter
 from adjuntos.models import CSVTareaDeImportacion
 from fiscales.models import Fiscal
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connections, transaction
 from django.conf import settings
-from threading import Thread
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-import threading
 import logging
 import structlog
 import time
 
 
+def importar_fragmento(id_tarea, path, df, mesas_matches, debug=False):
+    """
+    Importa un fragmento del archivo de la tarea (sus filas ya validadas y las mesas que les
+    corresponden, ver CSVImporter.fragmentos) y le suma el avance.
+    Corre en los procesos del pool, así que recibe sólo datos serializables.
+    """
+    tarea = CSVTareaDeImportacion.objects.select_related('fiscal__user').get(id=id_tarea)
+    csvimporter = CSVImporter(path, tarea.fiscal.user, debug, df=df)
+    try:
+        csvimporter.procesar_fragmento(mesas_matches)
+    except Exception as e:
+        csvimporter.anadir_error(str(e))
+    tarea.sumar_progreso(
+        len(mesas_matches),
+        csvimporter.cant_mesas_importadas,
+        csvimporter.cant_mesas_parcialmente_importadas,
+        ''.join(csvimporter.errores)
+    )
+
+
 class Command(BaseCommand):
     """
-    Importador de CSV
+    Importador de CSV.
+
+    Toma las tareas pendientes de a una (con SKIP LOCKED, así que se pueden correr varios
+    importadores a la vez), valida el archivo y reparte sus mesas en fragmentos entre un
+    pool de procesos. Cada fragmento suma su avance a la tarea al terminar.
     """
     help = "Importador de CSV."
 
@@ -27,14 +50,16 @@ class Command(BaseCommand):
         self.usr = Fiscal.objects.all().first()
         self.logger = logging.getLogger('csv_import')
         self.espera_tarea = 1
-        self.thread_local = threading.local()
-        self.thread_local.worker_id = 0
         self.debug = False
+        # Sin procesos los fragmentos se importan en este mismo proceso.
+        self.pool = None
+        self.mesas_por_fragmento = 200
 
     def handle(self, *args, **options):
         self.debug = options['debug']
         self.usr = Fiscal.objects.all().first()
         self.espera_tarea = options['espera_tarea']
+        self.mesas_por_fragmento = options['mesas_por_fragmento']
 
         if options['file']:
             self.importar_ahora(options['file'])
@@ -43,7 +68,7 @@ class Command(BaseCommand):
         elif options['crear_tarea']:
             self.crear_tarea(options['crear_tarea'])
         else:
-            self.lanzar_threads(options['cant_workers'])
+            self.procesar_tareas(options['procesos'])
 
     def add_arguments(self, parser):
 
@@ -65,9 +90,14 @@ class Command(BaseCommand):
                             help="Crea una tarea para el archivo parámetro."
                             )
 
-        parser.add_argument("--cant_workers", type=int,
+        parser.add_argument("--procesos", type=int,
                             default=5,
-                            help="Cantidad de workers que forkea (default %(default)s)."
+                            help="Cantidad de procesos que forkea (default %(default)s)."
+                            )
+
+        parser.add_argument("--mesas_por_fragmento", type=int,
+                            default=200,
+                            help="Cantidad de mesas que importa cada proceso por vez (default %(default)s)."
                             )
 
         parser.add_argument("--espera_tarea", type=int,
@@ -76,17 +106,14 @@ class Command(BaseCommand):
                             )
 
     def importar_ahora(self, file):
-        csvimporter = CSVImporter(Path(file), self.usr.user, self.debug)
-
-        errores = csvimporter.procesar_parcialmente()
-        try:
-            for cant_mesas_ok, cant_mesas_parcialmente_ok, error in errores:
-                print("Error: ", error)
-        except TypeError:
-            cant_mesas_ok, cant_mesas_parcialmente_ok, error = errores
-            print("Errro: ", error)
+        tarea = self.crear_tarea(file)
+        tarea.cambiar_status(CSVTareaDeImportacion.STATUS.en_progreso)
+        self.worker_import_file(tarea)
+        tarea.refresh_from_db()
 
-        print(f"{cant_mesas_ok} mesas ok, {cant_mesas_parcialmente_ok} mesas parcialmente ok. ")
+        if tarea.errores:
+            print("Errores: ", tarea.errores)
+        print(f"{tarea.mesas_total_ok} mesas ok, {tarea.mesas_parc_ok} mesas parcialmente ok. ")
 
     def importar_ahora_at_once(self, file):
         csvimporter = CSVImporter(Path(file), self.usr.user, self.debug)
@@ -98,7 +125,7 @@ class Command(BaseCommand):
         print(f"{cant_mesas_ok} mesas ok, {cant_mesas_parcialmente_ok} mesas parcialmente ok. ")
 
     def crear_tarea(self, archivo):
-        CSVTareaDeImportacion.objects.create(
+        return CSVTareaDeImportacion.objects.create(
             csv_file=archivo,
             fiscal=self.usr
         )
@@ -133,37 +160,48 @@ class Command(BaseCommand):
 
         if not path:
             mensaje = f"archivo {tarea.csv_file.name} no encontrado."
-            self.logger.error("[%d] Tarea %s abortada: %s", self.thread_local.worker_id, tarea, mensaje)
+            self.logger.error("Tarea %s abortada: %s", tarea, mensaje)
             tarea.errores = mensaje
             tarea.save_errores()
             tarea.fin_procesamiento(0, 0)
             return
 
+        # La validación del archivo y de las mesas se hace una sola vez, acá.
         csvimporter = CSVImporter(path, tarea.fiscal.user, self.debug)
-        errores = csvimporter.procesar_parcialmente()
-        i = 0
-        if not tarea.errores:
-            tarea.errores = ''
         try:
-            for cant_mesas_ok, cant_mesas_parcialmente_ok, error in errores:
-                if not error:
-                    continue
-                tarea.errores = tarea.errores + error
-                i += 1
-                if i == 20:
-                    # Cada 20 errores grabamos.
-                    i = 0
-                    tarea.save_errores(cant_mesas_ok, cant_mesas_parcialmente_ok)
-        except TypeError:
-            cant_mesas_ok, cant_mesas_parcialmente_ok, error = errores
-            tarea.errores = tarea.errores + error
-            i += 1
-
-        # Si quedaron errores sin grabar los grabamos:
-        if i > 0:
+            csvimporter.validar()
+            csvimporter.validar_mesas()
+        except Exception as e:
+            csvimporter.anadir_error(str(e))
+            tarea.errores = ''.join(csvimporter.errores)
             tarea.save_errores()
+            tarea.fin_procesamiento(0, 0)
+            return
 
-        tarea.fin_procesamiento(cant_mesas_ok, cant_mesas_parcialmente_ok)
+        tarea.iniciar_procesamiento(len(csvimporter.mesas_matches))
+        if csvimporter.errores:
+            tarea.sumar_progreso(0, 0, 0, ''.join(csvimporter.errores))
+
+        # Cada fragmento recibe sólo sus filas, así que el archivo se lee una única vez.
+        fragmentos = csvimporter.fragmentos(self.mesas_por_fragmento)
+        if self.pool:
+            # Los procesos del pool se forkean al primer submit y no deben heredar
+            # las conexiones abiertas de este proceso.
+            connections.close_all()
+            futuros = [
+                self.pool.submit(importar_fragmento, tarea.id, path, df, mesas_matches, self.debug)
+                for df, mesas_matches in fragmentos
+            ]
+            for futuro in as_completed(futuros):
+                try:
+                    futuro.result()
+                except Exception as e:
+                    self.logger.error("Tarea %s: error al importar un fragmento: %s", tarea, e)
+        else:
+            for df, mesas_matches in fragmentos:
+                importar_fragmento(tarea.id, path, df, mesas_matches, self.debug)
+
+        tarea.cambiar_status(CSVTareaDeImportacion.STATUS.procesado)
 
     def wait_and_process_task(self):
         """
@@ -177,40 +215,30 @@ class Command(BaseCommand):
                 time.sleep(self.espera_tarea)
 
         if not self.finalizar:
-            self.logger.info("[%d] Tarea seleccionada: %s", self.thread_local.worker_id, tarea)
+            self.logger.info("Tarea seleccionada: %s", tarea)
             try:
                 self.worker_import_file(tarea)
             except Exception as e:
                 tarea.errores = tarea.errores if tarea.errores else '' + str(e)
                 tarea.save_errores()
                 tarea.fin_procesamiento(0, 0)
-            self.logger.info("[%d] Tarea terminada: %s", self.thread_local.worker_id, tarea)
+            self.logger.info("Tarea terminada: %s", tarea)
 
-    def csv_import_worker(self, thread_id):
+    def procesar_tareas(self, cant_procesos):
         """
-        Cicla procesando una tarea tras otra.
+        Cicla procesando una tarea tras otra, repartiendo cada una en `cant_procesos` procesos.
         """
-        self.thread_local.worker_id = thread_id
-        self.logger.info("[%d] Worker listo.", self.thread_local.worker_id)
-        while not self.finalizar:
-            self.wait_and_process_task()
-        self.logger.info("[%d] Worker finalizado.", self.thread_local.worker_id)
-
-    def lanzar_threads(self, cant_workers):
         self.finalizar = False
-        self.thread_local = threading.local()
-        threads = []
-        for i in range(cant_workers):
-            t = Thread(target=self.csv_import_worker, args=(i,), daemon=False)
-            t.start()
-            threads.append(t)
-
-        # Me quedo esperando a que terminen procesando Ctrl-C.
-        while not self.finalizar:
-            try:
-                time.sleep(60)
-            except KeyboardInterrupt:
-                self.finalizar = True
-                print(self.style.SUCCESS("Finalizando. Presionar de nuevo para terminar ahora."))
-                for thread in threads:
-                    thread.join()
+        self.pool = ProcessPoolExecutor(max_workers=cant_procesos) if cant_procesos > 0 else None
+        self.logger.info("Importador listo con %d procesos.", cant_procesos)
+        try:
+            while not self.finalizar:
+                self.wait_and_process_task()
+        except KeyboardInterrupt:
+            self.finalizar = True
+            print(self.style.SUCCESS("Finalizando."))
+        finally:
+            if self.pool:
+                self.pool.shutdown()
+                self.pool = None
+        self.logger.info("Importador finalizado.")
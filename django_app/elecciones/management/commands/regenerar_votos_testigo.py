@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from elecciones.models import VotoMesaTestigo, ResultadoAgregado
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera las denormalizaciones de resultados: los votos testigo (VotoMesaTestigo) "
+        "a partir de las cargas testigo y los resultados agregados (ResultadoAgregado) a partir de ellos."
+    )
+
+    TAMANIO_LOTE = 1000
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            VotoMesaTestigo.regenerar_todos(self.TAMANIO_LOTE)
+            ResultadoAgregado.regenerar()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Se regeneraron {VotoMesaTestigo.objects.count()} votos testigo '
+            f'y {ResultadoAgregado.objects.count()} resultados agregados.'
+        ))
@@ -3,7 +3,9 @@ from django.db import transaction, connection
 from django.core.management.base import BaseCommand
 from adjuntos.models import Attachment, PreIdentificacion, CSVTareaDeImportacion
 from problemas.models import Problema
-from elecciones.models import (VotoMesaReportado, Carga, MesaCategoria)
+from elecciones.models import (
+    VotoMesaReportado, Carga, MesaCategoria, ResultadoAgregado, IdentificacionesEnCircuito
+)
 from fiscales.models import Fiscal
 from scheduling.models import ColaCargasPendientes
 
@@ -35,6 +37,9 @@ class Command(BaseCommand):
         tablas_a_resetear_secuencias.append('elecciones_votomesareportado')
         Carga.objects.all().delete()
         tablas_a_resetear_secuencias.append('elecciones_carga')
+        ResultadoAgregado.objects.all().delete()
+        tablas_a_resetear_secuencias.append('elecciones_resultadoagregado')
+        tablas_a_resetear_secuencias.append('elecciones_votoagregado')
         Fiscal.objects.all().update(
             last_seen=None,
             ingreso_alguna_vez=False,
@@ -52,6 +57,7 @@ class Command(BaseCommand):
             cant_asignaciones_realizadas=0,
             status=MesaCategoria.STATUS.sin_cargar,
         )
+        IdentificacionesEnCircuito.objects.all().delete()
         ColaCargasPendientes.objects.all().delete()
         tablas_a_resetear_secuencias.append('scheduling_colacargaspendientes')
 
@@ -0,0 +1,45 @@
+import time
+
+import structlog
+from django.core.management.base import BaseCommand
+
+from elecciones.models import Categoria, ConfiguracionComputo, SnapshotDeResultados
+
+logger = structlog.get_logger('snapshots')
+
+
+class Command(BaseCommand):
+    help = (
+        "Guarda un snapshot de los resultados de cada categoría nacional activa para cada configuración "
+        "de cómputo. Con --intervalo lo repite periódicamente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=int, default=None,
+            help='Cada cuántos segundos tomar snapshots (por defecto se toman una sola vez).'
+        )
+
+    def tomar_snapshots(self):
+        categorias = list(Categoria.objects.filter(distrito__isnull=True, activa=True))
+        for configuracion in ConfiguracionComputo.objects.all():
+            for categoria in categorias:
+                inicio = time.monotonic()
+                snapshot = SnapshotDeResultados.tomar(categoria, configuracion)
+                logger.info(
+                    'Snapshot de resultados',
+                    categoria=categoria.id,
+                    configuracion=configuracion.id,
+                    version=snapshot.version,
+                    segundos=round(time.monotonic() - inicio, 3)
+                )
+
+    def handle(self, *args, **options):
+        intervalo = options['intervalo']
+        self.tomar_snapshots()
+        while intervalo:
+            try:
+                time.sleep(intervalo)
+                self.tomar_snapshots()
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,84 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def generar_votos_testigo(apps, schema_editor):
+    # Los resultados se leen sólo de esta tabla, así que hay que llenarla con las cargas
+    # testigo que ya existan. Se usan los modelos históricos para no depender de campos que
+    # agreguen migraciones posteriores; es lo mismo que hace VotoMesaTestigo.regenerar_todos()
+    # (ver el comando regenerar_votos_testigo).
+    VotoMesaReportado = apps.get_model('elecciones', 'VotoMesaReportado')
+    VotoMesaTestigo = apps.get_model('elecciones', 'VotoMesaTestigo')
+
+    mesa_categoria = 'carga__mesa_categoria'
+    mesa = f'{mesa_categoria}__mesa'
+    seccion = f'{mesa}__circuito__seccion'
+    votos = VotoMesaReportado.objects.filter(
+        **{f'{mesa_categoria}__carga_testigo': models.F('carga')}
+    ).values_list(
+        f'{mesa_categoria}_id', 'carga_id', f'{mesa_categoria}__categoria_id', f'{mesa_categoria}__status',
+        'opcion_id', 'votos', f'{mesa}_id', f'{mesa}__lugar_votacion_id', f'{mesa}__circuito_id',
+        f'{seccion}_id', f'{seccion}__seccion_politica_id', f'{seccion}__distrito_id',
+    ).order_by()
+
+    lote = []
+    for (
+        mesa_categoria_id, carga_id, categoria_id, status, opcion_id, cantidad, mesa_id,
+        lugar_votacion_id, circuito_id, seccion_id, seccion_politica_id, distrito_id
+    ) in votos.iterator():
+        lote.append(VotoMesaTestigo(
+            mesa_categoria_id=mesa_categoria_id,
+            carga_id=carga_id,
+            categoria_id=categoria_id,
+            status=status,
+            opcion_id=opcion_id,
+            votos=cantidad,
+            mesa_id=mesa_id,
+            lugar_votacion_id=lugar_votacion_id,
+            circuito_id=circuito_id,
+            seccion_id=seccion_id,
+            seccion_politica_id=seccion_politica_id,
+            distrito_id=distrito_id,
+        ))
+        if len(lote) == 1000:
+            VotoMesaTestigo.objects.bulk_create(lote)
+            lote = []
+    VotoMesaTestigo.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elecciones', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VotoMesaTestigo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('parcial_en_conflicto', 'parcial en conflicto'), ('parcial_sin_consolidar', 'parcial sin consolidar'), ('sin_cargar', 'sin cargar'), ('parcial_consolidada_csv', 'parcial consolidada CSV'), ('parcial_consolidada_dc', 'parcial consolidada doble carga'), ('total_sin_consolidar', 'total sin consolidar'), ('total_en_conflicto', 'total en conflicto'), ('total_consolidada_csv', 'total consolidada CSV'), ('total_consolidada_dc', 'total consolidada doble carga'), ('con_problemas', 'con problemas')], max_length=100)),
+                ('votos', models.PositiveIntegerField()),
+                ('carga', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votos_testigo', to='elecciones.carga')),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='elecciones.categoria')),
+                ('circuito', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='elecciones.circuito')),
+                ('distrito', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='elecciones.distrito')),
+                ('lugar_votacion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='elecciones.lugarvotacion')),
+                ('mesa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='elecciones.mesa')),
+                ('mesa_categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votos_testigo', to='elecciones.mesacategoria')),
+                ('opcion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='elecciones.opcion')),
+                ('seccion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='elecciones.seccion')),
+                ('seccion_politica', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='elecciones.seccionpolitica')),
+            ],
+            options={
+                'verbose_name': 'Voto testigo',
+                'verbose_name_plural': 'Votos testigo',
+                'unique_together': {('mesa_categoria', 'opcion')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='votomesatestigo',
+            index=models.Index(fields=['categoria', 'status', 'opcion'], name='voto_testigo_cat_status'),
+        ),
+        migrations.RunPython(generar_votos_testigo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,117 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Copias, a la fecha de esta migración, de MesaCategoria.status_por_tipo_de_agregacion, de
+# NIVELES_DE_RESULTADOS_AGREGADOS y de CAMPO_VOTO_TESTIGO_POR_NIVEL_DE_AGREGACION.
+STATUS_POR_TIPO_DE_AGREGACION = {
+    ('solo_consolidados_doble_carga', 'todas'): ('total_consolidada_dc',),
+    ('solo_consolidados_doble_carga', 'prioritarias'): ('parcial_consolidada_dc',),
+    ('solo_consolidados', 'todas'): ('total_consolidada_dc', 'total_consolidada_csv'),
+    ('solo_consolidados', 'prioritarias'): ('parcial_consolidada_dc', 'parcial_consolidada_csv'),
+    ('todas_las_cargas', 'todas'): ('total_consolidada_dc', 'total_consolidada_csv', 'total_sin_consolidar'),
+    ('todas_las_cargas', 'prioritarias'): (
+        'parcial_consolidada_dc', 'parcial_consolidada_csv', 'parcial_sin_consolidar'
+    ),
+}
+NIVELES = {
+    'circuito': ('circuito_id', 'circuito'),
+    'seccion': ('circuito__seccion_id', 'seccion'),
+    'seccion_politica': ('circuito__seccion__seccion_politica_id', 'seccion_politica'),
+    'distrito': ('circuito__seccion__distrito_id', 'distrito'),
+}
+
+
+def generar_resultados_agregados(apps, schema_editor):
+    # Los totales por distrito, sección, etc. pasan a leerse de estas tablas, así que hay que
+    # llenarlas con los votos testigo que ya existan. Se usan los modelos históricos para no depender
+    # de campos que agreguen migraciones posteriores; es lo mismo que hace ResultadoAgregado.regenerar()
+    # (ver el comando regenerar_votos_testigo).
+    MesaCategoria = apps.get_model('elecciones', 'MesaCategoria')
+    VotoMesaTestigo = apps.get_model('elecciones', 'VotoMesaTestigo')
+    ResultadoAgregado = apps.get_model('elecciones', 'ResultadoAgregado')
+    VotoAgregado = apps.get_model('elecciones', 'VotoAgregado')
+
+    for (tipo, opciones), status_a_considerar in STATUS_POR_TIPO_DE_AGREGACION.items():
+        for nivel, (campo, campo_voto) in NIVELES.items():
+            acumulados = MesaCategoria.objects.filter(
+                carga_testigo__isnull=False,
+                status__in=status_a_considerar,
+                **{f'mesa__{campo}__isnull': False}
+            ).values_list('categoria_id', f'mesa__{campo}').annotate(
+                mesas=models.Count('id'),
+                electores=models.Sum('mesa__electores'),
+            ).order_by()
+
+            resultados = ResultadoAgregado.objects.bulk_create([
+                ResultadoAgregado(
+                    categoria_id=categoria_id,
+                    tipo_de_agregacion=tipo,
+                    opciones_a_considerar=opciones,
+                    nivel_de_agregacion=nivel,
+                    id_unidad=id_unidad,
+                    mesas_escrutadas=mesas,
+                    electores_en_mesas_escrutadas=electores or 0,
+                )
+                for categoria_id, id_unidad, mesas, electores in acumulados
+            ])
+            ids = {(resultado.categoria_id, resultado.id_unidad): resultado.id for resultado in resultados}
+
+            votos = VotoMesaTestigo.objects.filter(
+                status__in=status_a_considerar,
+                **{f'{campo_voto}__isnull': False}
+            ).values_list('categoria_id', campo_voto, 'opcion_id').annotate(
+                votos_sumados=models.Sum('votos')
+            ).order_by()
+
+            VotoAgregado.objects.bulk_create([
+                VotoAgregado(
+                    resultado_id=ids[(categoria_id, id_unidad)],
+                    opcion_id=opcion_id,
+                    votos=votos_sumados,
+                )
+                for categoria_id, id_unidad, opcion_id, votos_sumados in votos
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elecciones', '0003_votomesatestigo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultadoAgregado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_de_agregacion', models.CharField(choices=[('todas_las_cargas', 'Todas'), ('solo_consolidados', 'Consolidadas'), ('solo_consolidados_doble_carga', 'Consolidadas con doble Carga')], max_length=30)),
+                ('opciones_a_considerar', models.CharField(choices=[('prioritarias', 'Prioritarias'), ('todas', 'Todas')], max_length=30)),
+                ('nivel_de_agregacion', models.CharField(choices=[('distrito', 'Provincia'), ('seccion_politica', 'Sección Política'), ('seccion', 'Sección Electoral'), ('circuito', 'Circuito'), ('lugar_de_votacion', 'Lugar de Votación'), ('mesa', 'Mesa')], max_length=30)),
+                ('id_unidad', models.BigIntegerField()),
+                ('mesas_escrutadas', models.IntegerField(default=0)),
+                ('electores_en_mesas_escrutadas', models.IntegerField(default=0)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='elecciones.categoria')),
+            ],
+            options={
+                'verbose_name': 'Resultado agregado',
+                'verbose_name_plural': 'Resultados agregados',
+                'unique_together': {('categoria', 'tipo_de_agregacion', 'opciones_a_considerar', 'nivel_de_agregacion', 'id_unidad')},
+            },
+        ),
+        migrations.CreateModel(
+            name='VotoAgregado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('votos', models.IntegerField(default=0)),
+                ('opcion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='elecciones.opcion')),
+                ('resultado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votos', to='elecciones.resultadoagregado')),
+            ],
+            options={
+                'verbose_name': 'Voto agregado',
+                'verbose_name_plural': 'Votos agregados',
+                'unique_together': {('resultado', 'opcion')},
+            },
+        ),
+        migrations.RunPython(generar_resultados_agregados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elecciones', '0004_resultadoagregado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotDeResultados',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('momento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('total_mesas', models.PositiveIntegerField(default=0)),
+                ('total_mesas_escrutadas', models.PositiveIntegerField(default=0)),
+                ('electores', models.PositiveIntegerField(default=0)),
+                ('electores_en_mesas_escrutadas', models.PositiveIntegerField(default=0)),
+                ('opciones', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None)),
+                ('votos', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('opciones_no_positivas', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=20), default=list, size=None)),
+                ('votos_no_positivos', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='elecciones.categoria')),
+                ('configuracion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='elecciones.configuracioncomputo')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de resultados',
+                'verbose_name_plural': 'Snapshots de resultados',
+                'ordering': ('categoria', 'configuracion', 'version'),
+                'unique_together': {('categoria', 'configuracion', 'version')},
+            },
+        ),
+    ]
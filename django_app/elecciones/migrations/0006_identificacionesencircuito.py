@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elecciones', '0005_snapshotderesultados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdentificacionesEnCircuito',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('identificadas', models.PositiveIntegerField(default=0)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identificaciones_en_circuitos', to='elecciones.categoria')),
+                ('circuito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identificaciones', to='elecciones.circuito')),
+            ],
+            options={
+                'verbose_name': 'Identificaciones en circuito',
+                'verbose_name_plural': 'Identificaciones en circuitos',
+                'unique_together': {('circuito', 'categoria')},
+            },
+        ),
+    ]
@@ -1,13 +1,15 @@
 import math
+import numpy as np
 from datetime import timedelta
 from collections import defaultdict
 
 from django.dispatch import receiver
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.db.models import Sum, Count, Q, F
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
@@ -23,6 +25,9 @@ logger = structlog.get_logger(__name__)
 
 MAX_INT_DB = 2147483647
 
+# Cantidad de MesaCategoria por UPDATE al recalcular coeficientes para orden de carga.
+TAMANIO_LOTE_COEFICIENTES = 2000
+
 TIPOS_DE_AGREGACIONES = Choices(
     ('todas_las_cargas', 'Todas'),
     ('solo_consolidados', 'Consolidadas'),
@@ -518,6 +523,35 @@ class MesaCategoria(models.Model):
         STATUS.parcial_consolidada_csv
     ]
 
+    # Status que se consideran en el cómputo para cada tipo de agregación, según se
+    # computen todas las opciones (carga total) o sólo las prioritarias (carga parcial).
+    status_por_tipo_de_agregacion = {
+        (TIPOS_DE_AGREGACIONES.solo_consolidados_doble_carga, OPCIONES_A_CONSIDERAR.todas): (
+            STATUS.total_consolidada_dc,
+        ),
+        (TIPOS_DE_AGREGACIONES.solo_consolidados_doble_carga, OPCIONES_A_CONSIDERAR.prioritarias): (
+            STATUS.parcial_consolidada_dc,
+        ),
+        (TIPOS_DE_AGREGACIONES.solo_consolidados, OPCIONES_A_CONSIDERAR.todas): (
+            STATUS.total_consolidada_dc,
+            STATUS.total_consolidada_csv,
+        ),
+        (TIPOS_DE_AGREGACIONES.solo_consolidados, OPCIONES_A_CONSIDERAR.prioritarias): (
+            STATUS.parcial_consolidada_dc,
+            STATUS.parcial_consolidada_csv,
+        ),
+        (TIPOS_DE_AGREGACIONES.todas_las_cargas, OPCIONES_A_CONSIDERAR.todas): (
+            STATUS.total_consolidada_dc,
+            STATUS.total_consolidada_csv,
+            STATUS.total_sin_consolidar,
+        ),
+        (TIPOS_DE_AGREGACIONES.todas_las_cargas, OPCIONES_A_CONSIDERAR.prioritarias): (
+            STATUS.parcial_consolidada_dc,
+            STATUS.parcial_consolidada_csv,
+            STATUS.parcial_sin_consolidar,
+        ),
+    }
+
     status = StatusField(default=STATUS.sin_cargar)
     mesa = models.ForeignKey('Mesa', on_delete=models.CASCADE)
     categoria = models.ForeignKey('Categoria', on_delete=models.CASCADE)
@@ -583,26 +617,31 @@ class MesaCategoria(models.Model):
         Actualiza `self.coeficiente_para_orden_de_carga` a partir de las prioridades
         por sección y categoría.
         """
-        # evitar import circular
-        from scheduling.models import mapa_prioridades_para_mesa_categoria
-
-        en_circuito = MesaCategoria.objects.filter(
-            categoria=self.categoria, mesa__circuito=self.mesa.circuito
-        )
-        total = en_circuito.count()
-        identificadas = en_circuito.identificadas().count()
-
-        self.orden_de_llegada = identificadas + 1
-        self.percentil = math.floor((identificadas * 100) / total) + 1
-        self.recalcular_coeficiente_para_orden_de_carga()
-        logger.info(
-            'actualizar orden',
-            id=self.id,
-            coef=self.coeficiente_para_orden_de_carga,
-            llegada=self.orden_de_llegada,
-            p=self.percentil
-        )
-        self.save(update_fields=['coeficiente_para_orden_de_carga', 'orden_de_llegada', 'percentil'])
+        with transaction.atomic():
+            # Bloquear el contador serializa las identificaciones del circuito y la categoría,
+            # así que los valores de esta instancia que se leen a continuación están al día.
+            contador = IdentificacionesEnCircuito.bloquear(self.mesa.circuito_id, self.categoria_id)
+            self.orden_de_llegada, self.percentil = MesaCategoria.objects.filter(
+                id=self.id
+            ).values_list('orden_de_llegada', 'percentil').get()
+
+            if self.orden_de_llegada is None:
+                # Primera identificación: llega después de las ya identificadas del circuito.
+                identificadas = contador.identificadas
+                self.orden_de_llegada = identificadas + 1
+                self.percentil = math.floor((identificadas * 100) / max(contador.total, 1)) + 1
+                contador.identificadas = F('identificadas') + 1
+                contador.save(update_fields=['identificadas'])
+            # Si ya estaba identificada conserva su orden de llegada y sólo se recalcula el coeficiente.
+            self.recalcular_coeficiente_para_orden_de_carga()
+            logger.info(
+                'actualizar orden',
+                id=self.id,
+                coef=self.coeficiente_para_orden_de_carga,
+                llegada=self.orden_de_llegada,
+                p=self.percentil
+            )
+            self.save(update_fields=['coeficiente_para_orden_de_carga', 'orden_de_llegada', 'percentil'])
 
     def recalcular_coeficiente_para_orden_de_carga(self):
         """
@@ -670,10 +709,92 @@ class MesaCategoria(models.Model):
         verbose_name_plural = "Mesas Categorías"
 
     def actualizar_status(self, status, carga_testigo):
+        status_anterior = self.status
+        carga_testigo_anterior_id = self.carga_testigo_id
         self.status = status
         self.carga_testigo = carga_testigo
         logger.info('mc status', id=self.id, status=status, testigo=getattr(carga_testigo, 'id', None))
         self.save(update_fields=['status', 'carga_testigo'])
+        MesaCategoria.actualizar_denormalizaciones_de_resultados([
+            (self, status_anterior, carga_testigo_anterior_id)
+        ])
+
+    @classmethod
+    def actualizar_status_en_lote(cls, nuevos_status):
+        """
+        Equivalente a invocar :meth:`actualizar_status` para cada una de las tuplas
+        (mesa_categoria, status, carga_testigo_id) de `nuevos_status`, pero con una cantidad
+        fija de queries. Las MesaCategoria que no cambian no se escriben.
+        """
+        cambios = []
+        for mesa_categoria, status, carga_testigo_id in nuevos_status:
+            if mesa_categoria.status == status and mesa_categoria.carga_testigo_id == carga_testigo_id:
+                continue
+            cambios.append((mesa_categoria, mesa_categoria.status, mesa_categoria.carga_testigo_id))
+            mesa_categoria.status = status
+            mesa_categoria.carga_testigo_id = carga_testigo_id
+            logger.info('mc status', id=mesa_categoria.id, status=status, testigo=carga_testigo_id)
+
+        if not cambios:
+            return
+        cls.objects.bulk_update([mesa_categoria for mesa_categoria, *_ in cambios], ['status', 'carga_testigo'])
+        cls.actualizar_denormalizaciones_de_resultados(cambios)
+
+    @classmethod
+    def actualizar_denormalizaciones_de_resultados(cls, cambios):
+        """
+        Mantiene al día las denormalizaciones de resultados que usa el Sumarizador
+        (:py:class:`VotoMesaTestigo` y :py:class:`ResultadoAgregado`) luego de que cambiaran
+        el status o la carga testigo de las MesaCategoria.
+
+        `cambios` es una lista de tuplas (mesa_categoria, status_anterior, carga_testigo_anterior_id),
+        con las MesaCategoria ya guardadas con sus nuevos valores.
+        """
+        cambios = [
+            (mesa_categoria, status_anterior, carga_testigo_anterior_id)
+            for mesa_categoria, status_anterior, carga_testigo_anterior_id in cambios
+            if status_anterior != mesa_categoria.status or carga_testigo_anterior_id != mesa_categoria.carga_testigo_id
+        ]
+        if not cambios:
+            return
+
+        votos_anteriores = defaultdict(dict)
+        for mesa_categoria_id, opcion_id, votos in VotoMesaTestigo.objects.filter(
+            mesa_categoria_id__in=[mesa_categoria.id for mesa_categoria, *_ in cambios]
+        ).values_list('mesa_categoria_id', 'opcion_id', 'votos'):
+            votos_anteriores[mesa_categoria_id][opcion_id] = votos
+
+        # Las que cambiaron de testigo tienen nuevos votos, el resto sólo cambia el status.
+        votos_actuales = dict(votos_anteriores)
+        votos_actuales.update(VotoMesaTestigo.regenerar([
+            mesa_categoria for mesa_categoria, _, carga_testigo_anterior_id in cambios
+            if carga_testigo_anterior_id != mesa_categoria.carga_testigo_id
+        ]))
+        solo_cambia_status = defaultdict(list)
+        for mesa_categoria, _, carga_testigo_anterior_id in cambios:
+            if carga_testigo_anterior_id == mesa_categoria.carga_testigo_id:
+                solo_cambia_status[mesa_categoria.status].append(mesa_categoria.id)
+        for status, ids in solo_cambia_status.items():
+            VotoMesaTestigo.objects.filter(mesa_categoria_id__in=ids).update(status=status)
+
+        aplicar = []
+        for mesa_categoria, status_anterior, carga_testigo_anterior_id in cambios:
+            antes = despues = None
+            if carga_testigo_anterior_id:
+                antes = (status_anterior, votos_anteriores.get(mesa_categoria.id, {}))
+            if mesa_categoria.carga_testigo_id:
+                despues = (mesa_categoria.status, votos_actuales.get(mesa_categoria.id, {}))
+            aplicar.append((mesa_categoria, antes, despues))
+        ResultadoAgregado.aplicar_cambios(aplicar)
+
+    def regenerar_votos_testigo(self):
+        """
+        Reconstruye las instancias de :py:class:`VotoMesaTestigo` de esta MesaCategoria
+        a partir de los votos reportados en su carga testigo actual.
+
+        Devuelve un diccionario con los votos de la carga testigo por id de opción.
+        """
+        return VotoMesaTestigo.regenerar([self])[self.id]
 
     def actualizar_parcial_oficial(self, parcial_oficial):
         self.parcial_oficial = parcial_oficial
@@ -703,14 +824,109 @@ class MesaCategoria(models.Model):
 
     @classmethod
     def recalcular_coeficiente_para_orden_de_carga_mesas(cls, mesa_cats):
-        for mesa_cat in mesa_cats:
-            mesa_cat.recalcular_coeficiente_para_orden_de_carga()
-        cls.objects.bulk_update(mesa_cats, ['coeficiente_para_orden_de_carga'])
+        """
+        Equivalente a :meth:`recalcular_coeficiente_para_orden_de_carga` y grabar, para todo
+        un queryset de MesaCategoria: se compila una tabla de prioridades por cada par
+        (sección, categoría) y se calculan los coeficientes de cada par de una vez con numpy.
+        """
+        # evitar import circular
+        from scheduling.models import tablas_de_prioridades, TablaDePrioridades
+
+        filas = np.array(list(
+            mesa_cats.filter(percentil__isnull=False, orden_de_llegada__isnull=False).values_list(
+                'id', 'mesa__lugar_votacion__circuito__seccion_id', 'categoria_id', 'percentil', 'orden_de_llegada'
+            )
+        ), dtype=object).reshape(-1, 5)
+        filas_por_par = defaultdict(list)
+        for i, (id_seccion, id_categoria) in enumerate(filas[:, 1:3]):
+            filas_por_par[(id_seccion, id_categoria)].append(i)
+        tablas = tablas_de_prioridades(filas_por_par.keys())
+
+        a_actualizar = []
+        for par, tabla in tablas.items():
+            del_par = filas[filas_por_par[par]]
+            percentiles = del_par[:, 3].astype(np.int64)
+            # Proporción de 0 a 100 (ver recalcular_coeficiente_para_orden_de_carga).
+            proporciones = np.clip(percentiles - 1, 0, 100)
+            valores = tabla.valores_para(proporciones, del_par[:, 4].astype(np.int64))
+            coeficientes = np.minimum(valores * percentiles, MAX_INT_DB)
+            a_actualizar.extend(
+                cls(
+                    id=id_mesa_cat,
+                    coeficiente_para_orden_de_carga=None if valor == TablaDePrioridades.SIN_VALOR else int(coeficiente)
+                )
+                for id_mesa_cat, valor, coeficiente in zip(del_par[:, 0], valores, coeficientes)
+            )
+        cls.objects.bulk_update(a_actualizar, ['coeficiente_para_orden_de_carga'], batch_size=TAMANIO_LOTE_COEFICIENTES)
 
     def __str__(self):
         return f'Mesa {self.mesa} - cat {self.categoria} (id {self.id})'
 
 
+class IdentificacionesEnCircuito(models.Model):
+    """
+    Cantidad de mesa-categorías de un circuito para una categoría (`total`) y cuántas de ellas
+    ya fueron identificadas (`identificadas`), para calcular el orden de llegada y el percentil
+    de una nueva identificación sin contar las mesa-categorías del circuito cada vez.
+
+    Los contadores se crean la primera vez que se necesitan, contando en la base. Cuando
+    cambian las mesa-categorías del circuito se borran, para que se vuelvan a contar.
+    """
+    circuito = models.ForeignKey(Circuito, on_delete=models.CASCADE, related_name='identificaciones')
+    categoria = models.ForeignKey('Categoria', on_delete=models.CASCADE, related_name='identificaciones_en_circuitos')
+    total = models.PositiveIntegerField(default=0)
+    identificadas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('circuito', 'categoria')
+        verbose_name = 'Identificaciones en circuito'
+        verbose_name_plural = 'Identificaciones en circuitos'
+
+    @classmethod
+    def bloquear(cls, id_circuito, id_categoria):
+        """
+        Devuelve el contador del circuito y la categoría bloqueado hasta el final de la transacción
+        en curso, creándolo si todavía no existe.
+        """
+        contadores = cls.objects.select_for_update().filter(circuito_id=id_circuito, categoria_id=id_categoria)
+        contador = contadores.first()
+        if contador is None:
+            en_circuito = MesaCategoria.objects.filter(categoria_id=id_categoria, mesa__circuito_id=id_circuito)
+            cls.objects.get_or_create(
+                circuito_id=id_circuito,
+                categoria_id=id_categoria,
+                defaults=dict(
+                    total=en_circuito.count(),
+                    identificadas=en_circuito.filter(
+                        orden_de_llegada__isnull=False
+                    ).exclude(mesa__attachments=None).count(),
+                )
+            )
+            contador = contadores.get()
+        return contador
+
+    @classmethod
+    def descontar_identificadas(cls, id_circuito, ids_categorias):
+        """
+        Resta una identificación en cada categoría indicada del circuito.
+        """
+        cls.objects.filter(
+            circuito_id=id_circuito, categoria_id__in=ids_categorias, identificadas__gt=0
+        ).update(identificadas=F('identificadas') - 1)
+
+    @classmethod
+    def invalidar(cls, ids_circuitos=None, ids_categorias=None):
+        contadores = cls.objects.all()
+        if ids_circuitos is not None:
+            contadores = contadores.filter(circuito_id__in=ids_circuitos)
+        if ids_categorias is not None:
+            contadores = contadores.filter(categoria_id__in=ids_categorias)
+        contadores.delete()
+
+    def __str__(self):
+        return f'{self.circuito} - {self.categoria}: {self.identificadas}/{self.total}'
+
+
 class Mesa(models.Model):
     """
     Define la mesa de votación que pertenece a un class:`LugarDeVotación`.
@@ -790,7 +1006,12 @@ class Mesa(models.Model):
         para que no se tengan en cuenta en el scheduling
         """
         logger.info('invalidar asignacion attachment', mesa=self.id)
-        for mc in MesaCategoria.objects.filter(mesa=self):
+        mesa_cats = MesaCategoria.objects.filter(mesa=self)
+        IdentificacionesEnCircuito.descontar_identificadas(
+            self.circuito_id,
+            mesa_cats.filter(orden_de_llegada__isnull=False).values_list('categoria_id', flat=True)
+        )
+        for mc in mesa_cats:
             mc.coeficiente_para_orden_de_carga = None
             mc.percentil = None
             mc.orden_de_llegada = None
@@ -915,33 +1136,43 @@ class Opcion(models.Model):
     def opciones_no_partidarias_obligatorias(cls):
         return ['OPCION_BLANCOS', 'OPCION_TOTAL_VOTOS', 'OPCION_NULOS']
 
+    @classmethod
+    def especial(cls, nombre_setting):
+        """
+        Devuelve la opción definida por settings.<nombre_setting> (OPCION_BLANCOS, etc.),
+        desde los datos de referencia del proceso.
+        """
+        from elecciones.referencias import DatosDeReferencia
+
+        return DatosDeReferencia.vigentes().opcion_especial(nombre_setting)
+
     @classmethod
     def blancos(cls):
-        return cls.objects.get(**settings.OPCION_BLANCOS)
+        return cls.especial('OPCION_BLANCOS')
 
     @classmethod
     def total_votos(cls):
-        return cls.objects.get(**settings.OPCION_TOTAL_VOTOS)
+        return cls.especial('OPCION_TOTAL_VOTOS')
 
     @classmethod
     def nulos(cls):
-        return cls.objects.get(**settings.OPCION_NULOS)
+        return cls.especial('OPCION_NULOS')
 
     @classmethod
     def sobres(cls):
-        return cls.objects.get(**settings.OPCION_TOTAL_SOBRES)
+        return cls.especial('OPCION_TOTAL_SOBRES')
 
     @classmethod
     def recurridos(cls):
-        return cls.objects.get(**settings.OPCION_RECURRIDOS)
+        return cls.especial('OPCION_RECURRIDOS')
 
     @classmethod
     def id_impugnada(cls):
-        return cls.objects.get(**settings.OPCION_ID_IMPUGNADA)
+        return cls.especial('OPCION_ID_IMPUGNADA')
 
     @classmethod
     def comando_electoral(cls):
-        return cls.objects.get(**settings.OPCION_COMANDO_ELECTORAL)
+        return cls.especial('OPCION_COMANDO_ELECTORAL')
 
     def __str__(self):
         if self.partido:
@@ -1085,6 +1316,15 @@ class Categoria(models.Model):
             qs = qs.exclude(categoriaopcion__opcion__tipo=Opcion.TIPOS.metadata_optativa)
         return qs.distinct().order_by('categoriaopcion__orden')
 
+    def opciones_actuales_cacheadas(self, solo_prioritarias=False, excluir_optativas=False):
+        """
+        Igual que :meth:`opciones_actuales` pero como lista y desde los datos de referencia
+        del proceso, sin consultar la base. Las opciones traen su partido.
+        """
+        from elecciones.referencias import DatosDeReferencia
+
+        return DatosDeReferencia.vigentes().opciones_de_categoria(self.id, solo_prioritarias, excluir_optativas)
+
     @classmethod
     def para_mesas(cls, mesas):
         """
@@ -1214,10 +1454,75 @@ class Carga(TimeStampedModel):
         # Si ya hay firma y no están forzando, listo.
         if self.firma and not forzar:
             return
-        tuplas = (f'{o}-{v}' for (o, v) in self.opcion_votos().order_by('opcion__id'))
-        self.firma = '|'.join(tuplas)
+        self.firma = self.calcular_firma(self.opcion_votos())
         self.save(update_fields=['firma'])
 
+    @staticmethod
+    def calcular_firma(opcion_votos):
+        """
+        Calcula la firma (ver :meth:`actualizar_firma`) a partir de pares (id_opcion, votos).
+        """
+        return '|'.join(f'{o}-{v}' for (o, v) in sorted(opcion_votos))
+
+    @classmethod
+    def actualizar_firmas_en_lote(cls, cargas, forzar=False):
+        """
+        Equivalente a :meth:`actualizar_firma` para una lista de cargas: lee los votos reportados de
+        todas las que no tienen firma en un único query y las guarda con un bulk_update.
+        """
+        sin_firma = {carga.id: carga for carga in cargas if forzar or not carga.firma}
+        if not sin_firma:
+            return
+
+        opcion_votos = defaultdict(list)
+        for carga_id, opcion_id, votos in VotoMesaReportado.objects.filter(
+            carga_id__in=sin_firma.keys()
+        ).values_list('carga_id', 'opcion_id', 'votos'):
+            opcion_votos[carga_id].append((opcion_id, votos))
+
+        for carga in sin_firma.values():
+            carga.firma = cls.calcular_firma(opcion_votos[carga.id])
+        cls.objects.bulk_update(sin_firma.values(), ['firma'])
+
+    def guardar_con_votos(self, reportados):
+        """
+        Graba la carga junto con sus votos reportados (instancias de :py:class:`VotoMesaReportado`
+        todavía no grabadas), calculando la firma a partir de ellos para que la consolidación
+        no tenga que volver a leerlos.
+
+        Tiene que invocarse dentro de una transacción para que la firma y los votos queden
+        grabados juntos.
+        """
+        self.firma = self.calcular_firma((reportado.opcion_id, reportado.votos) for reportado in reportados)
+        self.save()
+        for reportado in reportados:
+            reportado.carga = self
+        VotoMesaReportado.objects.bulk_create(reportados)
+
+    @classmethod
+    def guardar_en_lote(cls, cargas_con_votos):
+        """
+        Equivalente a :meth:`guardar_con_votos` para una lista de pares (carga, reportados):
+        graba todas las cargas y todos sus votos con dos bulk_create.
+
+        bulk_create no pasa por :meth:`save` ni emite post_save, así que acá se marcan
+        las cargas de fiscales troll y quien llame tiene que avisar la novedad al consolidador.
+        También tiene que invocarse dentro de una transacción.
+        """
+        for carga, reportados in cargas_con_votos:
+            carga.firma = cls.calcular_firma((reportado.opcion_id, reportado.votos) for reportado in reportados)
+            if carga.fiscal is not None and carga.fiscal.troll:
+                carga.invalidada = True
+                carga.procesada = True
+        cls.objects.bulk_create([carga for carga, _ in cargas_con_votos])
+
+        todos_los_reportados = []
+        for carga, reportados in cargas_con_votos:
+            for reportado in reportados:
+                reportado.carga = carga
+            todos_los_reportados.extend(reportados)
+        VotoMesaReportado.objects.bulk_create(todos_los_reportados)
+
     def opcion_votos(self):
         """
         Devuelve una lista de los votos para cada opción.
@@ -1279,6 +1584,362 @@ class VotoMesaReportado(models.Model):
         return f"{self.carga} - {self.opcion}: {self.votos}"
 
 
+class VotoMesaTestigo(models.Model):
+    """
+    Denormalización de los votos de la carga testigo de cada :py:class:`MesaCategoria`.
+
+    Hay una instancia por cada opción reportada en la carga testigo, con una copia del status
+    de la mesa-categoría y de su ubicación geográfica. Así el cómputo de resultados agrega
+    votos sin recorrer VotoMesaReportado -> Carga -> MesaCategoria -> Mesa -> Circuito -> ...
+
+    Se mantiene desde :py:meth:`MesaCategoria.actualizar_status`.
+    """
+    mesa_categoria = models.ForeignKey(MesaCategoria, related_name='votos_testigo', on_delete=models.CASCADE)
+    carga = models.ForeignKey(Carga, related_name='votos_testigo', on_delete=models.CASCADE)
+    categoria = models.ForeignKey(Categoria, related_name='+', on_delete=models.CASCADE)
+    status = models.CharField(max_length=100, choices=MesaCategoria.STATUS)
+    opcion = models.ForeignKey(Opcion, related_name='+', on_delete=models.CASCADE)
+    votos = models.PositiveIntegerField()
+
+    # Copia de la ubicación de la mesa.
+    mesa = models.ForeignKey(Mesa, related_name='+', on_delete=models.CASCADE)
+    lugar_votacion = models.ForeignKey(
+        LugarVotacion, related_name='+', null=True, blank=True, on_delete=models.SET_NULL
+    )
+    circuito = models.ForeignKey(Circuito, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    seccion = models.ForeignKey(Seccion, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    seccion_politica = models.ForeignKey(
+        SeccionPolitica, related_name='+', null=True, blank=True, on_delete=models.SET_NULL
+    )
+    distrito = models.ForeignKey(Distrito, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        unique_together = ('mesa_categoria', 'opcion')
+        verbose_name = 'Voto testigo'
+        verbose_name_plural = 'Votos testigo'
+        indexes = [
+            models.Index(fields=['categoria', 'status', 'opcion'], name='voto_testigo_cat_status'),
+        ]
+
+    def __str__(self):
+        return f"{self.mesa_categoria} - {self.opcion}: {self.votos}"
+
+    @classmethod
+    @transaction.atomic
+    def regenerar_todos(cls, tamanio_lote=1000):
+        """
+        Reconstruye desde cero los votos testigo de todas las MesaCategoria con carga testigo,
+        de a lotes de `tamanio_lote` mesa-categorías.
+        """
+        cls.objects.all().delete()
+        mesa_categorias = list(MesaCategoria.objects.filter(carga_testigo__isnull=False).order_by('id'))
+        for inicio in range(0, len(mesa_categorias), tamanio_lote):
+            cls.regenerar(mesa_categorias[inicio:inicio + tamanio_lote])
+
+    @classmethod
+    def regenerar(cls, mesa_categorias):
+        """
+        Reconstruye las instancias de las MesaCategoria dadas a partir de los votos reportados
+        en sus cargas testigo actuales, con una cantidad fija de queries.
+
+        Devuelve un diccionario id de MesaCategoria -> {id de opción: votos}.
+        """
+        if not mesa_categorias:
+            return {}
+        cls.objects.filter(mesa_categoria__in=mesa_categorias).delete()
+
+        con_testigo = [mesa_categoria for mesa_categoria in mesa_categorias if mesa_categoria.carga_testigo_id]
+        mesas = Mesa.objects.select_related('circuito__seccion').in_bulk(
+            [mesa_categoria.mesa_id for mesa_categoria in con_testigo]
+        )
+        votos_por_carga = defaultdict(dict)
+        for carga_id, opcion_id, votos in VotoMesaReportado.objects.filter(
+            carga_id__in=[mesa_categoria.carga_testigo_id for mesa_categoria in con_testigo]
+        ).values_list('carga_id', 'opcion_id', 'votos'):
+            votos_por_carga[carga_id][opcion_id] = votos
+
+        nuevos = []
+        for mesa_categoria in con_testigo:
+            mesa = mesas[mesa_categoria.mesa_id]
+            circuito = mesa.circuito
+            seccion = circuito.seccion if circuito else None
+            for opcion_id, votos in votos_por_carga[mesa_categoria.carga_testigo_id].items():
+                nuevos.append(cls(
+                    mesa_categoria=mesa_categoria,
+                    carga_id=mesa_categoria.carga_testigo_id,
+                    categoria_id=mesa_categoria.categoria_id,
+                    status=mesa_categoria.status,
+                    opcion_id=opcion_id,
+                    votos=votos,
+                    mesa=mesa,
+                    lugar_votacion_id=mesa.lugar_votacion_id,
+                    circuito=circuito,
+                    seccion=seccion,
+                    seccion_politica_id=seccion.seccion_politica_id if seccion else None,
+                    distrito_id=seccion.distrito_id if seccion else None,
+                ))
+        cls.objects.bulk_create(nuevos)
+
+        return {
+            mesa_categoria.id: dict(votos_por_carga[mesa_categoria.carga_testigo_id])
+            if mesa_categoria.carga_testigo_id else {}
+            for mesa_categoria in mesa_categorias
+        }
+
+
+# Campo de VotoMesaTestigo con la unidad de cada nivel de agregación.
+CAMPO_VOTO_TESTIGO_POR_NIVEL_DE_AGREGACION = {
+    NIVELES_DE_AGREGACION.distrito: 'distrito',
+    NIVELES_DE_AGREGACION.seccion_politica: 'seccion_politica',
+    NIVELES_DE_AGREGACION.seccion: 'seccion',
+    NIVELES_DE_AGREGACION.circuito: 'circuito',
+    NIVELES_DE_AGREGACION.lugar_de_votacion: 'lugar_votacion',
+    NIVELES_DE_AGREGACION.mesa: 'mesa',
+}
+
+
+# Niveles geográficos para los que se mantienen resultados agregados, con el camino
+# desde Mesa hasta el id de la unidad correspondiente.
+NIVELES_DE_RESULTADOS_AGREGADOS = {
+    NIVELES_DE_AGREGACION.circuito: 'circuito_id',
+    NIVELES_DE_AGREGACION.seccion: 'circuito__seccion_id',
+    NIVELES_DE_AGREGACION.seccion_politica: 'circuito__seccion__seccion_politica_id',
+    NIVELES_DE_AGREGACION.distrito: 'circuito__seccion__distrito_id',
+}
+
+
+class ResultadoAgregado(models.Model):
+    """
+    Acumulado de resultados de una categoría en una unidad geográfica (circuito, sección,
+    sección política o distrito) para un tipo de agregación y unas opciones a considerar.
+
+    Guarda la cantidad de mesas escrutadas y sus electores; los votos por opción están en
+    :py:class:`VotoAgregado`. No se recalcula: cada vez que una MesaCategoria cambia de status
+    o de carga testigo se le aplica la diferencia (ver :py:meth:`aplicar_cambios`).
+
+    El total país se obtiene sumando las instancias de nivel distrito.
+    """
+    categoria = models.ForeignKey('Categoria', related_name='+', on_delete=models.CASCADE)
+    tipo_de_agregacion = models.CharField(max_length=30, choices=TIPOS_DE_AGREGACIONES)
+    opciones_a_considerar = models.CharField(max_length=30, choices=OPCIONES_A_CONSIDERAR)
+    nivel_de_agregacion = models.CharField(max_length=30, choices=NIVELES_DE_AGREGACION)
+    id_unidad = models.BigIntegerField()
+    mesas_escrutadas = models.IntegerField(default=0)
+    electores_en_mesas_escrutadas = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('categoria', 'tipo_de_agregacion', 'opciones_a_considerar', 'nivel_de_agregacion', 'id_unidad')
+        verbose_name = 'Resultado agregado'
+        verbose_name_plural = 'Resultados agregados'
+
+    def __str__(self):
+        return (
+            f'{self.categoria} - {self.tipo_de_agregacion}/{self.opciones_a_considerar} - '
+            f'{self.nivel_de_agregacion} {self.id_unidad}'
+        )
+
+    @classmethod
+    def aportes(cls, estado):
+        """
+        Dado el estado de una MesaCategoria como tupla (status, votos por opción), o None si no
+        tiene carga testigo, devuelve las combinaciones (tipo_de_agregacion, opciones_a_considerar)
+        en las que esa MesaCategoria cuenta como escrutada, junto con sus votos.
+        """
+        if estado is None:
+            return {}
+        status, votos = estado
+        return {
+            combinacion: votos
+            for combinacion, status_a_considerar in MesaCategoria.status_por_tipo_de_agregacion.items()
+            if status in status_a_considerar
+        }
+
+    @classmethod
+    def diferencia(cls, antes, despues):
+        """
+        Devuelve, para cada combinación (tipo_de_agregacion, opciones_a_considerar) afectada, la
+        diferencia de mesas escrutadas y de votos por opción entre los estados `antes` y `despues`,
+        con el formato que recibe :py:meth:`aportes`.
+        """
+        aportes_antes = cls.aportes(antes)
+        aportes_despues = cls.aportes(despues)
+
+        diferencias = {}
+        for combinacion in set(aportes_antes) | set(aportes_despues):
+            mesas = int(combinacion in aportes_despues) - int(combinacion in aportes_antes)
+            votos = defaultdict(int)
+            for opcion_id, cantidad in aportes_despues.get(combinacion, {}).items():
+                votos[opcion_id] += cantidad
+            for opcion_id, cantidad in aportes_antes.get(combinacion, {}).items():
+                votos[opcion_id] -= cantidad
+            votos = {opcion_id: cantidad for opcion_id, cantidad in votos.items() if cantidad}
+            if mesas or votos:
+                diferencias[combinacion] = (mesas, votos)
+        return diferencias
+
+    @classmethod
+    def aplicar_cambios(cls, cambios):
+        """
+        Recibe una lista de tuplas (mesa_categoria, antes, despues) y aplica a los resultados agregados
+        de cada mesa (a todo nivel) la diferencia entre el estado `antes` y el estado `despues`.
+
+        Se hacen dos upserts (uno de acumulados y otro de votos), independientemente de la cantidad
+        de MesaCategoria, niveles y opciones. Las filas se actualizan en un orden fijo para evitar
+        deadlocks entre consolidadores concurrentes.
+        """
+        diferencias = [
+            (mesa_categoria, cls.diferencia(antes, despues)) for mesa_categoria, antes, despues in cambios
+        ]
+        diferencias = [(mesa_categoria, diferencia) for mesa_categoria, diferencia in diferencias if diferencia]
+        if not diferencias:
+            return
+
+        ubicaciones = {
+            ubicacion['id']: ubicacion
+            for ubicacion in Mesa.objects.filter(
+                id__in=[mesa_categoria.mesa_id for mesa_categoria, _ in diferencias]
+            ).values('id', 'electores', *NIVELES_DE_RESULTADOS_AGREGADOS.values())
+        }
+
+        acumulados = defaultdict(lambda: [0, 0])
+        votos = defaultdict(int)
+        for mesa_categoria, diferencia in diferencias:
+            ubicacion = ubicaciones[mesa_categoria.mesa_id]
+            for nivel, campo in NIVELES_DE_RESULTADOS_AGREGADOS.items():
+                if ubicacion[campo] is None:
+                    continue
+                for (tipo, opciones), (mesas, votos_por_opcion) in diferencia.items():
+                    clave = (mesa_categoria.categoria_id, tipo, opciones, nivel, ubicacion[campo])
+                    acumulados[clave][0] += mesas
+                    acumulados[clave][1] += mesas * (ubicacion['electores'] or 0)
+                    for opcion_id, cantidad in votos_por_opcion.items():
+                        votos[(clave, opcion_id)] += cantidad
+
+        ids = cls._upsert_acumulados(sorted(
+            (*clave, mesas, electores) for clave, (mesas, electores) in acumulados.items()
+        ))
+        VotoAgregado._upsert(sorted(
+            (ids[clave], opcion_id, cantidad) for (clave, opcion_id), cantidad in votos.items() if cantidad
+        ))
+
+    @classmethod
+    def _upsert_acumulados(cls, filas):
+        """
+        Suma las filas (categoria_id, tipo, opciones, nivel, id_unidad, mesas, electores) a los
+        acumulados existentes, creándolos si hace falta.
+        Devuelve un diccionario (categoria_id, tipo, opciones, nivel, id_unidad) -> id del ResultadoAgregado.
+        """
+        # Pasa si ninguna de las mesas tiene ubicación geográfica: no hay nada que acumular.
+        if not filas:
+            return {}
+        tabla = cls._meta.db_table
+        valores = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(filas))
+        sql = f"""
+            INSERT INTO {tabla} (
+                categoria_id, tipo_de_agregacion, opciones_a_considerar, nivel_de_agregacion, id_unidad,
+                mesas_escrutadas, electores_en_mesas_escrutadas
+            )
+            VALUES {valores}
+            ON CONFLICT (categoria_id, tipo_de_agregacion, opciones_a_considerar, nivel_de_agregacion, id_unidad)
+            DO UPDATE SET
+                mesas_escrutadas = {tabla}.mesas_escrutadas + EXCLUDED.mesas_escrutadas,
+                electores_en_mesas_escrutadas = (
+                    {tabla}.electores_en_mesas_escrutadas + EXCLUDED.electores_en_mesas_escrutadas
+                )
+            RETURNING id, categoria_id, tipo_de_agregacion, opciones_a_considerar, nivel_de_agregacion, id_unidad
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [valor for fila in filas for valor in fila])
+            return {tuple(clave): id_resultado for id_resultado, *clave in cursor.fetchall()}
+
+    @classmethod
+    @transaction.atomic
+    def regenerar(cls):
+        """
+        Reconstruye desde cero todos los resultados agregados a partir de las MesaCategoria
+        con carga testigo y de :py:class:`VotoMesaTestigo`, que debe estar al día.
+        """
+        cls.objects.all().delete()
+
+        for (tipo, opciones), status_a_considerar in MesaCategoria.status_por_tipo_de_agregacion.items():
+            for nivel, campo in NIVELES_DE_RESULTADOS_AGREGADOS.items():
+                acumulados = MesaCategoria.objects.filter(
+                    carga_testigo__isnull=False,
+                    status__in=status_a_considerar,
+                    **{f'mesa__{campo}__isnull': False}
+                ).values_list('categoria_id', f'mesa__{campo}').annotate(
+                    mesas=Count('id'),
+                    electores=Sum('mesa__electores'),
+                ).order_by()
+
+                resultados = cls.objects.bulk_create([
+                    cls(
+                        categoria_id=categoria_id,
+                        tipo_de_agregacion=tipo,
+                        opciones_a_considerar=opciones,
+                        nivel_de_agregacion=nivel,
+                        id_unidad=id_unidad,
+                        mesas_escrutadas=mesas,
+                        electores_en_mesas_escrutadas=electores or 0,
+                    )
+                    for categoria_id, id_unidad, mesas, electores in acumulados
+                ])
+                ids = {(resultado.categoria_id, resultado.id_unidad): resultado.id for resultado in resultados}
+
+                campo_voto = CAMPO_VOTO_TESTIGO_POR_NIVEL_DE_AGREGACION[nivel]
+                votos = VotoMesaTestigo.objects.filter(
+                    status__in=status_a_considerar,
+                    **{f'{campo_voto}__isnull': False}
+                ).values_list('categoria_id', campo_voto, 'opcion_id').annotate(
+                    votos_sumados=Sum('votos')
+                ).order_by()
+
+                VotoAgregado.objects.bulk_create([
+                    VotoAgregado(
+                        resultado_id=ids[(categoria_id, id_unidad)],
+                        opcion_id=opcion_id,
+                        votos=votos_sumados,
+                    )
+                    for categoria_id, id_unidad, opcion_id, votos_sumados in votos
+                ])
+
+
+class VotoAgregado(models.Model):
+    """
+    Votos acumulados de una opción en un :py:class:`ResultadoAgregado`.
+    """
+    resultado = models.ForeignKey(ResultadoAgregado, related_name='votos', on_delete=models.CASCADE)
+    opcion = models.ForeignKey(Opcion, related_name='+', on_delete=models.CASCADE)
+    votos = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('resultado', 'opcion')
+        verbose_name = 'Voto agregado'
+        verbose_name_plural = 'Votos agregados'
+
+    def __str__(self):
+        return f"{self.resultado} - {self.opcion}: {self.votos}"
+
+    @classmethod
+    def _upsert(cls, filas):
+        """
+        Suma las filas (resultado_id, opcion_id, votos) a los votos acumulados existentes,
+        creándolos si hace falta.
+        """
+        if not filas:
+            return
+        tabla = cls._meta.db_table
+        valores = ', '.join(['(%s, %s, %s)'] * len(filas))
+        sql = f"""
+            INSERT INTO {tabla} (resultado_id, opcion_id, votos)
+            VALUES {valores}
+            ON CONFLICT (resultado_id, opcion_id)
+            DO UPDATE SET votos = {tabla}.votos + EXCLUDED.votos
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [valor for fila in filas for valor in fila])
+
+
 class TecnicaProyeccion(models.Model):
     """
     Representa una estrategia para agrupar circuitos para hacer proyecciones.
@@ -1368,6 +2029,95 @@ class ConfiguracionComputoDistrito(models.Model):
         return self.configuracion.fiscal
 
 
+class SnapshotDeResultados(models.Model):
+    """
+    Foto de los resultados de una categoría según una :py:class:`ConfiguracionComputo`
+    en un momento dado, para poder servir los últimos resultados y su evolución en el tiempo
+    sin tocar las tablas de votos.
+
+    Los snapshots sólo se agregan (nunca se modifican) y se numeran con una versión creciente
+    por categoría y configuración. Los votos se guardan en forma columnar: un array de ids
+    de opción y otro de votos para las opciones partidarias, y lo mismo por nombre corto para
+    las no partidarias.
+    """
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='snapshots')
+    configuracion = models.ForeignKey(ConfiguracionComputo, on_delete=models.CASCADE, related_name='snapshots')
+    version = models.PositiveIntegerField()
+    momento = models.DateTimeField(default=timezone.now)
+
+    total_mesas = models.PositiveIntegerField(default=0)
+    total_mesas_escrutadas = models.PositiveIntegerField(default=0)
+    electores = models.PositiveIntegerField(default=0)
+    electores_en_mesas_escrutadas = models.PositiveIntegerField(default=0)
+
+    opciones = ArrayField(models.PositiveIntegerField(), default=list)
+    votos = ArrayField(models.IntegerField(), default=list)
+    opciones_no_positivas = ArrayField(models.CharField(max_length=20), default=list)
+    votos_no_positivos = ArrayField(models.IntegerField(), default=list)
+
+    class Meta:
+        verbose_name = 'Snapshot de resultados'
+        verbose_name_plural = 'Snapshots de resultados'
+        unique_together = ('categoria', 'configuracion', 'version')
+        ordering = ('categoria', 'configuracion', 'version')
+
+    def __str__(self):
+        return f'Snapshot {self.version} de {self.categoria} ({self.configuracion}) - {self.momento}'
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Los snapshots de resultados no se modifican.')
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def tomar(cls, categoria, configuracion):
+        """
+        Calcula los resultados de la categoría según la configuración y los guarda como
+        un nuevo snapshot.
+        """
+        from elecciones.proyecciones import create_sumarizador
+
+        datos = create_sumarizador(configuracion_combinada=configuracion).get_resultados(categoria).data()
+        votos_por_opcion = sorted(
+            (opcion.id, votos or 0)
+            for votos_partido in datos['votos_positivos'].values()
+            for opcion, votos in votos_partido.items()
+        )
+        no_positivos = sorted(datos['votos_no_positivos'].items())
+
+        with transaction.atomic():
+            # Bloqueo la configuración para que dos procesos no tomen la misma versión.
+            ConfiguracionComputo.objects.select_for_update().get(id=configuracion.id)
+            ultima_version = cls.objects.filter(
+                categoria=categoria, configuracion=configuracion
+            ).aggregate(v=models.Max('version'))['v'] or 0
+            return cls.objects.create(
+                categoria=categoria,
+                configuracion=configuracion,
+                version=ultima_version + 1,
+                total_mesas=datos['total_mesas'],
+                total_mesas_escrutadas=datos['total_mesas_escrutadas'],
+                electores=datos['electores'],
+                electores_en_mesas_escrutadas=datos['electores_en_mesas_escrutadas'],
+                opciones=[id_opcion for id_opcion, _ in votos_por_opcion],
+                votos=[votos for _, votos in votos_por_opcion],
+                opciones_no_positivas=[nombre for nombre, _ in no_positivos],
+                votos_no_positivos=[votos or 0 for _, votos in no_positivos],
+            )
+
+    @classmethod
+    def ultimo(cls, categoria, configuracion):
+        return cls.objects.filter(
+            categoria=categoria, configuracion=configuracion
+        ).order_by('-version').first()
+
+    def votos_por_opcion(self):
+        return dict(zip(self.opciones, self.votos))
+
+    def votos_no_positivos_por_opcion(self):
+        return dict(zip(self.opciones_no_positivas, self.votos_no_positivos))
+
+
 class CargaOficialControl(models.Model):
     """
     Este modelo se agrega para guardar la fecha y hora del último registro de
@@ -1426,6 +2176,73 @@ def actualizar_prioridades_categoria(sender, instance, created, **kwargs):
         MesaCategoria.recalcular_coeficiente_para_orden_de_carga_para_categoria(instance)
 
 
+@receiver(post_save, sender=CategoriaGeneral)
+def generar_miniaturas_foto_ejemplo(sender, instance, **kwargs):
+    from adjuntos.miniaturas import encolar_miniaturas
+
+    encolar_miniaturas(instance, 'foto_ejemplo')
+
+
+@receiver(post_save, sender=AgrupacionCircuitos)
+@receiver(post_delete, sender=AgrupacionCircuitos)
+@receiver(post_save, sender=AgrupacionCircuito)
+@receiver(post_delete, sender=AgrupacionCircuito)
+@receiver(m2m_changed, sender=AgrupacionCircuitos.circuitos.through)
+def invalidar_indice_de_agrupaciones(sender, **kwargs):
+    from elecciones.proyecciones import IndiceDeAgrupaciones
+
+    IndiceDeAgrupaciones.invalidar()
+
+
+@receiver(post_save, sender=Opcion)
+@receiver(post_delete, sender=Opcion)
+@receiver(post_save, sender=Partido)
+@receiver(post_delete, sender=Partido)
+@receiver(post_save, sender=CategoriaOpcion)
+@receiver(post_delete, sender=CategoriaOpcion)
+@receiver(m2m_changed, sender=CategoriaOpcion)
+def invalidar_datos_de_referencia(sender, **kwargs):
+    from elecciones.referencias import DatosDeReferencia
+
+    DatosDeReferencia.invalidar()
+
+
+@receiver(post_save, sender=MesaCategoria)
+@receiver(post_delete, sender=MesaCategoria)
+def invalidar_identificaciones_de_mesa_categoria(sender, instance, created=False, **kwargs):
+    if created or kwargs['signal'] is post_delete:
+        IdentificacionesEnCircuito.invalidar(
+            Mesa.objects.filter(id=instance.mesa_id).values('circuito_id'), [instance.categoria_id]
+        )
+
+
+@receiver(pre_delete, sender=Carga)
+def descontar_carga_testigo(sender, instance, **kwargs):
+    """
+    Al borrar una carga testigo, MesaCategoria.carga_testigo se pone en NULL con un UPDATE que
+    no pasa por actualizar_status: hay que descontar antes sus votos de los resultados agregados.
+    """
+    mesa_categorias = MesaCategoria.objects.filter(carga_testigo=instance)
+    MesaCategoria.actualizar_status_en_lote([
+        (mesa_categoria, mesa_categoria.status, None) for mesa_categoria in mesa_categorias
+    ])
+
+
+@receiver(m2m_changed, sender=Mesa.categorias.through)
+def invalidar_identificaciones_de_mesa(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Mesa.categorias.add() y compañía crean las MesaCategoria sin disparar post_save.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # `instance` es una categoría y `pk_set` tiene ids de mesas (o None si se vació la relación).
+        circuitos = None if pk_set is None else Mesa.objects.filter(id__in=pk_set).values('circuito_id')
+        IdentificacionesEnCircuito.invalidar(circuitos, [instance.id])
+    else:
+        IdentificacionesEnCircuito.invalidar([instance.circuito_id], pk_set)
+
+
 @receiver(post_save, sender=Seccion)
 def actualizar_prioridades_seccion(sender, instance, created, **kwargs):
     from scheduling.models import registrar_prioridades_seccion
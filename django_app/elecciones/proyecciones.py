@@ -1,6 +1,13 @@
-from collections import defaultdict
-from functools import lru_cache
-from django.db.models import Q, F, Sum, Subquery, Count
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import time
+
+import numpy as np
+import structlog
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum, Subquery, Count
 from .models import (
     Categoria,
     Mesa,
@@ -13,6 +20,12 @@ from .models import (
 from .resultados import ResultadoCombinado
 from .sumarizador import Sumarizador
 
+logger = structlog.get_logger(__name__)
+
+# Votos testigo de una proyección: matriz agrupaciones x opciones con la suma de votos de cada celda
+# y si la celda tenía algún voto testigo (aunque fuera cero).
+VotosPorAgrupacion = namedtuple('VotosPorAgrupacion', ['ids_agrupaciones', 'ids_opciones', 'votos', 'presentes'])
+
 
 def create_sumarizador(
     parametros_sumarizacion=None,
@@ -51,6 +64,59 @@ def create_sumarizador(
     ) if tecnica_de_proyeccion else Sumarizador(*parametros_sumarizacion)
 
 
+class IndiceDeAgrupaciones:
+    """
+    Índice de las agrupaciones de circuitos de una técnica de proyección para una categoría:
+    a qué agrupación pertenece cada circuito y cuántas mesas de la categoría tiene cada agrupación.
+
+    Se construye una vez por proceso y se reutiliza hasta que cambien las agrupaciones
+    (ver la señal invalidar_indice_de_agrupaciones en models.py) o pasen
+    settings.TTL_INDICE_AGRUPACIONES segundos, para que los demás procesos también se enteren.
+    """
+    cache = {}
+
+    def __init__(self, tecnica, categoria):
+        self.agrupaciones = {
+            agrupacion.id: agrupacion
+            for agrupacion in AgrupacionCircuitos.objects.filter(proyeccion=tecnica).order_by('id')
+        }
+        self.agrupacion_de_circuito = dict(
+            AgrupacionCircuito.objects.filter(
+                agrupacion__proyeccion=tecnica
+            ).values_list('circuito_id', 'agrupacion_id')
+        )
+        self.con_circuitos = set(self.agrupacion_de_circuito.values())
+
+        cant_mesas_por_circuito = MesaCategoria.objects.filter(categoria=categoria).values_list(
+            'mesa__circuito'
+        ).annotate(cant_mesas=Count('mesa__circuito'))
+        self.total_mesas = self.por_agrupacion(dict(cant_mesas_por_circuito))
+        self.creado = time.monotonic()
+
+    def por_agrupacion(self, cant_por_circuito):
+        """
+        Suma por agrupación un diccionario id de circuito -> cantidad.
+        """
+        cant_por_agrupacion = dict.fromkeys(self.agrupaciones, 0)
+        for id_circuito, cantidad in cant_por_circuito.items():
+            id_agrupacion = self.agrupacion_de_circuito.get(id_circuito)
+            if id_agrupacion is not None:
+                cant_por_agrupacion[id_agrupacion] += cantidad
+        return cant_por_agrupacion
+
+    @classmethod
+    def para(cls, tecnica, categoria):
+        clave = (tecnica.id, categoria.id)
+        indice = cls.cache.get(clave)
+        if indice is None or time.monotonic() - indice.creado > settings.TTL_INDICE_AGRUPACIONES:
+            indice = cls.cache[clave] = cls(tecnica, categoria)
+        return indice
+
+    @classmethod
+    def invalidar(cls):
+        cls.cache.clear()
+
+
 class Proyecciones(Sumarizador):
 
     """
@@ -59,8 +125,7 @@ class Proyecciones(Sumarizador):
     def __init__(self, tecnica, *args):
         self.tecnica = tecnica
         super().__init__(*args)
-        self.cache_cant_mesas_totales_por_agrupacion = None
-        self.cache_cant_mesas_escrutadas_por_agrupacion = None
+        self.cache_cant_mesas_escrutadas_por_circuito = {}
 
     def circuito_subquery(self, id_agrupacion):
         """
@@ -85,29 +150,20 @@ class Proyecciones(Sumarizador):
             circuito__in=self.circuito_subquery(id_agrupacion)
         ).aggregate(electores=Sum('electores'))['electores']
 
+    def indice_de_agrupaciones(self):
+        return IndiceDeAgrupaciones.para(self.tecnica, self.categoria)
+
     def total_mesas(self, id_agrupacion):
         """
         Calcula el total de mesas en una agrupación de circuitos
         """
-        if self.cache_cant_mesas_totales_por_agrupacion is None:
-            self.cache_cant_mesas_totales_por_agrupacion = {
-                agrupacion.id: cant_mesas
-                for (agrupacion, cant_mesas) in self.cant_mesas_totales_por_agrupacion()
-            }
-
-        return self.cache_cant_mesas_totales_por_agrupacion[id_agrupacion]
+        return self.indice_de_agrupaciones().total_mesas[id_agrupacion]
 
     def cant_mesas_escrutadas(self, id_agrupacion):
         """
         Calcula el total de electores en las mesas escrutadas de una agrupación de circuitos
         """
-        if self.cache_cant_mesas_escrutadas_por_agrupacion is None:
-            self.cache_cant_mesas_escrutadas_por_agrupacion = {
-                agrupacion.id: cant_mesas
-                for (agrupacion, cant_mesas) in self.cant_mesas_escrutadas_por_agrupacion()
-            }
-
-        return self.cache_cant_mesas_escrutadas_por_agrupacion[id_agrupacion]
+        return self.indice_de_agrupaciones().por_agrupacion(self.cant_mesas_escrutadas_por_circuito())[id_agrupacion]
 
     def coeficiente_para_proyeccion(self, id_agrupacion):
         """
@@ -121,79 +177,62 @@ class Proyecciones(Sumarizador):
         # return self.total_electores(id_agrupacion) / self.electores_en    _mesas_escrutadas(id_agrupacion)
         return self.total_mesas(id_agrupacion) / self.cant_mesas_escrutadas(id_agrupacion)
 
-    @lru_cache(128)
     def agrupaciones_no_consideradas(self):
         """
-        Devuelve la lista de agrupaciones que fueron descartadas por no tener el mínimo de mesas exigido.
-
-        Atención: el query se realiza en realidad sobre AgrupacionCircuito, porque de otra manera la
-        many to many entre AgrupacionCircuitos y Circuito impide hacer agregaciones.
+        Devuelve la lista de agrupaciones que fueron descartadas por no tener el mínimo de mesas exigido,
+        como tuplas (nombre, mínimo de mesas, mesas escrutadas).
         """
-
-        return AgrupacionCircuito.objects.values("agrupacion").annotate(
-            mesas_escrutadas=Count(
-                "circuito__mesas",
-                filter=Q(circuito__mesas__id__in=self.mesas_escrutadas().values_list('id', flat=True))
-            )
-        ).filter(agrupacion__minimo_mesas__gt=F('mesas_escrutadas')).values_list(
-            'agrupacion__nombre', 'agrupacion__minimo_mesas', 'mesas_escrutadas'
-        )
+        return [
+            (agrupacion.nombre, agrupacion.minimo_mesas, cant_mesas)
+            for (agrupacion, cant_mesas) in self.cant_mesas_escrutadas_por_agrupacion()
+            if agrupacion.id in self.indice_de_agrupaciones().con_circuitos and cant_mesas < agrupacion.minimo_mesas
+        ]
 
     def cant_mesas_totales_por_agrupacion(self):
         """
-        Devuelve la lista de agrupaciones que se incluyen en la proyección, descartando aquellas
-        que no tienen aún el mínimo de mesas definido según la técnica de proyección.
+        Devuelve una lista de tuplas donde el primer elemento es una agrupación de circuitos y el segundo
+        la cantidad de mesas de la categoría en esa agrupación de circuitos.
         """
+        indice = self.indice_de_agrupaciones()
+        return (
+            (agrupacion, indice.total_mesas[agrupacion.id]) for agrupacion in indice.agrupaciones.values()
+        )
 
-        # Era self.mesas_a_considerar, copiado para optimizar query por MesaCategoria que es más eficiente
-        # que por mesa, la optimización podria venirle bien también al sumarizador, pero prefiero no meter
-        # ese refactor a 3 días del escrutinio.
-        mcs_a_considerar = MesaCategoria.objects.filter(categoria=self.categoria)
-
-        cant_mesas_por_circuito = dict(mcs_a_considerar.values_list('mesa__circuito').annotate(
-            cant_mesas=Count('mesa__circuito')
-        ))
+    def cant_mesas_escrutadas_por_circuito(self):
+        """
+        Devuelve un diccionario id de circuito -> cantidad de mesas escrutadas de la categoría.
+        Es el único query de mesas escrutadas de la proyección: lo comparten la cantidad de mesas escrutadas
+        por agrupación, las agrupaciones a considerar y las no consideradas.
+        """
+        if self.categoria.id not in self.cache_cant_mesas_escrutadas_por_circuito:
+            # Era self.mesas_a_considerar, copiado para optimizar query por MesaCategoria que es más eficiente
+            # que por mesa, la optimización podria venirle bien también al sumarizador, pero prefiero no meter
+            # ese refactor a 3 días del escrutinio.
+            lookups = self.lookups_de_mesas("mesa__")
+            mcs_a_considerar = MesaCategoria.objects.filter(categoria=self.categoria).filter(**lookups)
 
-        agrupaciones = AgrupacionCircuitos.objects.filter(
-            proyeccion=self.tecnica
-        ).prefetch_related('circuitos')
+            # Era self.mesas_escrutadas, copiado por el mismo motivo.
+            mcs_escrutadas = mcs_a_considerar.filter(
+                carga_testigo__isnull=False,
+                **self.cargas_a_considerar_status_filter(self.categoria, '')
+            )
 
-        return ((
-            agrupacion,
-            sum(cant_mesas_por_circuito.get(circuito.id, 0) for circuito in agrupacion.circuitos.all())
-        ) for agrupacion in agrupaciones)
+            self.cache_cant_mesas_escrutadas_por_circuito[self.categoria.id] = dict(
+                mcs_escrutadas.values_list('mesa__circuito').annotate(cant_mesas=Count('mesa__circuito'))
+            )
+        return self.cache_cant_mesas_escrutadas_por_circuito[self.categoria.id]
 
     def cant_mesas_escrutadas_por_agrupacion(self):
         """
-        Devuelve una lista de tuplas donde el primer elemento es una agrupación de circuitosy el segundo
+        Devuelve una lista de tuplas donde el primer elemento es una agrupación de circuitos y el segundo
         la cantidad de mesas escrutadas en esa agrupación de circuitos.
         """
-
-        # Era self.mesas_a_considerar, copiado para optimizar query por MesaCategoria que es más eficiente
-        # que por mesa, la optimización podria venirle bien también al sumarizador, pero prefiero no meter
-        # ese refactor a 3 días del escrutinio.
-        lookups = self.lookups_de_mesas("mesa__")
-        mcs_a_considerar = MesaCategoria.objects.filter(categoria=self.categoria).filter(**lookups)
-
-        # Era self.mesas_escrutadas, copiado por el mismo motivo.
-        mcs_escrutadas = mcs_a_considerar.filter(
-            carga_testigo__isnull=False,
-            **self.cargas_a_considerar_status_filter(self.categoria, '')
+        indice = self.indice_de_agrupaciones()
+        cant_mesas_por_agrupacion = indice.por_agrupacion(self.cant_mesas_escrutadas_por_circuito())
+        return (
+            (agrupacion, cant_mesas_por_agrupacion[agrupacion.id]) for agrupacion in indice.agrupaciones.values()
         )
 
-        cant_mesas_por_circuito = dict(mcs_escrutadas.values_list('mesa__circuito').annotate(
-            cant_mesas=Count('mesa__circuito')
-        ))
-
-        agrupaciones = AgrupacionCircuitos.objects.filter(
-            proyeccion=self.tecnica
-        ).prefetch_related('circuitos')
-
-        return ((
-            agrupacion,
-            sum(cant_mesas_por_circuito.get(circuito.id, 0) for circuito in agrupacion.circuitos.all())
-        ) for agrupacion in agrupaciones)
-
     def agrupaciones_a_considerar(self):
         """
         Devuelve la lista de agrupaciones que se incluyen en la proyección, descartando aquellas
@@ -227,80 +266,85 @@ class Proyecciones(Sumarizador):
         votos por cada una de las opciones posibles (partidarias o no). A diferencia de la superclase,
         aquí se realiza el group_by también por AgrupacionCircuitos, filtrando sólo aquellas cargas
         correspondientes a agrupaciones que llegaron al mínimo de mesas requerido.
-        """
-
-        # Get the agrupaciones to consider
-        agrupaciones_ids = list(self.agrupaciones_a_considerar())
 
-        # Create a subquery to get circuitos that belong to the agrupaciones we care about
-        circuitos_subquery = AgrupacionCircuito.objects.filter(
-            agrupacion_id__in=agrupaciones_ids
-        ).values_list('circuito_id', flat=True)
-
-        # Filter votos_reportados to only include those from circuitos in our agrupaciones
-        votos_reportados = self.votos_reportados(categoria, mesas).filter(
-            carga__mesa_categoria__mesa__circuito_id__in=Subquery(circuitos_subquery)
+        Para que sea rápido aun en distritos grandes el cómputo se hace con arrays de NumPy: los votos
+        testigo se leen como triplas (opcion, circuito, votos), cada circuito se mapea a su agrupación
+        con un array índice y se suma con bincount en una matriz agrupaciones x opciones.
+        """
+        ids_agrupaciones = np.array(sorted(self.agrupaciones_a_considerar()), dtype=np.int64)
+
+        agrupaciones_consideradas = set(ids_agrupaciones.tolist())
+        circuito_agrupacion = np.array([
+            (id_circuito, id_agrupacion)
+            for id_circuito, id_agrupacion in self.indice_de_agrupaciones().agrupacion_de_circuito.items()
+            if id_agrupacion in agrupaciones_consideradas
+        ], dtype=np.int64).reshape(-1, 2)
+        # Array índice: para cada id de circuito, la fila de su agrupación en la matriz (o -1).
+        fila_de_circuito = np.full(circuito_agrupacion[:, 0].max(initial=0) + 1, -1, dtype=np.int64)
+        fila_de_circuito[circuito_agrupacion[:, 0]] = np.searchsorted(ids_agrupaciones, circuito_agrupacion[:, 1])
+
+        votos_testigo = self.a_array(
+            self.votos_testigo(categoria).filter(
+                circuito_id__in=circuito_agrupacion[:, 0].tolist()
+            ).values_list('opcion_id', 'circuito_id', 'votos'),
+            columnas=3
+        )
+        ids_opciones, columnas = np.unique(votos_testigo[:, 0], return_inverse=True)
+        filas = fila_de_circuito[votos_testigo[:, 1]]
+
+        forma = (len(ids_agrupaciones), len(ids_opciones))
+        celdas = np.ravel_multi_index((filas, columnas.ravel()), forma) if len(filas) else filas
+        votos = np.bincount(celdas, weights=votos_testigo[:, 2], minlength=forma[0] * forma[1])
+        presentes = np.bincount(celdas, minlength=forma[0] * forma[1])
+
+        return VotosPorAgrupacion(
+            ids_agrupaciones=ids_agrupaciones,
+            ids_opciones=ids_opciones,
+            votos=votos.reshape(forma).astype(np.int64),
+            presentes=presentes.reshape(forma) > 0,
         )
 
-        # Now we need to get the agrupacion_id for each circuito
-        # We'll create a mapping of circuito_id to agrupacion_id
-        circuito_agrupacion_map = {}
-        for agrupacion_circuito in AgrupacionCircuito.objects.filter(
-            agrupacion_id__in=agrupaciones_ids
-        ):
-            circuito_agrupacion_map[agrupacion_circuito.circuito_id] = agrupacion_circuito.agrupacion_id
-
-        # Since we can't easily do this in a single SQL query with the current structure,
-        # we'll process the results in Python
-        votos_por_opcion_agrupacion = defaultdict(lambda: defaultdict(int))
-
-        for voto in votos_reportados.values_list('opcion_id', 'carga__mesa_categoria__mesa__circuito_id', 'votos'):
-            opcion_id, circuito_id, votos = voto
-            agrupacion_id = circuito_agrupacion_map.get(circuito_id)
-            if agrupacion_id:
-                votos_por_opcion_agrupacion[agrupacion_id][opcion_id] += votos
-
-        # Convert to the expected format: list of (opcion_id, agrupacion_id, sum_votos)
-        result = []
-        for agrupacion_id, opcion_votos in votos_por_opcion_agrupacion.items():
-            for opcion_id, sum_votos in opcion_votos.items():
-                result.append((opcion_id, agrupacion_id, sum_votos))
-
-        return result
-
-    def votos_por_agrupacion(self, votos_a_procesar):
+    @staticmethod
+    def a_array(values_list, columnas):
         """
-        Dada una lista de tuplas (id_opcion, id_agrupacion, sum_votos) los agrupa en un dictionary
-        con key id_agrupacion y value = lista de tuplas (id_opcion, sum_votos)
+        Convierte un values_list de enteros en un array de NumPy de `columnas` columnas
+        sin pasar por una lista de tuplas.
         """
-        votos_por_agrupacion = {}
-        for id_opcion, id_agrupacion, sum_votos in votos_a_procesar:
-            votos_por_agrupacion.setdefault(id_agrupacion, []).append((id_opcion, sum_votos))
-
-        return votos_por_agrupacion
+        valores = np.fromiter(chain.from_iterable(values_list.iterator()), dtype=np.int64)
+        return valores.reshape(-1, columnas)
 
     def agrupar_votos(self, votos_a_procesar):
+        """
+        Aplica a los votos de cada agrupación su coeficiente de proyección y suma todas las agrupaciones.
+
+        El redondeo se hace por agrupación y opción antes de sumar, igual que si se proyectara cada
+        agrupación por separado.
+        """
+        # Las agrupaciones sin votos no aportan nada, ni siquiera las opciones no partidarias en cero.
+        con_votos = votos_a_procesar.presentes.any(axis=1)
+        if not con_votos.any():
+            return {}, {}
+
         coeficientes = self.coeficientes_para_proyeccion()
+        vector_de_coeficientes = np.array(
+            [coeficientes[id_agrupacion] for id_agrupacion in votos_a_procesar.ids_agrupaciones[con_votos].tolist()],
+            dtype=np.float64
+        )
+        proyectados = np.round(votos_a_procesar.votos[con_votos] * vector_de_coeficientes[:, np.newaxis]).sum(axis=0)
+        opciones_presentes = votos_a_procesar.presentes.any(axis=0)
+
         votos_positivos_proyectados = {}
-        votos_no_positivos_proyectados = {}
-
-        for id_agrupacion, votos_de_agrupacion in self.votos_por_agrupacion(votos_a_procesar).items():
-            votos_positivos, votos_no_positivos = super().agrupar_votos(votos_de_agrupacion)
-
-            # Votos positivos
-            for partido, votos_por_opcion in votos_positivos.items():
-                votos_partido = votos_positivos_proyectados.setdefault(partido, {})
-                for opcion, votos in votos_por_opcion.items():
-                    votos_partido[opcion] = (
-                        votos_partido.setdefault(opcion, 0) + round(votos * coeficientes[id_agrupacion])
-                    )
-
-            # Votos no positivos[opcion.nombre] = sum_votos if sum_votos else 0
-            for nombre_opcion, votos in votos_no_positivos.items():
-                votos_no_positivos_proyectados[nombre_opcion] = (
-                    votos_no_positivos_proyectados.setdefault(nombre_opcion, 0) +
-                    round(votos * coeficientes[id_agrupacion])
-                )
+        votos_no_positivos_proyectados = {opcion.nombre_corto: 0 for opcion in self.opciones_no_partidarias()}
+        for id_opcion, votos, presente in zip(
+            votos_a_procesar.ids_opciones.tolist(), proyectados.tolist(), opciones_presentes.tolist()
+        ):
+            if not presente:
+                continue
+            opcion = self.get_opcion(id_opcion)
+            if opcion.partido:
+                votos_positivos_proyectados.setdefault(opcion.partido, {})[opcion] = int(votos)
+            else:
+                votos_no_positivos_proyectados[opcion.nombre_corto] = int(votos)
 
         return votos_positivos_proyectados, votos_no_positivos_proyectados
 
@@ -339,10 +383,50 @@ class SumarizadorCombinado():
         return Mesa.objects.filter(categorias=categoria).distinct()
 
     def get_resultados(self, categoria):
-        return sum((
-            create_sumarizador(configuracion_distrito=configuracion_distrito).get_resultados(categoria)
-            for configuracion_distrito in self.configuracion.configuraciones.all()
-        ), ResultadoCombinado())
+        """
+        Calcula los resultados de cada distrito según su configuración y los combina.
+
+        Los distritos son independientes entre sí, así que se calculan en paralelo en hasta
+        settings.SUMARIZADOR_COMBINADO_CONCURRENCIA threads, cada uno con su propia conexión a la base.
+        Los resultados se combinan en el mismo orden que las configuraciones.
+        """
+        configuraciones = list(self.configuracion.configuraciones.select_related('distrito', 'proyeccion'))
+        concurrencia = min(settings.SUMARIZADOR_COMBINADO_CONCURRENCIA, len(configuraciones))
+
+        if concurrencia <= 1:
+            resultados = [
+                self.resultados_de_distrito(configuracion_distrito, categoria)
+                for configuracion_distrito in configuraciones
+            ]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix='sumarizador') as ejecutor:
+                resultados = list(ejecutor.map(
+                    lambda configuracion_distrito: self.resultados_de_distrito_en_thread(
+                        configuracion_distrito, categoria
+                    ),
+                    configuraciones
+                ))
+
+        return sum(resultados, ResultadoCombinado())
+
+    def resultados_de_distrito(self, configuracion_distrito, categoria):
+        inicio = time.monotonic()
+        resultados = create_sumarizador(configuracion_distrito=configuracion_distrito).get_resultados(categoria)
+        logger.info(
+            'Resultados de distrito',
+            configuracion=self.configuracion.id,
+            distrito=configuracion_distrito.distrito_id,
+            categoria=categoria.id,
+            segundos=round(time.monotonic() - inicio, 3)
+        )
+        return resultados
+
+    def resultados_de_distrito_en_thread(self, configuracion_distrito, categoria):
+        try:
+            return self.resultados_de_distrito(configuracion_distrito, categoria)
+        finally:
+            # Cada thread abre su propia conexión; hay que cerrarla antes de que termine.
+            connections.close_all()
 
     def categorias(self):
         return Categoria.objects.filter(distrito__isnull=True, activa=True)
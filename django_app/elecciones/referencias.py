@@ -0,0 +1,119 @@
+"""
+Datos de referencia que casi no cambian durante la elección: las opciones con sus partidos
+(nombres, códigos, colores), las opciones de cada categoría en el orden del acta y las opciones
+especiales (blancos, nulos, total de votos, sobres, etc.).
+
+Cada pantalla de carga y cada sumarización los necesitan, así que se leen una vez por proceso
+en lugar de consultarlos en cada request.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from elecciones.models import Opcion, CategoriaOpcion
+
+
+def coincide(opcion, lookup):
+    """
+    Indica si la opción cumple un lookup como los de settings.OPCION_*, en memoria.
+    """
+    for campo, valor in lookup.items():
+        if campo == 'partido':
+            campo, valor = 'partido_id', getattr(valor, 'id', valor)
+        if getattr(opcion, campo) != valor:
+            return False
+    return True
+
+
+class DatosDeReferencia:
+    """
+    Se construye una vez por proceso y se reutiliza mientras no cambie la versión, que se
+    incrementa al modificar opciones, partidos o asociaciones categoría-opción (ver la señal
+    invalidar_datos_de_referencia en models.py). La versión se guarda en el cache compartido
+    settings.CACHE_DATOS_DE_REFERENCIA, así todos los procesos se enteran de los cambios; como
+    ese cache puede estar en la base, cada proceso la consulta a lo sumo una vez cada
+    settings.INTERVALO_VERSION_DATOS_DE_REFERENCIA segundos (el proceso que invalida ve los
+    cambios en el momento). Por si el cache pierde la versión, igual se reconstruyen cada
+    settings.TTL_DATOS_DE_REFERENCIA segundos.
+    """
+    CLAVE_VERSION = 'datos_de_referencia_version'
+    actual = None
+
+    def __init__(self, version=None):
+        self.version = version
+        self.opciones = {opcion.id: opcion for opcion in Opcion.objects.select_related('partido')}
+
+        # id de categoría -> [(id de opción, prioritaria)] en el orden del acta.
+        self.opciones_por_categoria = defaultdict(list)
+        asociaciones = sorted(
+            CategoriaOpcion.objects.values_list('categoria_id', 'orden', 'id', 'opcion_id', 'prioritaria'),
+            # Como en la base, los que no tienen orden van al final.
+            key=lambda asociacion: (asociacion[0], asociacion[1] is None, asociacion[1] or 0, asociacion[2])
+        )
+        for id_categoria, _, _, id_opcion, prioritaria in asociaciones:
+            self.opciones_por_categoria[id_categoria].append((id_opcion, prioritaria))
+
+        # Nombre del setting (OPCION_BLANCOS, etc.) -> opción.
+        self.especiales = {}
+        self.creado = self.version_leida = time.monotonic()
+
+    @staticmethod
+    def cache():
+        return caches[settings.CACHE_DATOS_DE_REFERENCIA]
+
+    @classmethod
+    def vigentes(cls):
+        datos = cls.actual
+        ahora = time.monotonic()
+        if datos is not None and ahora - datos.creado > settings.TTL_DATOS_DE_REFERENCIA:
+            datos = None
+        if datos is not None and ahora - datos.version_leida >= settings.INTERVALO_VERSION_DATOS_DE_REFERENCIA:
+            if cls.cache().get(cls.CLAVE_VERSION) == datos.version:
+                datos.version_leida = ahora
+            else:
+                datos = None
+        if datos is None:
+            # Se lee antes de construir: si alguien invalida mientras tanto, se reconstruye de nuevo.
+            datos = cls.actual = cls(cls.cache().get(cls.CLAVE_VERSION))
+        return datos
+
+    @classmethod
+    def invalidar(cls):
+        cache = cls.cache()
+        try:
+            cache.incr(cls.CLAVE_VERSION)
+        except ValueError:
+            # Todavía no hay versión en el cache (o se perdió).
+            if not cache.add(cls.CLAVE_VERSION, 1, timeout=None):
+                cache.incr(cls.CLAVE_VERSION)
+        cls.actual = None
+
+    def opcion_especial(self, nombre_setting):
+        """
+        Equivalente a Opcion.objects.get(**settings.<nombre_setting>).
+        """
+        opcion = self.especiales.get(nombre_setting)
+        if opcion is None:
+            lookup = getattr(settings, nombre_setting)
+            candidatas = [opcion for opcion in self.opciones.values() if coincide(opcion, lookup)]
+            if len(candidatas) != 1:
+                # Que el ORM levante DoesNotExist o MultipleObjectsReturned, como siempre.
+                return Opcion.objects.select_related('partido').get(**lookup)
+            opcion = self.especiales[nombre_setting] = candidatas[0]
+        return opcion
+
+    def opciones_de_categoria(self, id_categoria, solo_prioritarias=False, excluir_optativas=False):
+        """
+        Lista de las opciones de la categoría en el orden del acta (ver Categoria.opciones_actuales).
+        """
+        opciones = []
+        for id_opcion, prioritaria in self.opciones_por_categoria[id_categoria]:
+            opcion = self.opciones[id_opcion]
+            if solo_prioritarias and not prioritaria:
+                continue
+            if excluir_optativas and opcion.tipo == Opcion.TIPOS.metadata_optativa:
+                continue
+            opciones.append(opcion)
+        return opciones
@@ -8,6 +8,9 @@ from .models import (
     Circuito,
     Opcion,
     VotoMesaReportado,
+    VotoMesaTestigo,
+    ResultadoAgregado,
+    VotoAgregado,
     LugarVotacion,
     Categoria,
     MesaCategoria,
@@ -15,6 +18,8 @@ from .models import (
     TIPOS_DE_AGREGACIONES,
     OPCIONES_A_CONSIDERAR,
     NIVELES_DE_AGREGACION,
+    NIVELES_DE_RESULTADOS_AGREGADOS,
+    CAMPO_VOTO_TESTIGO_POR_NIVEL_DE_AGREGACION,
 )
 from .resultados import Resultados
 
@@ -66,42 +71,12 @@ class Sumarizador():
         Esta función devuelve los filtros que indican qué cargas se consideran para hacer el
         cómputo.
         """
-        lookups = dict()
-
-        if self.tipo_de_agregacion == TIPOS_DE_AGREGACIONES.solo_consolidados_doble_carga:
-            if self.opciones_a_considerar == OPCIONES_A_CONSIDERAR.todas:
-                lookups[f'{prefix}status'] = MesaCategoria.STATUS.total_consolidada_dc
-            else:
-                lookups[f'{prefix}status'] = MesaCategoria.STATUS.parcial_consolidada_dc
-
-        elif self.tipo_de_agregacion == TIPOS_DE_AGREGACIONES.solo_consolidados:
-            # Doble carga y CSV.
-            if self.opciones_a_considerar == OPCIONES_A_CONSIDERAR.todas:
-                lookups[f'{prefix}status__in'] = (
-                    MesaCategoria.STATUS.total_consolidada_dc,
-                    MesaCategoria.STATUS.total_consolidada_csv,
-                )
-            else:
-                lookups[f'{prefix}status__in'] = (
-                    MesaCategoria.STATUS.parcial_consolidada_dc,
-                    MesaCategoria.STATUS.parcial_consolidada_csv,
-                )
-
-        elif self.tipo_de_agregacion == TIPOS_DE_AGREGACIONES.todas_las_cargas:
-            if self.opciones_a_considerar == OPCIONES_A_CONSIDERAR.todas:
-                lookups[f'{prefix}status__in'] = (
-                    MesaCategoria.STATUS.total_consolidada_dc,
-                    MesaCategoria.STATUS.total_consolidada_csv,
-                    MesaCategoria.STATUS.total_sin_consolidar,
-                )
-            else:
-                lookups[f'{prefix}status__in'] = (
-                    MesaCategoria.STATUS.parcial_consolidada_dc,
-                    MesaCategoria.STATUS.parcial_consolidada_csv,
-                    MesaCategoria.STATUS.parcial_sin_consolidar,
-                )
-
-        return lookups
+        status_a_considerar = MesaCategoria.status_por_tipo_de_agregacion.get(
+            (self.tipo_de_agregacion, self.opciones_a_considerar)
+        )
+        if status_a_considerar is None:
+            return {}
+        return {f'{prefix}status__in': status_a_considerar}
 
     @property
     def filtros(self):
@@ -137,6 +112,17 @@ class Sumarizador():
                 lookups[f'{prefix}id__in'] = self.filtros
         return lookups
 
+    def lookups_de_votos_testigo(self):
+        """
+        Equivalente a :meth:`lookups_de_mesas` para filtrar instancias de VotoMesaTestigo,
+        que tienen copiada la ubicación geográfica de la mesa.
+        """
+        lookups = dict()
+        if self.filtros:
+            campo = CAMPO_VOTO_TESTIGO_POR_NIVEL_DE_AGREGACION[self.nivel_de_agregacion]
+            lookups[f'{campo}__in'] = self.ids_a_considerar
+        return lookups
+
     def categorias(self):
         """
         Devuelve la lista de categorías posibles de acuerdo al model recibido.
@@ -230,11 +216,48 @@ class Sumarizador():
 
         return votos_reportados
 
+    def votos_testigo(self, categoria):
+        """
+        Como :meth:`votos_reportados`, pero sobre la denormalización VotoMesaTestigo,
+        filtrando directamente por la ubicación geográfica copiada en cada voto.
+        """
+        return VotoMesaTestigo.objects.filter(
+            categoria=categoria,
+            opcion__in=[opcion.id for opcion in self.opciones()],
+            **self.cargas_a_considerar_status_filter(categoria, ''),
+            **self.lookups_de_votos_testigo()
+        )
+
+    def usa_resultados_agregados(self):
+        """
+        Indica si el cómputo puede resolverse con :py:class:`ResultadoAgregado`, que existen para
+        el total país (sumando distritos) y para distritos, secciones políticas, secciones y circuitos.
+        """
+        if (self.tipo_de_agregacion, self.opciones_a_considerar) not in MesaCategoria.status_por_tipo_de_agregacion:
+            return False
+        return not self.filtros or self.nivel_de_agregacion in NIVELES_DE_RESULTADOS_AGREGADOS
+
+    def resultados_agregados(self, categoria):
+        """
+        Devuelve los ResultadoAgregado que cubren los filtros seleccionados para la categoría.
+        """
+        lookups = dict(
+            categoria=categoria,
+            tipo_de_agregacion=self.tipo_de_agregacion,
+            opciones_a_considerar=self.opciones_a_considerar,
+        )
+        if self.filtros:
+            lookups['nivel_de_agregacion'] = self.nivel_de_agregacion
+            lookups['id_unidad__in'] = self.ids_a_considerar
+        else:
+            lookups['nivel_de_agregacion'] = NIVELES_DE_AGREGACION.distrito
+        return ResultadoAgregado.objects.filter(**lookups)
+
     def opciones_dict(self):
         if self.cache_opciones is None:
             self.cache_opciones = {
                 opcion.id: opcion
-                for opcion in self.categoria.opciones_actuales(
+                for opcion in self.categoria.opciones_actuales_cacheadas(
                     solo_prioritarias=self.opciones_a_considerar == OPCIONES_A_CONSIDERAR.prioritarias,
                     excluir_optativas=True
                 )
@@ -255,23 +278,22 @@ class Sumarizador():
         """
         Obtiene el listado de votos para incluirse en una exportación CSV.
         """
-        return VotoMesaReportado.objects.filter(
-            carga__mesa_categoria__categoria=categoria,
-            carga__es_testigo__isnull=False,
-            **self.cargas_a_considerar_status_filter(categoria),
-            **self.lookups_de_mesas("carga__mesa_categoria__mesa__")
+        return VotoMesaTestigo.objects.filter(
+            categoria=categoria,
+            **self.cargas_a_considerar_status_filter(categoria, ''),
+            **self.lookups_de_votos_testigo()
         ).values_list(
-            'carga__mesa_categoria__mesa__circuito__seccion__distrito__numero',
-            'carga__mesa_categoria__mesa__circuito__seccion__numero',
-            'carga__mesa_categoria__mesa__circuito__numero',
-            'carga__mesa_categoria__mesa__numero',
+            'distrito__numero',
+            'seccion__numero',
+            'circuito__numero',
+            'mesa__numero',
             'opcion__codigo',
             'votos',
         ).order_by(
-            "carga__mesa_categoria__mesa__circuito__seccion__distrito__numero",
-            "carga__mesa_categoria__mesa__circuito__seccion__numero",
-            "carga__mesa_categoria__mesa__circuito__numero",
-            "carga__mesa_categoria__mesa__numero"
+            'distrito__numero',
+            'seccion__numero',
+            'circuito__numero',
+            'mesa__numero',
         )
 
     def votos_por_opcion(self, categoria, mesas):
@@ -280,10 +302,17 @@ class Sumarizador():
         votos por cada una de las opciones posibles (partidarias o no)
         """
 
-        # Obtener los votos reportados
-        votos_reportados = self.votos_reportados(categoria, mesas).values_list('opcion__id').annotate(
+        # Obtener los votos de las cargas testigo, ya acumulados si es posible.
+        if self.usa_resultados_agregados():
+            votos = VotoAgregado.objects.filter(
+                resultado__in=self.resultados_agregados(categoria),
+                opcion__in=[opcion.id for opcion in self.opciones()],
+            )
+        else:
+            votos = self.votos_testigo(categoria)
+        votos_reportados = votos.values_list('opcion_id').annotate(
             sum_votos=Sum('votos')
-        )
+        ).order_by()
 
         # Diccionario inicial, opciones completas, todas en 0 (por si alguna opción no viene reportada).
         votos_por_opcion = {opcion.id: 0 for opcion in self.opciones()}
@@ -324,13 +353,21 @@ class Sumarizador():
         # 1) Mesas.
         # Me quedo con las mesas que corresponden de acuerdo a los parámetros
         # y la categoría, que tengan la carga testigo para esa categoría.
-        mesas_escrutadas = self.mesas_escrutadas()
-        total_mesas_escrutadas = mesas_escrutadas.count()
         total_mesas = mesas.count()
+        if self.usa_resultados_agregados():
+            escrutadas = self.resultados_agregados(categoria).aggregate(
+                mesas=Sum('mesas_escrutadas'),
+                electores=Sum('electores_en_mesas_escrutadas'),
+            )
+            total_mesas_escrutadas = escrutadas['mesas'] or 0
+            electores_en_mesas_escrutadas = escrutadas['electores'] or 0
+        else:
+            mesas_escrutadas = self.mesas_escrutadas()
+            total_mesas_escrutadas = mesas_escrutadas.count()
+            electores_en_mesas_escrutadas = mesas_escrutadas.aggregate(v=Sum('electores'))['v'] or 0
 
         # 2) Electores.
         electores = mesas.filter(categorias=categoria).aggregate(v=Sum('electores'))['v'] or 0
-        electores_en_mesas_escrutadas = mesas_escrutadas.aggregate(v=Sum('electores'))['v'] or 0
 
         # 3) Votos
         votos_por_opcion = self.votos_por_opcion(categoria, mesas)
@@ -0,0 +1,47 @@
+from elecciones.anomalias import DetectorDeAnomalias
+from elecciones.models import Carga, CategoriaOpcion, TIPOS_DE_AGREGACIONES
+from .factories import (
+    CargaFactory,
+    CategoriaFactory,
+    CircuitoFactory,
+    MesaFactory,
+    OpcionFactory,
+    PartidoFactory,
+)
+from .test_models import consumir_novedades_y_actualizar_objetos
+from .utils import cargar_votos
+
+
+def test_detector_de_anomalias(db):
+    nosotros, ellos = PartidoFactory(), PartidoFactory()
+    o1, o2 = OpcionFactory(partido=nosotros), OpcionFactory(partido=ellos)
+    categoria = CategoriaFactory(opciones=[o1, o2])
+    CategoriaOpcion.objects.filter(categoria=categoria).update(prioritaria=True)
+
+    circuito = CircuitoFactory()
+    votos = [(100, 50), (90, 60), (110, 40), (0, 200)]
+    mesas = [MesaFactory(circuito=circuito, categorias=[categoria]) for _ in votos]
+    for mesa, (votos_nuestros, votos_ellos) in zip(mesas, votos):
+        # Dos cargas coincidentes para que la mesa quede consolidada.
+        for _ in range(2):
+            carga = CargaFactory(
+                mesa_categoria__categoria=categoria, mesa_categoria__mesa=mesa, tipo=Carga.TIPOS.parcial
+            )
+            cargar_votos(carga, {o1: votos_nuestros, o2: votos_ellos})
+    consumir_novedades_y_actualizar_objetos()
+
+    detector = DetectorDeAnomalias(categoria, nosotros, ellos, TIPOS_DE_AGREGACIONES.solo_consolidados)
+    circuitos, alertas = detector.analizar(
+        analizar_ceros=True, analizar_tendencias=True, analizar_promedio=True
+    )
+    assert circuitos == [circuito]
+
+    # La última mesa tiene cero votos nuestros, va contra la tendencia del circuito
+    # y está lejos del promedio.
+    graves = [alerta for alerta in alertas[circuito.id] if alerta.grave]
+    assert {alerta.mesa_id for alerta in graves} == {mesas[3].id}
+    assert [alerta.mensaje.split(' ')[0] for alerta in graves] == ['Fernandez', 'En', 'Mucha']
+
+    advertencias = [alerta for alerta in alertas[circuito.id] if not alerta.grave]
+    assert [alerta.mesa_id for alerta in advertencias] == [mesa.id for mesa in mesas]
+    assert advertencias[-1].mensaje.startswith('Mucha diferencia de votos con promedio (JpC = 200')
@@ -468,3 +468,26 @@ def test_avance_de_carga_mesas_con_varias_fotos(db, settings):
     identificar(attachs[10], mesas_1[2], fiscal_1)
     identificar(attachs[10], mesas_1[2], fiscal_2)
     consumir_novedades_identificacion()
+
+
+def test_avance_de_carga_cantidad_de_queries_constante(db, django_assert_max_num_queries):
+    pv = nueva_categoria(["a1", "a2"], ["b1", "b2"])
+    seccion, circuito, lugar_votacion = crear_seccion("Luján oeste")
+    [mesas] = crear_mesas([lugar_votacion], [pv], 5)
+    fiscal = nuevo_fiscal()
+    attachs = AttachmentFactory.create_batch(3)
+    for ix in range(3):
+        identificar(attachs[ix], mesas[ix], fiscal)
+    consumir_novedades_identificacion()
+    nueva_carga(mesacat(mesas[0], pv), fiscal, [50, 30], Carga.TIPOS.parcial)
+    consumir_novedades_carga()
+
+    for nivel, ids in [
+        (None, None),
+        (NIVELES_DE_AGREGACION.seccion, [seccion.id]),
+        (NIVELES_DE_AGREGACION.circuito, [circuito.id]),
+        (NIVELES_DE_AGREGACION.mesa, [mesas[0].id]),
+    ]:
+        with django_assert_max_num_queries(6):
+            resultados = AvanceDeCarga(nivel, ids).get_resultados(pv)
+            resultados.total().cantidad_mesas()
@@ -1,6 +1,7 @@
 import pytest
 from django.core.management import call_command
 from django.conf import settings
+from django.core.cache import caches
 from datetime import timedelta
 from django.utils import timezone
 from random import shuffle
@@ -21,7 +22,8 @@ from .factories import (
     DistritoFactory,
     FiscalFactory,
 )
-from elecciones.models import Mesa, MesaCategoria, Categoria, Carga, Opcion
+from elecciones.models import Mesa, MesaCategoria, Categoria, CategoriaOpcion, Carga, Opcion, VotoMesaReportado
+from elecciones.referencias import DatosDeReferencia
 from adjuntos.models import Identificacion
 from adjuntos.consolidacion import consumir_novedades_carga, consumir_novedades_identificacion
 from problemas.models import Problema, ReporteDeProblema
@@ -55,6 +57,44 @@ def test_opciones_actuales(db):
     ]
 
 
+def test_opciones_actuales_cacheadas(db, django_assert_num_queries):
+    o2 = OpcionFactory()
+    c = CategoriaFactory(opciones=[])
+    CategoriaOpcionFactory(categoria=c, orden=3, opcion=o2)
+    o1 = CategoriaOpcionFactory(categoria=c, orden=1, prioritaria=True).opcion
+
+    assert c.opciones_actuales_cacheadas() == list(c.opciones_actuales())
+    assert c.opciones_actuales_cacheadas(excluir_optativas=True) == list(c.opciones_actuales(excluir_optativas=True))
+
+    # Ya están en memoria.
+    total_votos = Opcion.objects.get(**settings.OPCION_TOTAL_VOTOS)
+    with django_assert_num_queries(0):
+        assert c.opciones_actuales_cacheadas(solo_prioritarias=True) == [o1]
+        assert Opcion.total_votos() == total_votos
+        assert c.opciones_actuales_cacheadas()[0].partido == o1.partido
+
+    # Al cambiar las opciones de la categoría se vuelven a leer.
+    o3 = CategoriaOpcionFactory(categoria=c, orden=2).opcion
+    assert c.opciones_actuales_cacheadas()[:3] == [o1, o3, o2]
+
+
+def test_opciones_actuales_cacheadas_invalidadas_por_otro_proceso(db, settings):
+    settings.INTERVALO_VERSION_DATOS_DE_REFERENCIA = 60
+    c = CategoriaFactory(opciones=[])
+    o1 = CategoriaOpcionFactory(categoria=c, orden=1).opcion
+    o2 = CategoriaOpcionFactory(categoria=c, orden=2).opcion
+    assert c.opciones_actuales_cacheadas()[:2] == [o1, o2]
+
+    # Otro proceso cambia el orden: acá no llega la señal, sólo la versión del cache compartido.
+    CategoriaOpcion.objects.filter(categoria=c, opcion=o1).update(orden=3)
+    caches[settings.CACHE_DATOS_DE_REFERENCIA].incr(DatosDeReferencia.CLAVE_VERSION)
+
+    # Hasta que pase el intervalo no se vuelve a consultar la versión.
+    assert c.opciones_actuales_cacheadas()[:2] == [o1, o2]
+    settings.INTERVALO_VERSION_DATOS_DE_REFERENCIA = 0
+    assert c.opciones_actuales_cacheadas()[:2] == [o2, o1]
+
+
 def test_categorias_para_mesa(db):
     e1, e2, e3 = CategoriaFactory.create_batch(3)
     e4 = CategoriaFactory(activa=False)
@@ -118,6 +158,19 @@ def test_carga_actualizar_firma(db):
     assert c.firma == f'{o1.id}-10|{o2.id}-8|{o3.id}-0'
 
 
+def test_carga_guardar_con_votos_calcula_la_firma(db):
+    o1, o2 = OpcionFactory(), OpcionFactory()
+    c = Carga(mesa_categoria=MesaCategoriaFactory(), tipo=Carga.TIPOS.total, fiscal=FiscalFactory())
+    c.guardar_con_votos([VotoMesaReportado(opcion=o2, votos=8), VotoMesaReportado(opcion=o1, votos=10)])
+    c.refresh_from_db()
+    assert c.firma == f'{o1.id}-10|{o2.id}-8'
+    assert set(c.opcion_votos()) == {(o1.id, 10), (o2.id, 8)}
+
+    # Da lo mismo que calcularla a partir de los votos grabados.
+    c.actualizar_firma(forzar=True)
+    assert c.firma == f'{o1.id}-10|{o2.id}-8'
+
+
 def test_firma_count(db):
     mc = MesaCategoriaFactory()
     CargaFactory(
@@ -183,6 +236,37 @@ def test_mc_status_total_desde_mc_sin_carga(db):
     assert mc.carga_testigo == c2 or mc.carga_testigo == c1
 
 
+def test_votos_testigo_acompanian_a_la_carga_testigo(db):
+    mc = MesaCategoriaFactory()
+    o1, o2 = OpcionFactory(), OpcionFactory()
+    c1 = CargaFactory(mesa_categoria=mc, tipo='total', firma='1-10')
+    VotoMesaReportadoFactory(carga=c1, opcion=o1, votos=10)
+    VotoMesaReportadoFactory(carga=c1, opcion=o2, votos=5)
+    consumir_novedades_y_actualizar_objetos([mc])
+    assert mc.carga_testigo == c1
+    votos = {v.opcion_id: v for v in mc.votos_testigo.all()}
+    assert {o: v.votos for o, v in votos.items()} == {o1.id: 10, o2.id: 5}
+    assert all(v.status == MesaCategoria.STATUS.total_sin_consolidar for v in votos.values())
+    assert all(v.circuito_id == mc.mesa.circuito_id for v in votos.values())
+
+    # Diverge: no hay más testigo, no hay más votos testigo.
+    CargaFactory(mesa_categoria=mc, tipo='total', firma='1-9')
+    consumir_novedades_y_actualizar_objetos([mc])
+    assert mc.carga_testigo is None
+    assert not mc.votos_testigo.exists()
+
+    # Coincide con c1: vuelven los votos con el nuevo status.
+    c3 = CargaFactory(mesa_categoria=mc, tipo='total', firma='1-10')
+    VotoMesaReportadoFactory(carga=c3, opcion=o1, votos=10)
+    VotoMesaReportadoFactory(carga=c3, opcion=o2, votos=5)
+    consumir_novedades_y_actualizar_objetos([mc])
+    assert mc.status == MesaCategoria.STATUS.total_consolidada_dc
+    assert set(mc.votos_testigo.values_list('votos', 'status')) == {
+        (10, MesaCategoria.STATUS.total_consolidada_dc),
+        (5, MesaCategoria.STATUS.total_consolidada_dc),
+    }
+
+
 def test_total_consolidada_multi_carga_con_minimo_1(db, settings):
     settings.MIN_COINCIDENCIAS_CARGAS = 1
     mc = MesaCategoriaFactory()
@@ -193,6 +277,48 @@ def test_total_consolidada_multi_carga_con_minimo_1(db, settings):
     assert mc.carga_testigo == c1
 
 
+@pytest.mark.parametrize('en_lote', [True, False])
+def test_consolidacion_en_lote_equivale_a_una_por_una(db, settings, en_lote):
+    settings.MIN_COINCIDENCIAS_CARGAS = 2
+    # Cada caso es una lista de cargas (tipo, firma, origen) y el índice esperado de la testigo.
+    casos = [
+        ([('parcial', '1-10', 'web')], MesaCategoria.STATUS.parcial_sin_consolidar, 0),
+        ([('parcial', '1-10', 'web'), ('parcial', '1-9', 'web')], MesaCategoria.STATUS.parcial_en_conflicto, None),
+        ([('parcial', '1-10', 'web'), ('parcial', '1-9', 'csv')], MesaCategoria.STATUS.parcial_consolidada_csv, 1),
+        (
+            [('parcial', '1-9', 'web'), ('parcial', '1-10', 'web'), ('parcial', '1-10', 'web')],
+            MesaCategoria.STATUS.parcial_consolidada_dc, 1
+        ),
+        (
+            [('parcial', '1-10', 'web'), ('total', '2-5', 'web'), ('total', '2-5', 'web')],
+            MesaCategoria.STATUS.parcial_sin_consolidar, 0
+        ),
+        (
+            [('parcial', '1-10', 'csv'), ('total', '2-5', 'web'), ('total', '2-6', 'web')],
+            MesaCategoria.STATUS.total_en_conflicto, None
+        ),
+        ([('total', '2-5', 'csv')], MesaCategoria.STATUS.total_consolidada_csv, 0),
+        ([], MesaCategoria.STATUS.sin_cargar, None),
+    ]
+    mcs_y_cargas = []
+    for cargas, _, _ in casos:
+        mc = MesaCategoriaFactory()
+        mcs_y_cargas.append((mc, [
+            CargaFactory(mesa_categoria=mc, tipo=tipo, firma=firma, origen=origen)
+            for tipo, firma, origen in cargas
+        ]))
+    # Una sin cargas no tiene novedades: la fuerzo a pasar de status.
+    mcs_y_cargas[-1][0].actualizar_status(MesaCategoria.STATUS.total_sin_consolidar, None)
+    CargaFactory(mesa_categoria=mcs_y_cargas[-1][0], tipo='total', invalidada=True)
+
+    consumir_novedades_carga(en_lote=en_lote)
+
+    for (mc, cargas), (_, status, testigo) in zip(mcs_y_cargas, casos):
+        mc.refresh_from_db()
+        assert mc.status == status
+        assert mc.carga_testigo == (cargas[testigo] if testigo is not None else None)
+
+
 def test_consolidador_desmarca_timeout(db, settings):
     mc = MesaCategoriaFactory()
     assert mc.status == MesaCategoria.STATUS.sin_cargar
@@ -204,6 +330,21 @@ def test_consolidador_desmarca_timeout(db, settings):
     assert c1.procesada is True
 
 
+def test_consolidador_por_particiones(db):
+    mcs = [MesaCategoriaFactory() for _ in range(4)]
+    cargas = [CargaFactory(mesa_categoria=mc, tipo='total', firma='1-10') for mc in mcs]
+
+    consumir_novedades_carga(particion=(0, 2))
+    for carga in cargas:
+        carga.refresh_from_db()
+        assert carga.procesada == (carga.mesa_categoria_id % 2 == 0)
+
+    consumir_novedades_carga(particion=(1, 2))
+    for carga in cargas:
+        carga.refresh_from_db()
+        assert carga.procesada
+
+
 def test_consolidador_honra_timeout(db, settings):
     settings.MIN_COINCIDENCIAS_CARGAS = 1
     mc = MesaCategoriaFactory()
@@ -2,8 +2,11 @@ from django.conf import settings
 from django.urls import reverse
 from django.contrib.auth.models import Group
 from http import HTTPStatus
+import pyarrow as pa
+import pyarrow.parquet as pq
 from elecciones.models import (
-    Categoria, MesaCategoria, Carga, Seccion, Opcion, CategoriaOpcion, OPCIONES_A_CONSIDERAR
+    Categoria, Mesa, MesaCategoria, Carga, Seccion, Opcion, CategoriaOpcion, ResultadoAgregado,
+    OPCIONES_A_CONSIDERAR, TIPOS_DE_AGREGACIONES, NIVELES_DE_AGREGACION,
 )
 
 from .factories import (
@@ -19,6 +22,7 @@ from .factories import (
     CargaFactory,
 )
 from adjuntos.models import Identificacion
+from elecciones.exportacion import exportar_parquet
 from adjuntos.consolidacion import consumir_novedades_identificacion
 from .test_models import consumir_novedades_y_actualizar_objetos
 from .utils import tecnica_proyeccion, cargar_votos
@@ -749,3 +753,142 @@ def test_categorias_sensible(setup_groups, client):
     # El usuario visualizador sensible puede ver resultado no sensible.
     response = client.get(c_url, {'opcionaConsiderar': 'todas'})
     assert response.status_code == 200
+
+
+def test_resultados_agregados_se_actualizan_con_la_consolidacion(db):
+    categoria = CategoriaFactory()
+    o1, o2 = OpcionFactory(), OpcionFactory()
+    mesa = MesaFactory(electores=120, categorias=[categoria])
+    mc = MesaCategoria.objects.get(mesa=mesa, categoria=categoria)
+
+    def agregado(tipo_de_agregacion, nivel, id_unidad):
+        resultado = ResultadoAgregado.objects.filter(
+            categoria=categoria,
+            tipo_de_agregacion=tipo_de_agregacion,
+            opciones_a_considerar=OPCIONES_A_CONSIDERAR.todas,
+            nivel_de_agregacion=nivel,
+            id_unidad=id_unidad,
+        ).first()
+        if resultado is None:
+            return None
+        return (
+            resultado.mesas_escrutadas,
+            resultado.electores_en_mesas_escrutadas,
+            dict(resultado.votos.values_list('opcion_id', 'votos')),
+        )
+
+    def todos_los_agregados():
+        return {
+            (r.tipo_de_agregacion, r.opciones_a_considerar, r.nivel_de_agregacion, r.id_unidad): agregado(
+                r.tipo_de_agregacion, r.nivel_de_agregacion, r.id_unidad
+            )
+            for r in ResultadoAgregado.objects.filter(categoria=categoria)
+        }
+
+    distrito = NIVELES_DE_AGREGACION.distrito, mesa.circuito.seccion.distrito_id
+    circuito = NIVELES_DE_AGREGACION.circuito, mesa.circuito_id
+
+    c1 = CargaFactory(mesa_categoria=mc, tipo=Carga.TIPOS.total)
+    cargar_votos(c1, {o1: 10, o2: 5})
+    consumir_novedades_y_actualizar_objetos([mc])
+    assert mc.status == MesaCategoria.STATUS.total_sin_consolidar
+    assert agregado(TIPOS_DE_AGREGACIONES.todas_las_cargas, *distrito) == (1, 120, {o1.id: 10, o2.id: 5})
+    assert agregado(TIPOS_DE_AGREGACIONES.todas_las_cargas, *circuito) == (1, 120, {o1.id: 10, o2.id: 5})
+    assert agregado(TIPOS_DE_AGREGACIONES.solo_consolidados, *distrito) is None
+
+    # Diverge: la mesa deja de contar.
+    c2 = CargaFactory(mesa_categoria=mc, tipo=Carga.TIPOS.total)
+    cargar_votos(c2, {o1: 11, o2: 5})
+    consumir_novedades_y_actualizar_objetos([mc])
+    assert mc.status == MesaCategoria.STATUS.total_en_conflicto
+    assert agregado(TIPOS_DE_AGREGACIONES.todas_las_cargas, *distrito) == (0, 0, {o1.id: 0, o2.id: 0})
+
+    # Consolida: cuenta en todos los tipos de agregación.
+    c3 = CargaFactory(mesa_categoria=mc, tipo=Carga.TIPOS.total)
+    cargar_votos(c3, {o1: 10, o2: 5})
+    consumir_novedades_y_actualizar_objetos([mc])
+    assert mc.status == MesaCategoria.STATUS.total_consolidada_dc
+    for tipo_de_agregacion in TIPOS_DE_AGREGACIONES:
+        assert agregado(tipo_de_agregacion[0], *distrito) == (1, 120, {o1.id: 10, o2.id: 5})
+
+    # Regenerar desde cero da lo mismo que aplicar las diferencias.
+    agregados = todos_los_agregados()
+    ResultadoAgregado.regenerar()
+    assert {k: v for k, v in agregados.items() if v[0]} == todos_los_agregados()
+
+
+def test_resultados_agregados_ignoran_mesas_sin_ubicacion(db):
+    categoria = CategoriaFactory()
+    o1 = OpcionFactory()
+    mesa = MesaFactory(categorias=[categoria])
+    Mesa.objects.filter(id=mesa.id).update(circuito=None)
+    mc = MesaCategoria.objects.get(mesa=mesa, categoria=categoria)
+
+    c1 = CargaFactory(mesa_categoria=mc, tipo=Carga.TIPOS.total)
+    cargar_votos(c1, {o1: 10})
+    consumir_novedades_y_actualizar_objetos([mc])
+    assert mc.status == MesaCategoria.STATUS.total_sin_consolidar
+    assert not ResultadoAgregado.objects.filter(categoria=categoria).exists()
+
+
+def test_exportacion_csv_en_streaming(fiscal_client):
+    o1, o2 = OpcionFactory(codigo='A'), OpcionFactory(codigo='B')
+    categoria = CategoriaFactory(opciones=[o1, o2])
+    m1, m2 = MesaFactory(categorias=[categoria]), MesaFactory(categorias=[categoria])
+    c1 = CargaFactory(mesa_categoria__categoria=categoria, mesa_categoria__mesa=m1, tipo=Carga.TIPOS.total)
+    cargar_votos(c1, {o1: 10, o2: 5})
+    c2 = CargaFactory(mesa_categoria__categoria=categoria, mesa_categoria__mesa=m2, tipo=Carga.TIPOS.total)
+    cargar_votos(c2, {o1: 7})
+    consumir_novedades_y_actualizar_objetos()
+
+    url = reverse('resultados-export', args=[categoria.id, 'csv'])
+    response = fiscal_client.get(url)
+    assert response.streaming
+    filas = b''.join(response.streaming_content).decode().splitlines()
+    assert filas[0] == 'distrito,seccion,circuito,mesa,opcion,votos'
+    assert len(filas) == 4
+
+    response = fiscal_client.get(url, {'formato': 'por_mesa'})
+    filas = b''.join(response.streaming_content).decode().splitlines()
+    assert filas[0] == 'distrito,seccion,circuito,mesa,A,B'
+    assert sorted(fila.split(',')[4:] for fila in filas[1:]) == [['10', '5'], ['7', '']]
+
+
+def test_exportacion_parquet_valida_categorias(fiscal_client):
+    response = fiscal_client.get(reverse('resultados-export-parquet'), {'categoria': ['1', 'x']})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_exportacion_parquet(db, tmp_path):
+    o1, o2 = OpcionFactory(codigo='A'), OpcionFactory(codigo='B')
+    categoria = CategoriaFactory(opciones=[o1, o2])
+    m1, m2 = MesaFactory(categorias=[categoria]), MesaFactory(categorias=[categoria])
+    for mesa in (m1, m2):
+        # Dos cargas coincidentes: la mesa queda consolidada.
+        for _ in range(2):
+            carga = CargaFactory(mesa_categoria__categoria=categoria, mesa_categoria__mesa=mesa, tipo=Carga.TIPOS.total)
+            cargar_votos(carga, {o1: 10, o2: 5})
+    # Una mesa sin consolidar no se exporta.
+    m3 = MesaFactory(categorias=[categoria])
+    carga = CargaFactory(mesa_categoria__categoria=categoria, mesa_categoria__mesa=m3, tipo=Carga.TIPOS.total)
+    cargar_votos(carga, {o1: 1})
+    consumir_novedades_y_actualizar_objetos()
+
+    archivos = exportar_parquet(str(tmp_path), [categoria])
+
+    particiones = {
+        (mesa.circuito.seccion.distrito.numero, mesa.numero) for mesa in (m1, m2)
+    }
+    filas = []
+    for archivo in archivos:
+        assert f'categoria={categoria.slug}' in archivo
+        tabla = pq.read_table(archivo)
+        assert pa.types.is_dictionary(tabla.schema.field('opcion').type)
+        distrito = archivo.split('distrito=')[1].split('/')[0]
+        columnas = tabla.to_pydict()
+        filas.extend(
+            (distrito, mesa, opcion, votos)
+            for mesa, opcion, votos in zip(columnas['mesa'], columnas['opcion'], columnas['votos'])
+        )
+    assert {(distrito, mesa) for distrito, mesa, _, _ in filas} == particiones
+    assert sorted(votos for _, _, _, votos in filas) == [5, 5, 10, 10]
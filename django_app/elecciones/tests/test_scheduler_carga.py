@@ -8,7 +8,7 @@ from elecciones.tests.factories import (
     MesaCategoriaFactory,
     MesaFactory,
 )
-from elecciones.models import MesaCategoria
+from elecciones.models import MesaCategoria, IdentificacionesEnCircuito
 
 from adjuntos.consolidacion import liberar_mesacategorias_y_attachments
 
@@ -42,6 +42,41 @@ def test_identificacion_consolidada_calcula_orden_de_prioridad(db):
     assert mc2.coeficiente_para_orden_de_carga is not None
 
 
+def test_orden_de_llegada_con_contadores_del_circuito(db):
+    c = CategoriaFactory()
+    m1 = MesaFactory()
+    mesas = [m1] + [MesaFactory(lugar_votacion=m1.lugar_votacion) for _ in range(3)]
+    mcs = [MesaCategoriaFactory(categoria=c, mesa=mesa) for mesa in mesas]
+    for mesa in mesas[:2]:
+        AttachmentFactory(mesa=mesa)
+
+    mcs[0].actualizar_coeficiente_para_orden_de_carga()
+    mcs[1].actualizar_coeficiente_para_orden_de_carga()
+    assert (mcs[1].orden_de_llegada, mcs[1].percentil) == (2, 26)
+    contador = IdentificacionesEnCircuito.objects.get(circuito=m1.circuito, categoria=c)
+    assert (contador.total, contador.identificadas) == (4, 2)
+
+    # Volver a actualizar una mesa ya identificada no le cambia el orden ni la cuenta.
+    mcs[0].actualizar_coeficiente_para_orden_de_carga()
+    assert (mcs[0].orden_de_llegada, mcs[0].percentil) == (1, 1)
+    contador.refresh_from_db()
+    assert contador.identificadas == 2
+
+    # Si la mesa pierde su foto deja de contar.
+    m1.invalidar_asignacion_attachment()
+    contador.refresh_from_db()
+    assert contador.identificadas == 1
+
+    # Una nueva mesa-categoría en el circuito hace que se vuelva a contar.
+    MesaCategoriaFactory(categoria=c, mesa=MesaFactory(lugar_votacion=m1.lugar_votacion))
+    assert not IdentificacionesEnCircuito.objects.filter(circuito=m1.circuito, categoria=c).exists()
+    AttachmentFactory(mesa=mesas[2])
+    mcs[2].actualizar_coeficiente_para_orden_de_carga()
+    assert (mcs[2].orden_de_llegada, mcs[2].percentil) == (2, 21)
+    contador = IdentificacionesEnCircuito.objects.get(circuito=m1.circuito, categoria=c)
+    assert (contador.total, contador.identificadas) == (5, 2)
+
+
 def test_siguiente_prioriza_estado_y_luego_coeficiente(db, settings, setup_constance, django_assert_num_queries):
 
     f = FiscalFactory()
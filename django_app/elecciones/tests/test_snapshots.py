@@ -0,0 +1,65 @@
+import pytest
+from django.urls import reverse
+
+from elecciones.models import Carga, Distrito, SnapshotDeResultados, TIPOS_DE_AGREGACIONES, OPCIONES_A_CONSIDERAR
+from .factories import (
+    CategoriaFactory,
+    CargaFactory,
+    ConfiguracionComputoFactory,
+    ConfiguracionComputoDistritoFactory,
+    MesaCategoriaFactory,
+    OpcionFactory,
+)
+from .test_models import consumir_novedades_y_actualizar_objetos
+from .utils import cargar_votos
+
+
+def test_snapshots_de_resultados(carta_marina, client):
+    o1, o2 = OpcionFactory.create_batch(2)
+    categoria = CategoriaFactory(opciones=[o1, o2])
+    mesas = carta_marina
+    for mesa in mesas:
+        MesaCategoriaFactory(mesa=mesa, categoria=categoria)
+
+    configuracion = ConfiguracionComputoFactory(nombre='inicial')
+    for distrito in Distrito.objects.all():
+        ConfiguracionComputoDistritoFactory(
+            configuracion=configuracion,
+            distrito=distrito,
+            agregacion=TIPOS_DE_AGREGACIONES.todas_las_cargas,
+            opciones=OPCIONES_A_CONSIDERAR.todas,
+        )
+
+    # Sin snapshots todavía no hay resultados.
+    assert client.get(reverse('resultados-snapshot', args=[categoria.id])).status_code == 404
+
+    c1 = CargaFactory(mesa_categoria__mesa=mesas[0], tipo=Carga.TIPOS.total, mesa_categoria__categoria=categoria)
+    cargar_votos(c1, {o1: 40, o2: 30})
+    consumir_novedades_y_actualizar_objetos()
+    primero = SnapshotDeResultados.tomar(categoria, configuracion)
+
+    c2 = CargaFactory(mesa_categoria__mesa=mesas[1], tipo=Carga.TIPOS.total, mesa_categoria__categoria=categoria)
+    cargar_votos(c2, {o1: 10, o2: 20})
+    consumir_novedades_y_actualizar_objetos()
+    segundo = SnapshotDeResultados.tomar(categoria, configuracion)
+
+    assert (primero.version, segundo.version) == (1, 2)
+    assert primero.votos_por_opcion() == {o1.id: 40, o2.id: 30}
+    assert segundo.votos_por_opcion() == {o1.id: 50, o2.id: 50}
+    assert segundo.total_mesas_escrutadas == 2
+
+    # Son de sólo agregado.
+    with pytest.raises(ValueError):
+        primero.save()
+
+    ultimo = client.get(reverse('resultados-snapshot', args=[categoria.id])).json()
+    assert ultimo['version'] == 2
+    assert ultimo['votos'] == {str(o1.id): 50, str(o2.id): 50}
+
+    tendencia = client.get(reverse('resultados-tendencia', args=[categoria.id])).json()
+    assert [punto['version'] for punto in tendencia['serie']] == [1, 2]
+    assert [punto['votos'][str(o1.id)] for punto in tendencia['serie']] == [40, 50]
+    assert set(tendencia['opciones']) == {str(o1.id), str(o2.id)}
+
+    tendencia = client.get(reverse('resultados-tendencia', args=[categoria.id]) + '?desde=1').json()
+    assert [punto['version'] for punto in tendencia['serie']] == [2]
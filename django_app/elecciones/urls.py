@@ -72,6 +72,20 @@ urlpatterns = [
         r'^resultados-export/(?P<pk>\d+).(?P<filetype>csv|xls)$',
         views.ResultadosExport.as_view(), name='resultados-export'
     ),
+    url(
+        r'^resultados-export-parquet$',
+        views.resultados_export_parquet, name='resultados-export-parquet'
+    ),
+    url(
+        r'^resultados-snapshot/(?P<pk>\d+)$',
+        views.ultimo_snapshot_de_resultados,
+        name='resultados-snapshot'
+    ),
+    url(
+        r'^resultados-tendencia/(?P<pk>\d+)$',
+        views.tendencia_de_resultados,
+        name='resultados-tendencia'
+    ),
     url(
         r'^resultados-en-base-a-configuracion/(?P<pk>\d+)?$',
         cache_page(multiplicador_testing * 5 * 60)(views.ResultadosComputoCategoria.as_view()),
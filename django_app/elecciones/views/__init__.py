@@ -1,3 +1,4 @@
 from .view_resultados import *
 from .view_avance_carga import *
 from .view_escuelas_y_mapas import *
+from .view_snapshots import *
@@ -1,6 +1,4 @@
 from django.conf import settings
-from django.utils import timezone
-from datetime import timedelta
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.text import get_text_list
 from django.views.generic.base import TemplateView
@@ -9,7 +7,7 @@ from .definiciones import VisualizadoresOnlyMixin
 
 from escrutinio_social import settings
 
-from fiscales.models import Fiscal
+from fiscales.actividad import registro as registro_de_actividad
 
 from elecciones.models import (
     Distrito,
@@ -177,9 +175,7 @@ class AvanceDeCargaResumen(TemplateView):
         context['categoria_elegida'] = self.categoria_spec
         context['nombre_categoria_elegida'] = self.categoria.nombre
         # data fiscales
-        ahora = timezone.now()
-        desde = ahora - timedelta(minutes=5)
-        context['fiscales_activos'] = Fiscal.objects.filter(last_seen__gt=desde).count()
+        context['fiscales_activos'] = registro_de_actividad.count_active()
         # data fotos
         generador_datos_fotos = GeneradorDatosFotosConsolidado(self.restriccion_geografica)
         context['data_fotos_nacion_pba_restriccion'] = generador_datos_fotos.datos_nacion_pba_restriccion()
@@ -1,6 +1,8 @@
+import tempfile
 from urllib import parse
 from urllib.parse import urlsplit
 from django.conf import settings
+from django.http import FileResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils.text import get_text_list
@@ -25,6 +27,7 @@ from elecciones.models import (
     NIVELES_DE_AGREGACION,
 )
 
+from elecciones.exportacion import csv_en_streaming, exportar_parquet_zip, filas_por_mesa, filas_por_opcion
 from elecciones.proyecciones import Proyecciones, create_sumarizador
 from elecciones.sumarizador import NIVEL_DE_AGREGACION
 
@@ -254,15 +257,47 @@ class ResultadosExport(ResultadosCategoria):
         categoria = context['categoria']
         votos = self.sumarizador.votos_csv_export(categoria)
 
-        headers = ['distrito', 'seccion', 'circuito', 'mesa', 'opcion', 'votos']
-        csv_list = [headers]
-
-        for voto in votos:
-            csv_list.append(voto)
+        # Con ?formato=por_mesa se exporta una fila por mesa con una columna por opción.
+        if self.request.GET.get('formato') == 'por_mesa':
+            filas = filas_por_mesa(votos)
+        else:
+            filas = filas_por_opcion(votos)
 
         (nivel, id_nivel) = self.get_filtro_por_nivel()
         filename = f'{categoria.slug}-{nivel if nivel else "todo"}-{id_nivel[0] if id_nivel else "todo"}'
-        return excel.make_response(excel.pe.Sheet(csv_list), self.filetype, file_name=filename)
+
+        if self.filetype == 'csv':
+            # El CSV se genera a medida que se leen los votos, sin armarlo entero en memoria.
+            response = StreamingHttpResponse(csv_en_streaming(filas), content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+            return response
+
+        return excel.make_response(excel.pe.Sheet(list(filas)), self.filetype, file_name=filename)
+
+
+@login_required
+@user_passes_test(lambda u: u.fiscal.esta_en_grupo('visualizadores'), login_url='permission-denied')
+def resultados_export_parquet(request):
+    """
+    Descarga un zip con los votos consolidados en Parquet, particionados por categoría y distrito
+    (ver elecciones.exportacion.exportar_parquet). Con el parámetro `categoria` (repetible)
+    se exportan sólo esas categorías. Las categorías sensibles sólo las ven los visualizadores sensibles.
+    """
+    categorias = Categoria.objects.all()
+    if not request.user.fiscal.esta_en_grupo('visualizadores_sensible'):
+        categorias = categorias.filter(sensible=False)
+    ids_categorias = request.GET.getlist('categoria')
+    if not all(id_categoria.isdigit() for id_categoria in ids_categorias):
+        return HttpResponseBadRequest('El parámetro categoria debe ser un id numérico.')
+    if ids_categorias:
+        categorias = categorias.filter(id__in=ids_categorias)
+
+    # El zip se arma en un archivo temporal que se borra al terminar de enviarlo.
+    archivo = tempfile.TemporaryFile()
+    with tempfile.TemporaryDirectory() as directorio:
+        exportar_parquet_zip(archivo, directorio, categorias)
+    archivo.seek(0)
+    return FileResponse(archivo, as_attachment=True, filename='votos-consolidados-parquet.zip')
 
 
 class ResultadosComputoCategoria(ResultadosCategoriaBase):
@@ -0,0 +1,87 @@
+from constance import config
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+
+from elecciones.models import Categoria, ConfiguracionComputo, Opcion, SnapshotDeResultados
+
+
+def categoria_y_configuracion_publicas(pk):
+    """
+    Los snapshots públicos son los de la configuración que se usa para publicar resultados,
+    y nunca de categorías sensibles.
+    """
+    categoria = get_object_or_404(Categoria, id=pk, sensible=False)
+    configuracion = get_object_or_404(ConfiguracionComputo, nombre=config.CONFIGURACION_COMPUTO_PUBLICA)
+    return categoria, configuracion
+
+
+def datos_de_opciones(ids_opciones):
+    return {
+        opcion.id: {
+            'nombre': opcion.nombre,
+            'nombre_corto': opcion.nombre_corto,
+            'partido': opcion.partido.nombre if opcion.partido else None,
+            'color': opcion.partido.color if opcion.partido else None,
+        }
+        for opcion in Opcion.objects.filter(id__in=ids_opciones).select_related('partido')
+    }
+
+
+def ultimo_snapshot_de_resultados(request, pk):
+    """
+    Devuelve el último snapshot de resultados de la categoría, sin recalcular nada.
+    """
+    categoria, configuracion = categoria_y_configuracion_publicas(pk)
+    snapshot = SnapshotDeResultados.ultimo(categoria, configuracion)
+    if snapshot is None:
+        raise Http404('Todavía no hay resultados para esta categoría.')
+
+    return JsonResponse({
+        'categoria': categoria.nombre,
+        'version': snapshot.version,
+        'momento': snapshot.momento,
+        'total_mesas': snapshot.total_mesas,
+        'total_mesas_escrutadas': snapshot.total_mesas_escrutadas,
+        'electores': snapshot.electores,
+        'electores_en_mesas_escrutadas': snapshot.electores_en_mesas_escrutadas,
+        'opciones': datos_de_opciones(snapshot.opciones),
+        'votos': snapshot.votos_por_opcion(),
+        'votos_no_positivos': snapshot.votos_no_positivos_por_opcion(),
+    })
+
+
+def tendencia_de_resultados(request, pk):
+    """
+    Devuelve la serie temporal de los snapshots de resultados de la categoría.
+    Con el parámetro `desde` se devuelven sólo las versiones posteriores a esa.
+    """
+    categoria, configuracion = categoria_y_configuracion_publicas(pk)
+    snapshots = SnapshotDeResultados.objects.filter(categoria=categoria, configuracion=configuracion)
+    desde = request.GET.get('desde')
+    if desde:
+        if not desde.isdigit():
+            raise Http404('Versión inválida.')
+        snapshots = snapshots.filter(version__gt=int(desde))
+
+    serie = [
+        {
+            'version': version,
+            'momento': momento,
+            'total_mesas_escrutadas': total_mesas_escrutadas,
+            'votos': dict(zip(opciones, votos)),
+            'votos_no_positivos': dict(zip(opciones_no_positivas, votos_no_positivos)),
+        }
+        for (
+            version, momento, total_mesas_escrutadas, opciones, votos, opciones_no_positivas, votos_no_positivos
+        ) in snapshots.order_by('version').values_list(
+            'version', 'momento', 'total_mesas_escrutadas',
+            'opciones', 'votos', 'opciones_no_positivas', 'votos_no_positivos'
+        )
+    ]
+    ids_opciones = {id_opcion for punto in serie for id_opcion in punto['votos']}
+
+    return JsonResponse({
+        'categoria': categoria.nombre,
+        'opciones': datos_de_opciones(ids_opciones),
+        'serie': serie,
+    })
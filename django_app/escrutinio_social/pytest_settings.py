@@ -5,6 +5,14 @@ MIN_COINCIDENCIAS_CARGAS = 2
 MIN_COINCIDENCIAS_IDENTIFICACION_PROBLEMA = 2
 MIN_COINCIDENCIAS_CARGAS_PROBLEMA = 2
 
+# Los threads usan otras conexiones que no verían los datos de la transacción de cada test.
+SUMARIZADOR_COMBINADO_CONCURRENCIA = 1
+ACTIVIDAD_FLUSH_PERIODICO = False
+
+# En los tests no está la tabla del cache en la base.
+CACHE_ACTIVIDAD = 'default'
+CACHE_DATOS_DE_REFERENCIA = 'default'
+
 
 CONSTANCE_CONFIG.update({
     'SCORING_MINIMO_PARA_CONSIDERAR_QUE_FISCAL_ES_TROLL': (
@@ -356,6 +356,42 @@ PAUSA_CONSOLIDACION = 15
 # Cuánto tiempo esperar para considerar que una carga o idenfificación que tomó el consolidador, está libre.
 # En minutos.
 TIMEOUT_CONSOLIDACION = 5
+# Si es verdadero, el consolidador procesa todas las mesa-categorías con novedades de una iteración
+# juntas (ver adjuntos.consolidacion.consolidar_cargas_en_lote) en lugar de una por una.
+CONSOLIDACION_EN_LOTE = True
+# Canal por el que se avisa al consolidador y al scheduler que hay cargas o identificaciones nuevas,
+# para no tener que esperar PAUSA_CONSOLIDACION (ver adjuntos/novedades.py).
+# Valores posibles: 'postgres' (LISTEN/NOTIFY), 'local' (en memoria, sólo para un mismo proceso) o vacío.
+CANAL_NOVEDADES = os.getenv('CANAL_NOVEDADES', 'postgres') or None
+
+# Segundos durante los que un proceso reutiliza el índice de agrupaciones de circuitos de las proyecciones.
+# En el proceso donde se modifican las agrupaciones se invalida en el momento; el resto lo ve a lo sumo
+# luego de este tiempo.
+TTL_INDICE_AGRUPACIONES = 300
+
+# Datos de referencia (opciones, partidos y opciones de cada categoría, ver elecciones/referencias.py):
+# la versión que los invalida se comparte entre procesos en este cache, cada proceso la consulta
+# a lo sumo una vez por intervalo (en segundos), y los reconstruye luego del TTL por si el cache
+# pierde la versión.
+TTL_DATOS_DE_REFERENCIA = 300
+CACHE_DATOS_DE_REFERENCIA = 'dbcache'
+INTERVALO_VERSION_DATOS_DE_REFERENCIA = 5
+
+# Cantidad máxima de distritos que se calculan en paralelo en el cómputo en base a una configuración
+# (ver SumarizadorCombinado). Cada uno usa su propia conexión a la base.
+SUMARIZADOR_COMBINADO_CONCURRENCIA = int(os.getenv('SUMARIZADOR_COMBINADO_CONCURRENCIA', 4))
+
+# Socket unix del servidor de cola de tareas en memoria (ver scheduling/cola_en_memoria.py).
+# Si no está definido, las tareas se despachan directamente desde la tabla ColaCargasPendientes,
+# que de todos modos se sigue manteniendo como respaldo durable.
+COLA_TAREAS_SOCKET = os.getenv('COLA_TAREAS_SOCKET') or None
+# Tiempo máximo (en segundos) de espera de una respuesta del servidor de cola antes de usar la tabla.
+COLA_TAREAS_TIMEOUT = 0.5
+# Cada cuántos segundos el servidor de cola borra de la tabla las tareas ya despachadas.
+COLA_TAREAS_PAUSA_SINCRONIZACION = 5
+# Cuántos segundos puede estar reservada una tarea despachada desde memoria sin que se confirme
+# su asignación antes de volver a la cola.
+COLA_TAREAS_VENCIMIENTO_RESERVA = 60
 
 # Prioridades standard, a usar si no se definen prioridades específicas
 # para una categoría o circuito
@@ -415,8 +451,31 @@ CODIGO_PARTIDO_ELLOS_BA = '135'
 # Número del Distrito Provincia de Buenos Aires
 DISTRITO_PBA = '2'
 
-# Cada cuánto tiempo actualizar el campo last_seen de un Fiscal.
-LAST_SEEN_UPDATE_INTERVAL = 2 * 60  # en segundos.
+# Cada cuánto tiempo grabar juntos los last_seen de los fiscales (ver fiscales/actividad.py).
+ACTIVIDAD_INTERVALO_FLUSH = int(os.getenv('ACTIVIDAD_INTERVALO_FLUSH', 10))  # en segundos.
+# Si cada proceso graba las marcas pendientes desde un thread aunque no le lleguen requests.
+ACTIVIDAD_FLUSH_PERIODICO = True
+# Cache compartido entre procesos donde se publican los fiscales activos, agrupados por
+# buckets de tiempo, y cuánto puede estar desactualizada la cantidad de activos que usa
+# cada proceso (para el scheduler y el avance de carga).
+CACHE_ACTIVIDAD = 'dbcache'
+ACTIVIDAD_SEGUNDOS_POR_BUCKET = 30
+ACTIVIDAD_MAXIMA_DESACTUALIZACION = int(os.getenv('ACTIVIDAD_MAXIMA_DESACTUALIZACION', 30))  # en segundos.
+
+# Miniaturas de las fotos. Se generan en segundo plano al subir cada foto, con esta cantidad
+# de threads por proceso (ver adjuntos/miniaturas.py), y las pantallas sólo usan las ya
+# generadas: nunca se achica una foto dentro de un request.
+VERSATILEIMAGEFIELD_RENDITION_KEY_SETS = {
+    'fotos': [
+        ('carga', 'thumbnail__960x'),
+        ('ejemplo', 'thumbnail__600x'),
+        ('vista_previa', 'thumbnail__120x'),
+    ],
+}
+VERSATILEIMAGEFIELD_SETTINGS = {
+    'create_images_on_demand': False,
+}
+MINIATURAS_THREADS = int(os.getenv('MINIATURAS_THREADS', 2))
 
 # Cuándo expira una sesión.
 SESSION_TIMEOUT = 5 * 60  # en segundos.
@@ -0,0 +1,168 @@
+"""
+Registro de la actividad de los fiscales.
+
+El middleware de sesiones marca a cada fiscal como visto en cada request. Grabar eso en la base
+en el momento implica un UPDATE por request sobre filas muy concurridas de la tabla de fiscales,
+así que las marcas se acumulan en memoria y se graban todas juntas, con un único bulk_update,
+cada ACTIVIDAD_INTERVALO_FLUSH segundos: con el primer request que pase el intervalo o, si no
+llegan más requests, desde un thread de cada proceso (y una última vez al terminar el proceso,
+por ejemplo cuando gunicorn recicla el worker).
+
+Para contar los fiscales activos sin ir a la tabla de fiscales, en cada flush cada proceso
+publica en un cache compartido (CACHE_ACTIVIDAD) los ids de los fiscales que vio, agrupados en
+buckets de ACTIVIDAD_SEGUNDOS_POR_BUCKET segundos. La cantidad de activos es la cantidad de ids
+distintos en los buckets de VENTANA_ACTIVIDAD, y cada proceso la reutiliza durante
+ACTIVIDAD_MAXIMA_DESACTUALIZACION segundos.
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import timedelta
+
+import structlog
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.utils import timezone
+
+from fiscales.models import Fiscal
+
+logger = structlog.get_logger(__name__)
+
+# Se considera activo a un fiscal visto en los últimos minutos.
+VENTANA_ACTIVIDAD = timedelta(minutes=5)
+
+
+class RegistroDeActividad:
+
+    def __init__(self, intervalo_flush=None, maxima_desactualizacion=None):
+        self.intervalo_flush = timedelta(
+            seconds=settings.ACTIVIDAD_INTERVALO_FLUSH if intervalo_flush is None else intervalo_flush
+        )
+        self.maxima_desactualizacion = timedelta(
+            seconds=(
+                settings.ACTIVIDAD_MAXIMA_DESACTUALIZACION
+                if maxima_desactualizacion is None else maxima_desactualizacion
+            )
+        )
+        self.lock = threading.Lock()
+        # id de fiscal -> última vez que se lo vio y todavía no se grabó.
+        self.pendientes = {}
+        # bucket -> ids de los fiscales que vio este proceso en ese bucket.
+        self.vistos = {}
+        self.ultimo_flush = timezone.now()
+        self.activos = None
+        self.activos_contados = None
+        # pid del proceso que lanzó el thread de flush periódico (los hijos de un fork no lo heredan).
+        self.pid_flush_periodico = None
+
+    @property
+    def cache(self):
+        return caches[settings.CACHE_ACTIVIDAD]
+
+    def bucket(self, cuando):
+        return int(cuando.timestamp()) // settings.ACTIVIDAD_SEGUNDOS_POR_BUCKET
+
+    def buckets_vigentes(self, ahora):
+        return range(self.bucket(ahora - VENTANA_ACTIVIDAD), self.bucket(ahora) + 1)
+
+    def clave(self, bucket):
+        return f'actividad-fiscales-{bucket}'
+
+    def registrar(self, fiscal_id, cuando=None):
+        """
+        Marca al fiscal como visto. Sólo graba si ya pasó el intervalo de flush.
+        """
+        cuando = cuando or timezone.now()
+        self.iniciar_flush_periodico()
+        with self.lock:
+            self.pendientes[fiscal_id] = cuando
+            self.vistos.setdefault(self.bucket(cuando), set()).add(fiscal_id)
+            hay_que_grabar = cuando - self.ultimo_flush >= self.intervalo_flush
+        if hay_que_grabar:
+            self.flush()
+
+    def flush(self):
+        """
+        Graba todas las marcas pendientes con un único UPDATE y publica los fiscales vistos
+        en el cache compartido.
+        """
+        ahora = timezone.now()
+        with self.lock:
+            pendientes, self.pendientes = self.pendientes, {}
+            self.ultimo_flush = ahora
+            vigentes = self.buckets_vigentes(ahora)
+            self.vistos = {bucket: ids for bucket, ids in self.vistos.items() if bucket in vigentes}
+            vistos = {bucket: set(ids) for bucket, ids in self.vistos.items()}
+        if vistos:
+            self.publicar(vistos)
+        if not pendientes:
+            return
+        Fiscal.objects.bulk_update(
+            [Fiscal(id=fiscal_id, last_seen=cuando) for fiscal_id, cuando in pendientes.items()],
+            ['last_seen']
+        )
+        logger.debug('Actividad de fiscales grabada', cantidad=len(pendientes))
+
+    def iniciar_flush_periodico(self):
+        """
+        Lanza, una vez por proceso, el thread que graba las marcas pendientes aunque no lleguen
+        requests, y registra un último flush para cuando termine el proceso.
+        """
+        if not settings.ACTIVIDAD_FLUSH_PERIODICO or self.pid_flush_periodico == os.getpid():
+            return
+        with self.lock:
+            if self.pid_flush_periodico == os.getpid():
+                return
+            self.pid_flush_periodico = os.getpid()
+        threading.Thread(target=self.flush_periodico, name='actividad-fiscales', daemon=True).start()
+        atexit.register(self.flush_sin_errores)
+
+    def flush_periodico(self):
+        while True:
+            time.sleep(self.intervalo_flush.total_seconds())
+            self.flush_sin_errores()
+
+    def flush_sin_errores(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Error grabando la actividad de fiscales')
+        finally:
+            # Fuera de un request nadie cierra la conexión del thread.
+            connection.close()
+
+    def publicar(self, vistos):
+        """
+        Une los fiscales vistos por este proceso a los de cada bucket en el cache compartido.
+        Si dos procesos publican a la vez uno puede pisar al otro, pero como cada proceso vuelve
+        a publicar todo lo que vio en los buckets vigentes, se corrige en el siguiente flush.
+        """
+        claves = {self.clave(bucket): ids for bucket, ids in vistos.items()}
+        publicados = self.cache.get_many(list(claves))
+        self.cache.set_many(
+            {clave: ids | publicados.get(clave, set()) for clave, ids in claves.items()},
+            timeout=VENTANA_ACTIVIDAD.total_seconds() + settings.ACTIVIDAD_SEGUNDOS_POR_BUCKET
+        )
+
+    def count_active(self):
+        """
+        Cantidad de fiscales vistos en VENTANA_ACTIVIDAD, según el cache compartido.
+        Se recalcula a lo sumo una vez cada ACTIVIDAD_MAXIMA_DESACTUALIZACION segundos; el resto
+        de las veces se responde desde memoria.
+        Si el cache está vacío (por ejemplo, recién levantado) se cuenta en la base.
+        """
+        ahora = timezone.now()
+        if self.activos is None or ahora - self.activos_contados >= self.maxima_desactualizacion:
+            self.flush()
+            por_bucket = self.cache.get_many([self.clave(bucket) for bucket in self.buckets_vigentes(ahora)])
+            if por_bucket:
+                self.activos = len(set().union(*por_bucket.values()))
+            else:
+                self.activos = Fiscal.objects.filter(last_seen__gt=ahora - VENTANA_ACTIVIDAD).count()
+            self.activos_contados = ahora
+        return self.activos
+
+
+registro = RegistroDeActividad()
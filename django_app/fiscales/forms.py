@@ -23,6 +23,7 @@ import phonenumbers
 from .models import Fiscal
 from django.contrib.auth.models import User
 from elecciones.models import VotoMesaReportado, Categoria, Opcion, Distrito, Seccion
+from elecciones.referencias import DatosDeReferencia
 from .widgets import Select as OpcionLista
 
 class AuthenticationFormCustomError(AuthenticationForm):
@@ -298,6 +299,21 @@ class QuieroSerFiscalForm(forms.Form):
         return referido_por_codigo
 
 
+class OpcionChoiceField(forms.ModelChoiceField):
+    """
+    Toma la opción de los datos de referencia del proceso en lugar de buscarla en la base
+    por cada fila del formset de carga.
+    """
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return DatosDeReferencia.vigentes().opciones[int(value)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_python(value)
+
+
 class VotoMesaModelForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
@@ -320,6 +336,7 @@ class VotoMesaModelForm(forms.ModelForm):
     class Meta:
         model = VotoMesaReportado
         fields = ('carga', 'opcion', 'votos')
+        field_classes = {'opcion': OpcionChoiceField}
 
 
 class BaseVotoMesaReportadoFormSet(BaseModelFormSet):
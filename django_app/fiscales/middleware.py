@@ -1,13 +1,10 @@
-from datetime import timedelta
-from django.utils import timezone
-from django.conf import settings
 from django.contrib.auth import logout
 from django.shortcuts import render
+from fiscales.actividad import registro
 from fiscales.models import Fiscal
 
 
 class OneSessionPerUserMiddleware:
-    LAST_SEEN_KEY = "last_seen"
 
     def __init__(self, get_response):
         self.get_response = get_response
@@ -22,14 +19,8 @@ class OneSessionPerUserMiddleware:
                     logout(request)
                     return render(request, 'fiscales/sesion-expirada.html')
 
-                # Me fijo si hay que actualizarle el last_seen
-                last_seen = request.session.get(self.LAST_SEEN_KEY)
-                ahora = timezone.now()
-                delta = timedelta(seconds=settings.LAST_SEEN_UPDATE_INTERVAL)
-
-                if not last_seen or ahora > last_seen + delta:
-                    # Me actualizo el last_seen en la bd.
-                    fiscal.update_last_seen(ahora)
+                # El last_seen se graba en la bd junto con el de los demás fiscales (ver actividad.py).
+                registro.registrar(fiscal.id)
             except Fiscal.DoesNotExist:
                 # usuario no fiscal
                 pass
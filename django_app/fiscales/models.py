@@ -225,10 +225,6 @@ class Fiscal(models.Model):
         self.asignacion_ultima_tarea = None
         self.save(update_fields=['asignacion_ultima_tarea'])
 
-    def update_last_seen(self, cuando):
-        self.last_seen = cuando
-        self.save(update_fields=['last_seen'])
-
     def update_session_key(self, session_key):
         self.session_key = session_key
         self.save(update_fields=['session_key'])
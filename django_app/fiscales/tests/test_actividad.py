@@ -0,0 +1,80 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import caches
+from django.utils import timezone
+
+from elecciones.tests.factories import FiscalFactory
+from fiscales.actividad import RegistroDeActividad, VENTANA_ACTIVIDAD
+
+
+def test_registro_de_actividad_agrupa_las_escrituras(db, django_assert_num_queries):
+    f1, f2 = FiscalFactory.create_batch(2)
+    registro = RegistroDeActividad(intervalo_flush=60)
+    ahora = timezone.now()
+
+    # Dentro del intervalo no se graba nada.
+    with django_assert_num_queries(0):
+        registro.registrar(f1.id, ahora)
+        registro.registrar(f2.id, ahora)
+    f1.refresh_from_db()
+    assert f1.last_seen is None
+
+    # Pasado el intervalo se graba todo junto.
+    registro.registrar(f1.id, ahora + timedelta(seconds=61))
+    f1.refresh_from_db()
+    f2.refresh_from_db()
+    assert f1.last_seen == ahora + timedelta(seconds=61)
+    assert f2.last_seen == ahora
+
+
+def test_registro_de_actividad_cuenta_activos_desde_memoria(db, django_assert_num_queries):
+    caches['default'].clear()
+    f1, f2 = FiscalFactory.create_batch(2)
+    registro = RegistroDeActividad(intervalo_flush=60, maxima_desactualizacion=60)
+    registro.registrar(f1.id)
+    registro.registrar(f2.id)
+
+    assert registro.count_active() == 2
+    with django_assert_num_queries(0):
+        assert registro.count_active() == 2
+
+
+def test_registro_de_actividad_comparte_activos_entre_procesos(db):
+    caches['default'].clear()
+    f1, f2, f3 = FiscalFactory.create_batch(3)
+    # Cada registro hace las veces de un proceso distinto.
+    registro_1 = RegistroDeActividad(intervalo_flush=60, maxima_desactualizacion=0)
+    registro_2 = RegistroDeActividad(intervalo_flush=60, maxima_desactualizacion=0)
+    registro_1.registrar(f1.id)
+    registro_1.registrar(f2.id)
+    registro_2.registrar(f2.id)
+    registro_2.registrar(f3.id)
+    registro_1.flush()
+
+    assert registro_2.count_active() == 3
+
+    # Los que se vieron fuera de la ventana no cuentan.
+    caches['default'].clear()
+    registro_3 = RegistroDeActividad(intervalo_flush=60, maxima_desactualizacion=0)
+    registro_3.registrar(f1.id, timezone.now() - VENTANA_ACTIVIDAD - timedelta(minutes=1))
+    registro_3.registrar(f2.id)
+    assert registro_3.count_active() == 1
+
+
+def test_registro_de_actividad_flush_periodico_uno_por_proceso(db, settings):
+    settings.ACTIVIDAD_FLUSH_PERIODICO = True
+    f1 = FiscalFactory()
+    registro = RegistroDeActividad(intervalo_flush=60)
+    with mock.patch('fiscales.actividad.threading.Thread') as thread, \
+            mock.patch('fiscales.actividad.atexit.register') as register:
+        registro.registrar(f1.id)
+        registro.registrar(f1.id)
+    thread.assert_called_once_with(target=registro.flush_periodico, name='actividad-fiscales', daemon=True)
+    register.assert_called_once_with(registro.flush_sin_errores)
+
+    # Lo que hace el thread (o el proceso al terminar) graba las marcas pendientes.
+    with mock.patch('fiscales.actividad.connection'):
+        registro.flush_sin_errores()
+    f1.refresh_from_db()
+    assert f1.last_seen is not None
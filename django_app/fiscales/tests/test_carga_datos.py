@@ -2,6 +2,7 @@ import pytest
 
 from http import HTTPStatus
 
+from django.core.management import call_command
 from django.urls import reverse
 from elecciones.tests.factories import (
     AttachmentFactory,
@@ -697,8 +698,9 @@ def test_detalle_mesa_categoria(db, fiscal_client):
     assert list(response.context['reportados']) == [votos1, votos2, votos3]
 
 
+@pytest.mark.parametrize('cache_datos_de_referencia', ['default', 'dbcache'])
 def test_cargar_resultados_mesa_desde_ub_con_id_de_mesa(
-    db, fiscal_client, admin_user, django_assert_num_queries
+    db, fiscal_client, admin_user, django_assert_num_queries, settings, cache_datos_de_referencia
 ):
     """
     Es un test desaconsejadamente largo, pero me sirvió para entender el escenario.
@@ -708,7 +710,15 @@ def test_cargar_resultados_mesa_desde_ub_con_id_de_mesa(
     Cuando se le pega con POST, va a cargar un resultado.
 
     Cuando ya no tiene más categorías para cargar, te devuelve a agregar-adjunto-ub
+
+    La cantidad de queries del POST no depende de dónde esté la versión de los datos de
+    referencia: aunque el cache esté en la base, no se la consulta en cada fila del formset.
     """
+    if cache_datos_de_referencia == 'dbcache':
+        call_command('createcachetable')
+    settings.CACHE_DATOS_DE_REFERENCIA = cache_datos_de_referencia
+    settings.INTERVALO_VERSION_DATOS_DE_REFERENCIA = 60
+
     categoria_1 = CategoriaFactory()
     categoria_2 = CategoriaFactory()
 
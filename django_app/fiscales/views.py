@@ -293,14 +293,14 @@ def carga(request, mesacategoria_id, tipo='total', desde_ub=False):
         logger.info('Carga inicio', mc=mesa_categoria.id, tipo=tipo)
 
     # Tenemos la lista de opciones ordenadas como el acta.
-    opciones = categoria.opciones_actuales(solo_prioritarias, excluir_optativas=True)
+    opciones = categoria.opciones_actuales_cacheadas(solo_prioritarias, excluir_optativas=True)
 
     datos_previos = mesa_categoria.datos_previos(tipo)
 
     # Obtenemos la clase para el formset seteando tantas filas como opciones
     # existen. Como extra=0, el formset tiene un tamaño fijo
     VotoMesaReportadoFormset = votomesareportadoformset_factory(
-        min_num=opciones.count()
+        min_num=len(opciones)
     )
 
     def fix_opciones(formset):
@@ -354,18 +354,13 @@ def carga(request, mesacategoria_id, tipo='total', desde_ub=False):
             with transaction.atomic():
                 # Se guardan los datos. El contenedor `carga`
                 # y los votos del formset asociados.
-                carga = Carga.objects.create(
+                carga = Carga(
                     mesa_categoria=mesa_categoria,
                     tipo=tipo,
                     fiscal=fiscal,
                     origen=Carga.SOURCES.web if not modo_ub else Carga.SOURCES.csv
                 )
-                reportados = []
-                for form in formset:
-                    vmr = form.save(commit=False)
-                    vmr.carga = carga
-                    reportados.append(vmr)
-                VotoMesaReportado.objects.bulk_create(reportados)
+                carga.guardar_con_votos([form.save(commit=False) for form in formset])
 
                 mesa_categoria.desasignar_a_fiscal()  # Le bajamos la cuenta.
                 # Si viene modo_ub, consolidamos la carga.
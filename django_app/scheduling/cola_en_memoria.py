@@ -0,0 +1,420 @@
+"""
+Cola de tareas en memoria.
+
+Alternativa opcional a despachar las tareas directamente desde la tabla ColaCargasPendientes,
+que con muchos fiscales pidiendo tareas en simultáneo se vuelve un punto de contención de locks.
+
+Un proceso de larga vida (ver el comando ``servidor_cola_tareas``) mantiene la cola en memoria,
+con un heap global ordenado por ``orden`` y sub-heaps por distrito y por sección para la afinidad
+geográfica. Los workers web le piden la siguiente tarea a través de un socket unix local
+y el scheduler sólo le envía los lotes que encola.
+
+Las tareas se despachan como reservas: el worker web confirma la tarea recién cuando se confirma
+la transacción en la que se la asignó al fiscal. Si eso no pasa dentro de
+COLA_TAREAS_VENCIMIENTO_RESERVA segundos (el request falló o se hizo rollback), la tarea vuelve
+a la cola.
+
+La tabla ColaCargasPendientes se sigue manteniendo como respaldo durable: el servidor la carga al
+iniciar y borra periódicamente las tareas confirmadas. Si el servidor no responde, los workers
+web vuelven a despachar desde la tabla.
+"""
+import heapq
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import defaultdict
+
+import structlog
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+logger = structlog.get_logger('scheduler')
+
+# Cada cuántos segundos se vuelven a leer de la base las tareas en las que participó un fiscal.
+VIGENCIA_EXCLUSIONES = 60
+
+# Cantidad de tareas despachadas que se borran de la tabla por query.
+TAMANIO_LOTE_BORRADO = 500
+
+
+class ColaEnMemoriaNoDisponible(Exception):
+    pass
+
+
+class TareaEncolada():
+    """
+    Una tarea de la cola: identificar un attachment o cargar una mesa-categoría.
+    """
+    __slots__ = ('orden', 'mesa_categoria_id', 'attachment_id', 'numero_carga', 'distrito_id', 'seccion_id',
+                 'despachada')
+
+    def __init__(self, orden, mesa_categoria_id, attachment_id, numero_carga, distrito_id, seccion_id):
+        self.orden = orden
+        self.mesa_categoria_id = mesa_categoria_id
+        self.attachment_id = attachment_id
+        self.numero_carga = numero_carga
+        self.distrito_id = distrito_id
+        self.seccion_id = seccion_id
+        self.despachada = False
+
+    @property
+    def clave(self):
+        """
+        Se corresponde con los unique_together de ColaCargasPendientes.
+        """
+        return (self.mesa_categoria_id, self.attachment_id, self.numero_carga)
+
+    @property
+    def trabajo(self):
+        """
+        Identifica el trabajo a realizar, independientemente del número de carga.
+        Es lo que se excluye para les fiscales que ya participaron en él.
+        """
+        return ('mc', self.mesa_categoria_id) if self.mesa_categoria_id else ('attachment', self.attachment_id)
+
+    def como_dict(self):
+        return {
+            'orden': self.orden,
+            'mesa_categoria_id': self.mesa_categoria_id,
+            'attachment_id': self.attachment_id,
+            'numero_carga': self.numero_carga,
+            'distrito_id': self.distrito_id,
+            'seccion_id': self.seccion_id,
+        }
+
+
+class ColaEnMemoria():
+    """
+    Estructura de datos de la cola. No es thread safe, el servidor la protege con un lock.
+
+    Las tareas despachadas se marcan y se descartan de los heaps recién cuando llegan al tope
+    (borrado perezoso), así cada operación es O(log n) independientemente de la cantidad de fiscales.
+    """
+
+    def __init__(self):
+        self.vaciar()
+
+    def vaciar(self):
+        self.pendientes = {}
+        self.heap = []
+        self.heaps_por_distrito = defaultdict(list)
+        self.heaps_por_seccion = defaultdict(list)
+        self.secuencia = itertools.count()
+        # clave -> (momento de la reserva, tarea), para las despachadas sin confirmar.
+        self.reservadas = {}
+        self.despachadas = []
+        self.exclusiones = {}
+
+    def largo(self):
+        return len(self.pendientes)
+
+    def ultimo_orden(self):
+        return max((tarea.orden for tarea in self.pendientes.values()), default=0)
+
+    def encolar(self, tareas):
+        """
+        Agrega las tareas (diccionarios como los de TareaEncolada.como_dict) que no estén ya pendientes
+        ni reservadas. Devuelve la cantidad de tareas agregadas.
+        """
+        agregadas = 0
+        for datos in tareas:
+            tarea = TareaEncolada(**datos)
+            if tarea.clave in self.pendientes or tarea.clave in self.reservadas:
+                continue
+            self.pendientes[tarea.clave] = tarea
+            entrada = (tarea.orden, next(self.secuencia), tarea)
+            heapq.heappush(self.heap, entrada)
+            heapq.heappush(self.heaps_por_distrito[tarea.distrito_id], entrada)
+            heapq.heappush(self.heaps_por_seccion[tarea.seccion_id], entrada)
+            agregadas += 1
+        return agregadas
+
+    def primera(self, heap, excluidas):
+        """
+        Devuelve la primera tarea pendiente del heap cuyo trabajo no esté en `excluidas`, sin sacarla.
+        """
+        while heap and heap[0][2].despachada:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        if not excluidas:
+            return heap[0][2]
+
+        apartadas = []
+        encontrada = None
+        while heap:
+            entrada = heapq.heappop(heap)
+            if entrada[2].despachada:
+                continue
+            apartadas.append(entrada)
+            if entrada[2].trabajo not in excluidas:
+                encontrada = entrada[2]
+                break
+        for entrada in apartadas:
+            heapq.heappush(heap, entrada)
+        return encontrada
+
+    def exclusiones_vigentes(self, fiscal_id):
+        """
+        Devuelve el conjunto de trabajos en los que participó le fiscal, o None si hay que leerlo de la base.
+        """
+        exclusiones = self.exclusiones.get(fiscal_id)
+        if exclusiones is None or time.monotonic() - exclusiones[0] > VIGENCIA_EXCLUSIONES:
+            return None
+        return exclusiones[1]
+
+    def registrar_exclusiones(self, fiscal_id, trabajos):
+        anteriores = self.exclusiones.get(fiscal_id, (None, set()))[1]
+        self.exclusiones[fiscal_id] = (time.monotonic(), anteriores | set(trabajos))
+
+    def siguiente_tarea(self, fiscal_id=None, distrito_afin_id=None, distrito_id=None, seccion_id=None,
+                        modo_ub=False, excluir=False, bonus_afinidad=0):
+        """
+        Equivalente en memoria de ColaCargasPendientes.siguiente_tarea: saca la tarea de menor orden,
+        privilegiando una geográficamente afín si está "suficientemente" cerca o si estamos en modo UB,
+        y excluyendo (si `excluir`) los trabajos en los que le fiscal ya participó.
+        """
+        excluidas = self.exclusiones_vigentes(fiscal_id) if excluir else None
+
+        tarea = self.primera(self.heap, excluidas)
+        if tarea is None:
+            return None
+
+        heap_afin = None
+        if fiscal_id:
+            if modo_ub:
+                if seccion_id:
+                    heap_afin = self.heaps_por_seccion.get(seccion_id)
+                else:
+                    heap_afin = self.heaps_por_distrito.get(distrito_id)
+            elif distrito_afin_id:
+                heap_afin = self.heaps_por_distrito.get(distrito_afin_id)
+
+        tarea_afin = self.primera(heap_afin, excluidas) if heap_afin else None
+        if tarea_afin and (modo_ub or tarea_afin.orden - bonus_afinidad <= tarea.orden):
+            tarea = tarea_afin
+
+        tarea.despachada = True
+        del self.pendientes[tarea.clave]
+        self.reservadas[tarea.clave] = (time.monotonic(), tarea)
+        if fiscal_id and fiscal_id in self.exclusiones:
+            self.exclusiones[fiscal_id][1].add(tarea.trabajo)
+        return tarea
+
+    def confirmar(self, clave):
+        """
+        Confirma una tarea reservada, que pasa a borrarse de la tabla en la próxima sincronización.
+        Devuelve False si la reserva ya no existía (por ejemplo, porque venció).
+        """
+        if self.reservadas.pop(clave, None) is None:
+            return False
+        self.despachadas.append(clave)
+        return True
+
+    def liberar_vencidas(self, vencimiento):
+        """
+        Vuelve a encolar las tareas reservadas hace más de `vencimiento` segundos sin confirmar.
+        Devuelve la cantidad de tareas liberadas.
+        """
+        limite = time.monotonic() - vencimiento
+        vencidas = [clave for clave, (momento, _) in self.reservadas.items() if momento < limite]
+        return self.encolar([self.reservadas.pop(clave)[1].como_dict() for clave in vencidas])
+
+    def tomar_despachadas(self):
+        despachadas, self.despachadas = self.despachadas, []
+        return despachadas
+
+
+def trabajos_del_fiscal(fiscal_id):
+    """
+    Lee de la base las mesa-categorías que cargó y los attachments que identificó le fiscal.
+    """
+    from elecciones.models import Carga
+    from adjuntos.models import Identificacion
+
+    trabajos = {
+        ('mc', mesa_categoria_id)
+        for mesa_categoria_id in Carga.objects.filter(fiscal_id=fiscal_id).values_list('mesa_categoria_id', flat=True)
+    }
+    trabajos.update(
+        ('attachment', attachment_id)
+        for attachment_id in Identificacion.objects.filter(fiscal_id=fiscal_id).values_list('attachment_id', flat=True)
+    )
+    return trabajos
+
+
+def borrar_despachadas_de_la_tabla(claves):
+    """
+    Borra de ColaCargasPendientes las tareas ya despachadas desde memoria.
+    """
+    from .models import ColaCargasPendientes
+
+    for inicio in range(0, len(claves), TAMANIO_LOTE_BORRADO):
+        filtro = Q()
+        for mesa_categoria_id, attachment_id, numero_carga in claves[inicio:inicio + TAMANIO_LOTE_BORRADO]:
+            filtro |= Q(mesa_categoria_id=mesa_categoria_id, attachment_id=attachment_id, numero_carga=numero_carga)
+        ColaCargasPendientes.objects.filter(filtro).delete()
+
+
+class ManejadorDePedidos(socketserver.StreamRequestHandler):
+    """
+    Atiende un pedido por conexión: una línea JSON con la operación y sus parámetros,
+    a la que se responde con otra línea JSON.
+    """
+
+    def handle(self):
+        try:
+            pedido = json.loads(self.rfile.readline())
+            respuesta = getattr(self, f"op_{pedido.pop('op')}")(**pedido)
+        except Exception as e:
+            logger.error('Cola en memoria', error=str(e))
+            respuesta = {'error': str(e)}
+        finally:
+            # Cada pedido se atiende en un thread propio, no queremos dejar conexiones abiertas.
+            connection.close()
+        self.wfile.write(json.dumps(respuesta).encode() + b'\n')
+
+    def op_siguiente_tarea(self, fiscal_id=None, excluir=False, **kwargs):
+        servidor = self.server
+        if excluir and fiscal_id:
+            with servidor.lock:
+                exclusiones = servidor.cola.exclusiones_vigentes(fiscal_id)
+            if exclusiones is None:
+                # La lectura de la base se hace fuera del lock para no frenar al resto de les fiscales.
+                trabajos = trabajos_del_fiscal(fiscal_id)
+                with servidor.lock:
+                    servidor.cola.registrar_exclusiones(fiscal_id, trabajos)
+
+        with servidor.lock:
+            tarea = servidor.cola.siguiente_tarea(fiscal_id=fiscal_id, excluir=excluir, **kwargs)
+        return {'tarea': tarea.como_dict() if tarea else None}
+
+    def op_encolar(self, tareas, reconstruir_la_cola=False):
+        with self.server.lock:
+            if reconstruir_la_cola:
+                self.server.cola.vaciar()
+            agregadas = self.server.cola.encolar(tareas)
+        return {'agregadas': agregadas}
+
+    def op_confirmar(self, clave):
+        with self.server.lock:
+            return {'confirmada': self.server.cola.confirmar(tuple(clave))}
+
+    def op_largo(self):
+        with self.server.lock:
+            return {'largo': self.server.cola.largo(), 'ultimo_orden': self.server.cola.ultimo_orden()}
+
+
+class ServidorColaEnMemoria(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, ruta_socket):
+        if os.path.exists(ruta_socket):
+            os.unlink(ruta_socket)
+        super().__init__(ruta_socket, ManejadorDePedidos)
+        self.cola = ColaEnMemoria()
+        self.lock = threading.Lock()
+
+    def cargar_desde_la_tabla(self):
+        """
+        Carga en memoria el contenido actual de ColaCargasPendientes.
+        """
+        from .models import ColaCargasPendientes
+
+        tareas = ColaCargasPendientes.objects.order_by('orden').values(
+            'orden', 'mesa_categoria_id', 'attachment_id', 'numero_carga', 'distrito_id', 'seccion_id'
+        )
+        with self.lock:
+            self.cola.vaciar()
+            return self.cola.encolar(tareas.iterator())
+
+    def sincronizar_tabla(self):
+        """
+        Loop que borra periódicamente de la tabla las tareas confirmadas y vuelve a encolar
+        las reservas vencidas.
+        """
+        while True:
+            time.sleep(settings.COLA_TAREAS_PAUSA_SINCRONIZACION)
+            with self.lock:
+                liberadas = self.cola.liberar_vencidas(settings.COLA_TAREAS_VENCIMIENTO_RESERVA)
+                despachadas = self.cola.tomar_despachadas()
+            if liberadas:
+                logger.warning('Cola en memoria: reservas vencidas vueltas a encolar', cantidad=liberadas)
+            if not despachadas:
+                continue
+            try:
+                borrar_despachadas_de_la_tabla(despachadas)
+                logger.debug('Cola en memoria sincronizada', despachadas=len(despachadas))
+            except Exception as e:
+                logger.error('Cola en memoria: error sincronizando la tabla', error=str(e))
+            finally:
+                connection.close()
+
+
+def consultar(pedido):
+    """
+    Envía un pedido al servidor de cola en memoria y devuelve su respuesta.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conexion:
+            conexion.settimeout(settings.COLA_TAREAS_TIMEOUT)
+            conexion.connect(settings.COLA_TAREAS_SOCKET)
+            conexion.sendall(json.dumps(pedido).encode() + b'\n')
+            with conexion.makefile('rb') as archivo:
+                respuesta = json.loads(archivo.readline())
+    except (OSError, ValueError) as e:
+        raise ColaEnMemoriaNoDisponible(str(e))
+
+    if 'error' in respuesta:
+        raise ColaEnMemoriaNoDisponible(respuesta['error'])
+    return respuesta
+
+
+def siguiente_tarea(fiscal=None, modo_ub=False, excluir=False, bonus_afinidad=0):
+    """
+    Pide la siguiente tarea al servidor de cola en memoria.
+    Devuelve un diccionario como los de TareaEncolada.como_dict, o None si no hay tareas.
+    """
+    pedido = {'op': 'siguiente_tarea', 'modo_ub': modo_ub, 'excluir': excluir, 'bonus_afinidad': bonus_afinidad}
+    if fiscal:
+        pedido.update(
+            fiscal_id=fiscal.id,
+            distrito_afin_id=fiscal.distrito_afin_id,
+            distrito_id=fiscal.distrito_id,
+            seccion_id=fiscal.seccion_id,
+        )
+    return consultar(pedido)['tarea']
+
+
+def confirmar(tarea):
+    """
+    Confirma al servidor una tarea devuelta por siguiente_tarea.
+    """
+    clave = [tarea['mesa_categoria_id'], tarea['attachment_id'], tarea['numero_carga']]
+    return consultar({'op': 'confirmar', 'clave': clave})['confirmada']
+
+
+def encolar(tareas, reconstruir_la_cola=False):
+    """
+    Envía un lote de instancias (no necesariamente guardadas) de ColaCargasPendientes al servidor.
+    """
+    return consultar({
+        'op': 'encolar',
+        'reconstruir_la_cola': reconstruir_la_cola,
+        'tareas': [
+            {
+                'orden': tarea.orden,
+                'mesa_categoria_id': tarea.mesa_categoria_id,
+                'attachment_id': tarea.attachment_id,
+                'numero_carga': tarea.numero_carga,
+                'distrito_id': tarea.distrito_id,
+                'seccion_id': tarea.seccion_id,
+            }
+            for tarea in tareas
+        ]
+    })['agregadas']
@@ -130,4 +130,4 @@ class Command(BaseCommand):
             nro_circuito = row['nro_circuito']
             cant_mesas_necesarias = int(row['cant_mesas_necesarias'])
             lugar_en_cola = self.priorizar_circuito(nuevas, lugar_en_cola, linea, slug_cat, nro_distrito, nro_seccion, nro_circuito, cant_mesas_necesarias)
-        ColaCargasPendientes.objects.bulk_create(nuevas, ignore_conflicts=True)
\ No newline at end of file
+        ColaCargasPendientes.encolar(nuevas)
\ No newline at end of file
@@ -1,4 +1,3 @@
-import time
 import structlog
 
 from django.core.management.base import BaseCommand
@@ -6,6 +5,7 @@ from constance import config
 from sentry_sdk import capture_message
 from scheduling.scheduler import scheduler
 from adjuntos.management.commands.consolidar_identificaciones_y_cargas import consolidador
+from adjuntos.novedades import esperar_novedad
 
 logger = structlog.get_logger('scheduler')
 
@@ -69,4 +69,5 @@ class Command(BaseCommand):
             logger.error('Scheduler',
                 error=str(e)
             )
-        time.sleep(config.PAUSA_SCHEDULER)
+        # Si llega una novedad antes de la pausa se empieza otra ronda de inmediato.
+        esperar_novedad(config.PAUSA_SCHEDULER)
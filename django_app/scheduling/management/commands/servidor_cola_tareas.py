@@ -0,0 +1,39 @@
+import threading
+import structlog
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from scheduling.cola_en_memoria import ServidorColaEnMemoria
+
+logger = structlog.get_logger('scheduler')
+
+
+class Command(BaseCommand):
+    help = (
+        "Servidor de la cola de tareas en memoria. Atiende los pedidos de siguiente tarea de los "
+        "workers web y los lotes del scheduler a través de un socket unix local."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            default=settings.COLA_TAREAS_SOCKET,
+            help="Ruta del socket unix (default settings.COLA_TAREAS_SOCKET: %(default)s)."
+        )
+
+    def handle(self, *args, **options):
+        ruta_socket = options['socket']
+        if not ruta_socket:
+            raise CommandError('Hay que indicar el socket con --socket o con la variable COLA_TAREAS_SOCKET.')
+
+        servidor = ServidorColaEnMemoria(ruta_socket)
+        cargadas = servidor.cargar_desde_la_tabla()
+        logger.info('Cola en memoria iniciada', socket=ruta_socket, tareas=cargadas)
+
+        threading.Thread(target=servidor.sincronizar_tabla, daemon=True).start()
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
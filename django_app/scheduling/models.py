@@ -1,14 +1,18 @@
 from django.db import models, transaction, connection
 from django.db.models import Q, F, ExpressionWrapper, Case, When
 from django.contrib.sessions.models import Session
-from django.utils import timezone
 from django.conf import settings
 from constance import config
-from datetime import timedelta
+import structlog
+import numpy as np
+from collections import defaultdict
 
 from elecciones.models import (Distrito, Seccion, Categoria, MesaCategoria)
 from adjuntos.models import Attachment
-from fiscales.models import Fiscal
+from fiscales.actividad import registro as registro_de_actividad
+from scheduling import cola_en_memoria
+
+logger = structlog.get_logger('scheduler')
 
 
 class ColaCargasPendientes(models.Model):
@@ -49,7 +53,15 @@ class ColaCargasPendientes(models.Model):
         El parámetro fiscal indica que deben excluirse mesascat que ya hayan sido cargadas por él,
         si hay poques usuaries.
         Debe invocarse dentro de una transacción.
+
+        Si hay un servidor de cola en memoria configurado (settings.COLA_TAREAS_SOCKET) la tarea
+        se le pide a él, y sólo si no responde se usa la tabla.
         """
+        if settings.COLA_TAREAS_SOCKET:
+            try:
+                return cls.siguiente_tarea_en_memoria(fiscal, modo_ub)
+            except cola_en_memoria.ColaEnMemoriaNoDisponible as e:
+                logger.warning('Cola en memoria no disponible, se usa la tabla', error=str(e))
 
         mesa_categoria, attachment = None, None
 
@@ -92,6 +104,78 @@ class ColaCargasPendientes(models.Model):
 
         return (mesa_categoria, attachment)
 
+    @classmethod
+    def siguiente_tarea_en_memoria(cls, fiscal=None, modo_ub=False):
+        """
+        Como siguiente_tarea, pero obteniendo la tarea del servidor de cola en memoria.
+        El servidor sólo la reserva: se confirma cuando se confirma la transacción en curso y,
+        si hay rollback, el servidor la vuelve a encolar cuando vence la reserva.
+        """
+        excluir = bool(fiscal) and count_active_sessions() < config.UMBRAL_EXCLUIR_TAREAS_FISCAL
+        tarea = cola_en_memoria.siguiente_tarea(
+            fiscal, modo_ub, excluir=excluir, bonus_afinidad=config.BONUS_AFINIDAD_GEOGRAFICA
+        )
+        if not tarea:
+            return (None, None)
+        transaction.on_commit(lambda: confirmar_tarea_en_memoria(tarea))
+        mesa_categoria = MesaCategoria.objects.filter(id=tarea['mesa_categoria_id']).first() \
+            if tarea['mesa_categoria_id'] else None
+        attachment = Attachment.objects.filter(id=tarea['attachment_id']).first() \
+            if tarea['attachment_id'] else None
+        return (mesa_categoria, attachment)
+
+    @classmethod
+    def encolar(cls, nuevas, reconstruir_la_cola=False):
+        """
+        Guarda en la tabla las nuevas tareas y, si hay un servidor de cola en memoria configurado,
+        le envía las que efectivamente se insertaron (las que ya estaban en la tabla pueden haber
+        sido despachadas, y el servidor las descartaría de la tabla en la próxima sincronización).
+        """
+        with transaction.atomic():
+            if reconstruir_la_cola:
+                cls.vaciar()
+            insertadas = cls.insertar_nuevas(nuevas)
+
+        if settings.COLA_TAREAS_SOCKET:
+            try:
+                cola_en_memoria.encolar(insertadas, reconstruir_la_cola)
+            except cola_en_memoria.ColaEnMemoriaNoDisponible as e:
+                # Las tareas quedan en la tabla, el servidor las levanta cuando vuelva a iniciar.
+                logger.warning('Cola en memoria no disponible al encolar', error=str(e))
+
+    @classmethod
+    def insertar_nuevas(cls, nuevas, tamanio_lote=1000):
+        """
+        Como bulk_create(nuevas, ignore_conflicts=True), pero devuelve las tareas que se insertaron.
+        """
+        tabla = cls._meta.db_table
+        insertadas = []
+        for inicio in range(0, len(nuevas), tamanio_lote):
+            lote = nuevas[inicio:inicio + tamanio_lote]
+            valores = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(lote))
+            sql = f"""
+                INSERT INTO {tabla} (mesa_categoria_id, attachment_id, orden, numero_carga, distrito_id, seccion_id)
+                VALUES {valores}
+                ON CONFLICT DO NOTHING
+                RETURNING mesa_categoria_id, attachment_id, numero_carga
+            """
+            parametros = [
+                valor
+                for tarea in lote
+                for valor in (
+                    tarea.mesa_categoria_id, tarea.attachment_id, tarea.orden, tarea.numero_carga,
+                    tarea.distrito_id, tarea.seccion_id
+                )
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, parametros)
+                claves = set(cursor.fetchall())
+            insertadas.extend(
+                tarea for tarea in lote
+                if (tarea.mesa_categoria_id, tarea.attachment_id, tarea.numero_carga) in claves
+            )
+        return insertadas
+
     @classmethod
     def vaciar(cls):
         #cls.objects.all().delete()
@@ -109,10 +193,16 @@ class ColaCargasPendientes(models.Model):
         return f'({self.orden}) <{self.mesa_categoria}, {self.attachment}>'
 
 
+def confirmar_tarea_en_memoria(tarea):
+    try:
+        cola_en_memoria.confirmar(tarea)
+    except cola_en_memoria.ColaEnMemoriaNoDisponible as e:
+        # La reserva va a vencer y la tarea se va a volver a despachar.
+        logger.warning('No se pudo confirmar la tarea en la cola en memoria', error=str(e), tarea=tarea)
+
+
 def count_active_sessions():
-    ahora = timezone.now()
-    desde = ahora - timedelta(minutes=5)
-    return Fiscal.objects.filter(last_seen__gt=desde).count() + 1  # Si no hay ninguno que algo genere.
+    return registro_de_actividad.count_active() + 1  # Si no hay ninguno que algo genere.
 
 
 class PrioridadScheduling(models.Model):
@@ -259,6 +349,13 @@ class MapaPrioridades():
             return registro.prioridad
         return None
 
+    def cortes_de_cantidad(self):
+        """
+        Los hasta_cantidad de los registros: los órdenes de llegada a partir de los cuales
+        puede cambiar el valor para una misma proporción.
+        """
+        return {registro.hasta_cantidad for registro in self.registros if registro.hasta_cantidad}
+
 
 class MapaPrioridadesConDefault():
     """
@@ -289,6 +386,9 @@ class MapaPrioridadesConDefault():
         # en tal caso, usamos el valor del registro default **para el desde_proporcion** del registro principal que aplica
         return self.default.valor_para(registro_que_aplica_principal.desde_proporcion, orden_de_llegada)
 
+    def cortes_de_cantidad(self):
+        return self.principal.cortes_de_cantidad() | self.default.cortes_de_cantidad()
+
 
 class MapaPrioridadesProducto():
     """
@@ -307,6 +407,41 @@ class MapaPrioridadesProducto():
             return None
         return valores[0] * valores[1]
 
+    def cortes_de_cantidad(self):
+        return self.factor_1.cortes_de_cantidad() | self.factor_2.cortes_de_cantidad()
+
+
+class TablaDePrioridades():
+    """
+    Un mapa de prioridades compilado a arrays, para calcular el valor de muchas
+    MesaCategoria de una vez sin recorrer los registros de cada mapa.
+
+    El valor sólo depende del orden de llegada a través de los hasta_cantidad de los registros
+    (en general, "las primeras N mesas"). Por eso se arma una fila de 101 valores, uno por cada
+    proporción de 0 a 100, para cada tramo de orden de llegada: hasta el primer corte, hasta el
+    segundo, ... y más allá del último. SIN_VALOR indica que el mapa no define valor.
+    """
+    SIN_VALOR = -1
+
+    def __init__(self, mapa):
+        self.cortes = np.array(sorted(mapa.cortes_de_cantidad()), dtype=np.int64)
+        # Un orden de llegada representativo de cada tramo.
+        representantes = list(self.cortes) + [self.cortes[-1] + 1 if len(self.cortes) else 1]
+        self.valores = np.array([
+            [self.valor_o_sin_valor(mapa.valor_para(proporcion, orden)) for proporcion in range(101)]
+            for orden in representantes
+        ], dtype=np.int64)
+
+    def valor_o_sin_valor(self, valor):
+        return self.SIN_VALOR if valor is None else valor
+
+    def valores_para(self, proporciones, ordenes_de_llegada):
+        """
+        Equivalente a `mapa.valor_para` para arrays de proporciones y órdenes de llegada.
+        """
+        tramos = np.searchsorted(self.cortes, ordenes_de_llegada, side='left')
+        return self.valores[tramos, proporciones]
+
 
 def registro_prioridad_desde_estructura(estructura):
     """
@@ -355,6 +490,33 @@ def mapa_prioridades_para_categoria(categoria):
     return PrioridadScheduling.mapa_prioridades(PrioridadScheduling.objects.filter(categoria=categoria, seccion=None))
 
 
+def tablas_de_prioridades(pares):
+    """
+    Compila las TablaDePrioridades de los pares (id de sección, id de categoría) dados,
+    con una query para las prioridades de las secciones y otra para las de las categorías.
+    """
+    ids_secciones = {id_seccion for id_seccion, _ in pares}
+    ids_categorias = {id_categoria for _, id_categoria in pares}
+    por_seccion = defaultdict(list)
+    for prioridad in PrioridadScheduling.objects.filter(seccion_id__in=ids_secciones, categoria=None):
+        por_seccion[prioridad.seccion_id].append(prioridad)
+    por_categoria = defaultdict(list)
+    for prioridad in PrioridadScheduling.objects.filter(categoria_id__in=ids_categorias, seccion=None):
+        por_categoria[prioridad.categoria_id].append(prioridad)
+
+    default_seccion = mapa_prioridades_default_seccion()
+    default_categoria = mapa_prioridades_default_categoria()
+    return {
+        (id_seccion, id_categoria): TablaDePrioridades(MapaPrioridadesProducto(
+            MapaPrioridadesConDefault(PrioridadScheduling.mapa_prioridades(por_seccion[id_seccion]), default_seccion),
+            MapaPrioridadesConDefault(
+                PrioridadScheduling.mapa_prioridades(por_categoria[id_categoria]), default_categoria
+            )
+        ))
+        for id_seccion, id_categoria in pares
+    }
+
+
 def mapa_prioridades_para_mesa_categoria(mesa_categoria):
     """
     Crea y devuelve el MapaPrioridades que corresponde a una MesaCategoria, de acuerdo a su categoria y a su seccion
@@ -1,4 +1,3 @@
-from django.db import transaction
 from constance import config
 from django.conf import settings
 from adjuntos.models import Attachment
@@ -117,9 +116,6 @@ def scheduler(reconstruir_la_cola=False):
 
             num_idents += 1
 
-    with transaction.atomic():
-        if reconstruir_la_cola:
-            ColaCargasPendientes.vaciar()
-        ColaCargasPendientes.objects.bulk_create(nuevas, ignore_conflicts=True)
+    ColaCargasPendientes.encolar(nuevas, reconstruir_la_cola)
 
     return (k - orden_inicial, num_cargas, num_idents)
@@ -0,0 +1,122 @@
+import threading
+from unittest import mock
+
+from scheduling import cola_en_memoria
+from scheduling.cola_en_memoria import ColaEnMemoria, ServidorColaEnMemoria
+from scheduling.models import ColaCargasPendientes
+from elecciones.tests.factories import MesaCategoriaFactory
+
+
+def tarea(orden, mesa_categoria_id=None, attachment_id=None, numero_carga=0, distrito_id=None, seccion_id=None):
+    return dict(
+        orden=orden, mesa_categoria_id=mesa_categoria_id, attachment_id=attachment_id,
+        numero_carga=numero_carga, distrito_id=distrito_id, seccion_id=seccion_id,
+    )
+
+
+def test_cola_en_memoria_respeta_el_orden_y_descarta_repetidas():
+    cola = ColaEnMemoria()
+    assert cola.encolar([
+        tarea(3, mesa_categoria_id=1),
+        tarea(1, attachment_id=1),
+        tarea(2, mesa_categoria_id=2),
+        tarea(5, mesa_categoria_id=2),  # Repetida: misma mesa-categoría y número de carga.
+        tarea(4, mesa_categoria_id=2, numero_carga=1),
+    ]) == 4
+    assert cola.largo() == 4
+
+    claves = [cola.siguiente_tarea().clave for _ in range(4)]
+    assert claves == [(None, 1, 0), (2, None, 0), (1, None, 0), (2, None, 1)]
+    assert cola.siguiente_tarea() is None
+    # Las despachadas recién se borran de la tabla cuando se confirman.
+    assert cola.tomar_despachadas() == []
+    for clave in claves:
+        assert cola.confirmar(clave)
+    assert cola.tomar_despachadas() == claves
+    assert cola.tomar_despachadas() == []
+
+
+def test_cola_en_memoria_vuelve_a_encolar_reservas_vencidas():
+    cola = ColaEnMemoria()
+    cola.encolar([tarea(1, mesa_categoria_id=1), tarea(2, mesa_categoria_id=2)])
+    primera = cola.siguiente_tarea()
+    segunda = cola.siguiente_tarea()
+    assert cola.confirmar(segunda.clave)
+
+    # Mientras está reservada no se vuelve a encolar.
+    assert cola.encolar([tarea(1, mesa_categoria_id=1)]) == 0
+    assert cola.liberar_vencidas(vencimiento=60) == 0
+    assert cola.liberar_vencidas(vencimiento=-1) == 1
+    # Una reserva vencida ya no se puede confirmar.
+    assert not cola.confirmar(primera.clave)
+    assert cola.siguiente_tarea().clave == primera.clave
+
+
+def test_cola_en_memoria_afinidad_geografica():
+    cola = ColaEnMemoria()
+    cola.encolar([
+        tarea(1, mesa_categoria_id=1, distrito_id=1, seccion_id=10),
+        tarea(2, mesa_categoria_id=2, distrito_id=2, seccion_id=20),
+        tarea(50, mesa_categoria_id=3, distrito_id=2, seccion_id=20),
+    ])
+
+    # La tarea del distrito afín está suficientemente cerca.
+    assert cola.siguiente_tarea(fiscal_id=1, distrito_afin_id=2, bonus_afinidad=5).mesa_categoria_id == 2
+    # Ahora ya no.
+    assert cola.siguiente_tarea(fiscal_id=1, distrito_afin_id=2, bonus_afinidad=5).mesa_categoria_id == 1
+    # En modo UB siempre se privilegia la sección.
+    cola.encolar([tarea(4, mesa_categoria_id=4, distrito_id=1, seccion_id=10)])
+    assert cola.siguiente_tarea(fiscal_id=1, seccion_id=20, modo_ub=True).mesa_categoria_id == 3
+    assert cola.largo() == 1
+
+
+def test_cola_en_memoria_excluye_trabajos_del_fiscal():
+    cola = ColaEnMemoria()
+    cola.encolar([
+        tarea(1, mesa_categoria_id=1),
+        tarea(2, mesa_categoria_id=1, numero_carga=1),
+        tarea(3, attachment_id=7),
+    ])
+    cola.registrar_exclusiones(1, [('mc', 1)])
+
+    assert cola.siguiente_tarea(fiscal_id=1, excluir=True).attachment_id == 7
+    # Le fiscal 1 ya tuvo el attachment 7 y cargó la mesa-categoría 1.
+    assert cola.siguiente_tarea(fiscal_id=1, excluir=True) is None
+    # Otre fiscal sí puede tomar la mesa-categoría, que sigue en orden.
+    assert cola.siguiente_tarea(fiscal_id=2).clave == (1, None, 0)
+    assert cola.siguiente_tarea(fiscal_id=1).clave == (1, None, 1)
+
+
+def test_servidor_cola_en_memoria(tmp_path, settings):
+    settings.COLA_TAREAS_SOCKET = str(tmp_path / 'cola.sock')
+    servidor = ServidorColaEnMemoria(settings.COLA_TAREAS_SOCKET)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    try:
+        assert cola_en_memoria.consultar({'op': 'encolar', 'tareas': [
+            tarea(2, mesa_categoria_id=1), tarea(1, attachment_id=3)
+        ]}) == {'agregadas': 2}
+        assert cola_en_memoria.consultar({'op': 'largo'}) == {'largo': 2, 'ultimo_orden': 2}
+        primera = cola_en_memoria.siguiente_tarea()
+        assert primera['attachment_id'] == 3
+        assert cola_en_memoria.siguiente_tarea()['mesa_categoria_id'] == 1
+        assert cola_en_memoria.siguiente_tarea() is None
+        assert cola_en_memoria.confirmar(primera)
+        assert servidor.cola.tomar_despachadas() == [(None, 3, 0)]
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def test_encolar_envia_a_memoria_solo_las_insertadas(db, settings):
+    settings.COLA_TAREAS_SOCKET = 'cola.sock'
+    mc1, mc2 = MesaCategoriaFactory(), MesaCategoriaFactory()
+    ColaCargasPendientes.objects.create(mesa_categoria=mc1, orden=1, numero_carga=0)
+
+    with mock.patch('scheduling.cola_en_memoria.encolar') as encolar:
+        ColaCargasPendientes.encolar([
+            ColaCargasPendientes(mesa_categoria=mc1, orden=2, numero_carga=0),
+            ColaCargasPendientes(mesa_categoria=mc2, orden=3, numero_carga=0),
+        ])
+    [(enviadas, _), _] = encolar.call_args
+    assert [(tarea.mesa_categoria_id, tarea.orden) for tarea in enviadas] == [(mc2.id, 3)]
+    assert ColaCargasPendientes.objects.count() == 2
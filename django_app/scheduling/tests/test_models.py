@@ -1,8 +1,9 @@
+import numpy as np
 import pytest
 
 from scheduling.models import (
     mapa_prioridades_desde_setting, mapa_prioridades_para_categoria, mapa_prioridades_para_seccion,
-    mapa_prioridades_para_mesa_categoria
+    mapa_prioridades_para_mesa_categoria, tablas_de_prioridades
 )
 from .factories import (
     PrioridadSchedulingFactory
@@ -15,7 +16,7 @@ from elecciones.tests.factories import (
     CircuitoFactory, LugarVotacionFactory, MesaFactory
 )
 from elecciones.models import (
-    Seccion, Categoria, Mesa
+    Seccion, Categoria, Mesa, MesaCategoria
 )
 
 # En este archivo se incluyen los tests de calculo de prioridades teniendo en cuenta
@@ -407,3 +408,50 @@ def test_prioridades_mesacat_seccion_con_definicion_parcial_2(db, settings, prop
     prioridades = mapa_prioridades_para_mesa_categoria(mesa_categoria)
 
     assert(prioridades.valor_para(proporcion, orden_de_llegada)) == prioridad
+
+
+def test_tablas_de_prioridades_equivalen_a_los_mapas(db, settings):
+    """
+    Las tablas compiladas dan lo mismo que los mapas para todas las proporciones y para órdenes
+    de llegada a ambos lados de cada hasta_cantidad.
+    """
+    definir_prioridades_seccion_categoria(settings)
+    secciones = [seccion_cuatro_prioridades(), seccion_dos_cantidades(), seccion_prioritaria(), seccion_standard()]
+    mesas_categorias = [
+        MesaCategoriaFactory(categoria=categoria, mesa=mesa_en_seccion(seccion))
+        for seccion in secciones
+        for categoria in [categoria_pv(), categoria_gv(), categoria_standard()]
+    ]
+    tablas = tablas_de_prioridades({
+        (mesa_categoria.mesa.lugar_votacion.circuito.seccion_id, mesa_categoria.categoria_id)
+        for mesa_categoria in mesas_categorias
+    })
+
+    proporciones = np.repeat(np.arange(101), 5)
+    ordenes_de_llegada = np.tile([1, 7, 8, 20, 21], 101)
+    for mesa_categoria in mesas_categorias:
+        mapa = mapa_prioridades_para_mesa_categoria(mesa_categoria)
+        tabla = tablas[(mesa_categoria.mesa.lugar_votacion.circuito.seccion_id, mesa_categoria.categoria_id)]
+        assert list(tabla.valores_para(proporciones, ordenes_de_llegada)) == [
+            mapa.valor_para(proporcion, orden) for proporcion, orden in zip(proporciones, ordenes_de_llegada)
+        ]
+
+
+def test_recalcular_coeficientes_en_lote(db, settings):
+    definir_prioridades_seccion_categoria(settings)
+    mesas_categorias = []
+    secciones = [seccion_cuatro_prioridades(), seccion_dos_cantidades(), seccion_prioritaria(), seccion_standard()]
+    for i, seccion in enumerate(secciones):
+        mesa_categoria = MesaCategoriaFactory(
+            categoria=categoria_gv(), mesa=mesa_en_seccion(seccion), percentil=i * 3 + 1, orden_de_llegada=i * 5 + 1
+        )
+        mesa_categoria.recalcular_coeficiente_para_orden_de_carga()
+        mesas_categorias.append(mesa_categoria)
+
+    MesaCategoria.recalcular_coeficiente_para_orden_de_carga_mesas(
+        MesaCategoria.objects.filter(id__in=[mesa_categoria.id for mesa_categoria in mesas_categorias])
+    )
+    for mesa_categoria in mesas_categorias:
+        coeficiente = mesa_categoria.coeficiente_para_orden_de_carga
+        mesa_categoria.refresh_from_db()
+        assert mesa_categoria.coeficiente_para_orden_de_carga == coeficiente